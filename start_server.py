@@ -38,9 +38,13 @@ def main():
     print("\n💡 提示：")
     print("  - 服務器將在 http://127.0.0.1:8000 運行")
     print("  - 按 Ctrl+C 停止服務器")
+    print("  - 修改 web_tutor/content/lessons 中的課程會自動重新載入")
     print("  - 在瀏覽器中打開 http://127.0.0.1:8000 訪問系統")
     print("\n" + "=" * 60 + "\n")
     
+    # 開發模式下同時開啟課程熱重載，編輯 content/lessons 不需要重啟服務器
+    os.environ.setdefault("LESSONS_RELOAD_INTERVAL", "1")
+    
     # 啟動服務器
     try:
         uvicorn.run(
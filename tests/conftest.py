@@ -0,0 +1,8 @@
+"""Shared pytest setup: import web_tutor as a package, the way the deployed app does (uvicorn web_tutor.main:app)."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
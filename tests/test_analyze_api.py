@@ -0,0 +1,97 @@
+"""/api/analyze: requests from one editor are coalesced, so only the newest queued version is analyzed."""
+
+import asyncio
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from web_tutor import main
+from web_tutor.realtime_guide import RealtimeGuide
+
+LESSON = "EX1-0"
+
+
+@pytest.fixture(autouse=True)
+def clients(monkeypatch):
+    monkeypatch.setattr(main, "analyze_clients", OrderedDict())
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Codes actually analyzed; the first analysis is held until the test releases it."""
+    codes = []
+    release = threading.Event()
+    original = RealtimeGuide.analyze_partial_code
+
+    def slow(self, code, *args, **kwargs):
+        codes.append(code)
+        if len(codes) == 1:
+            release.wait(5)
+        return original(self, code, *args, **kwargs)
+
+    monkeypatch.setattr(RealtimeGuide, "analyze_partial_code", slow)
+    return codes, release
+
+
+def request(code, client_id="editor-1", lesson_id=LESSON):
+    return main.AnalyzeRequest(lesson_id=lesson_id, code=code, client_id=client_id)
+
+
+async def send_while_first_is_running(requests, release):
+    """Send requests[0], then the rest while it is still being analyzed."""
+    tasks = [asyncio.ensure_future(main.analyze(requests[0]))]
+    await asyncio.sleep(0.1)
+    for item in requests[1:]:
+        tasks.append(asyncio.ensure_future(main.analyze(item)))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.1)
+    release.set()
+    return await asyncio.gather(*tasks)
+
+
+def test_newer_request_supersedes_a_queued_one(analyzed):
+    codes, release = analyzed
+    versions = ["print(1)", "print(12)", "print(123)", "print(1234)"]
+    responses = asyncio.run(send_while_first_is_running([request(code) for code in versions], release))
+    assert [response["stale"] for response in responses] == [False, True, True, False]
+    # the versions typed while the first was analyzed are never analyzed
+    assert codes == ["print(1)", "print(1234)"]
+    # and the newest one gets the guidance of a fresh analysis
+    fresh = main.guide_for_lesson(LESSON).analyze_partial_code("print(1234)", 1, 1)
+    assert responses[-1] == {"stale": False, **fresh}
+
+
+def test_other_editors_are_not_superseded(analyzed):
+    codes, release = analyzed
+    requests = [request("print(1)"), request("print(2)", client_id="editor-2"), request("print(3)")]
+    responses = asyncio.run(send_while_first_is_running(requests, release))
+    assert [response["stale"] for response in responses] == [False, False, False]
+    assert sorted(codes) == ["print(1)", "print(2)", "print(3)"]
+
+
+def test_requests_without_client_id_are_never_coalesced(analyzed):
+    codes, release = analyzed
+    requests = [request(f"print({n})", client_id=None) for n in range(3)]
+    responses = asyncio.run(send_while_first_is_running(requests, release))
+    assert [response["stale"] for response in responses] == [False, False, False]
+    assert sorted(codes) == ["print(0)", "print(1)", "print(2)"]
+
+
+def test_switching_lessons_starts_a_new_session():
+    async def scenario():
+        await main.analyze(request("print(1)"))
+        first = main.analyze_clients["editor-1"].session
+        await main.analyze(request("print(1)"))
+        same = main.analyze_clients["editor-1"].session
+        await main.analyze(request("print(1)", lesson_id="EX1-1"))
+        return first, same, main.analyze_clients["editor-1"].session
+
+    first, same, switched = asyncio.run(scenario())
+    assert first is same and switched is not first
+
+
+def test_unknown_lesson_is_404():
+    with pytest.raises(main.HTTPException) as error:
+        asyncio.run(main.analyze(request("print(1)", lesson_id="NO-SUCH-LESSON")))
+    assert error.value.status_code == 404
@@ -0,0 +1,47 @@
+"""analyze_code_batch: results come back in input order and match analyze_code, however many processes run them."""
+
+import itertools
+
+import pytest
+
+from web_tutor.code_analyzer import CheckPlan, analyze_code, analyze_code_batch
+
+PROGRAMS = [
+    'print("Hello, Python!")\n',
+    "total = 0\nfor i in range(10):\n    total += i\nprint(total)\n",
+    "n = 5\nwhile n > 0:\n    n -= 1\n",
+    "def calculate(x):\n    if x > 0:\n        return x\n    return -x\n\nprint(calculate(-2))\n",
+    "result = [i * i for i in range(3)]\nprint(result)\n",
+    "for i in range(3)\n    print(i)\n",
+]
+
+REQUIREMENTS = [
+    None,
+    {"requires_loop": True, "loop_type": "for"},
+    CheckPlan({"requires_function": True, "function_name": "calculate"}),
+    {"requires_if": True, "max_loops": 0},
+    CheckPlan({"requires_variable": ["result"]}),
+]
+
+# every program with every kind of requirement, in an order no two chunks share
+ITEMS = list(itertools.product(PROGRAMS, REQUIREMENTS))
+
+
+@pytest.fixture(scope="module")
+def expected():
+    return [analyze_code(code, requirements) for code, requirements in ITEMS]
+
+
+def test_serial_batch_matches_analyze_code(expected):
+    assert list(analyze_code_batch(ITEMS, workers=1, chunk_size=4)) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 200])
+def test_worker_processes_keep_input_order(expected, chunk_size):
+    results = list(analyze_code_batch(iter(ITEMS), workers=2, chunk_size=chunk_size))
+    assert results == expected
+    assert results == list(analyze_code_batch(ITEMS, workers=1, chunk_size=chunk_size))
+
+
+def test_empty_batch():
+    assert list(analyze_code_batch([], workers=2)) == []
@@ -0,0 +1,127 @@
+"""CheckPlan: compiled structure checks must give the verdicts and messages of the old check_code_structure."""
+
+import itertools
+import json
+
+import pytest
+
+import baseline_code_analyzer as baseline
+from web_tutor.analysis_budget import AnalysisBudget
+from web_tutor.code_analyzer import CheckPlan, CodeAnalyzer
+from web_tutor.lessons import CONTENT_DIR
+
+PROGRAMS = [
+    'print("Hello, Python!")\n',
+    "total = 0\nfor i in range(10):\n    total += i\nprint(total)\n",
+    "n = 5\nwhile n > 0:\n    n -= 1\n",
+    "def calculate(x):\n    if x > 0:\n        return x\n    return -x\n\nprint(calculate(-2))\n",
+    "def reverse_string(s):\n    return s[::-1]\n\nprint(reverse_string('abc'))\n",
+    "import os\nfrom math import pi\nfor a in range(2):\n    for b in range(2):\n        print(a, b, pi)\n",
+    "result = [i * i for i in range(3)]\nprint(result)\n",
+    "for i in range(3)\n    print(i)\n",
+]
+
+# Every rule except forbids_hardcode, whose detector was replaced on purpose (see test_repeated_code.py)
+REQUIREMENTS = [
+    {},
+    {"requires_loop": True},
+    {"requires_loop": True, "loop_type": "for"},
+    {"requires_loop": True, "loop_type": "while"},
+    {"requires_loop": False},
+    {"requires_function": True},
+    {"requires_function": True, "function_name": "calculate"},
+    {"requires_function": True, "function_name": "missing"},
+    {"requires_if": True},
+    {"requires_variable": ["i", "total"]},
+    {"requires_variable": ["result", "missing", "other"]},
+    {"max_loops": 1},
+    {"max_loops": 0},
+    {"min_loops": 1},
+    {"min_loops": 3},
+    {"forbids_import": "os"},
+    {"forbids_import": ["os", "math", "sys"]},
+]
+
+
+def combined_requirements():
+    """Single rules plus pairs and triples, so that message ordering across rules is covered."""
+    rules = [requirements for requirements in REQUIREMENTS if requirements]
+    yield from REQUIREMENTS
+    for size in (2, 3):
+        for combination in itertools.combinations(rules, size):
+            merged = {}
+            for requirements in combination:
+                merged.update(requirements)
+            yield merged
+
+
+def lesson_requirements():
+    """code_requirements of the shipped lessons, minus forbids_hardcode."""
+    found = {}
+    for path in sorted(CONTENT_DIR.glob("*.json")):
+        validator = json.loads(path.read_text(encoding="utf-8")).get("validator") or {}
+        requirements = validator.get("code_requirements")
+        if requirements:
+            requirements = {key: value for key, value in requirements.items() if key != "forbids_hardcode"}
+            found[json.dumps(requirements, sort_keys=True)] = requirements
+    return list(found.values())
+
+
+@pytest.mark.parametrize("code", PROGRAMS)
+def test_plan_matches_baseline_check_code_structure(code):
+    old = baseline.CodeAnalyzer(code)
+    new = CodeAnalyzer(code)
+    for requirements in itertools.chain(combined_requirements(), lesson_requirements()):
+        expected = old.check_code_structure(requirements)
+        assert CheckPlan(requirements).run(new) == expected, requirements
+        # the dict form compiles a plan on the fly and must agree as well
+        assert new.check_code_structure(requirements) == expected, requirements
+
+
+@pytest.mark.parametrize("code", PROGRAMS)
+def test_short_circuit_keeps_verdict(code):
+    analyzer = CodeAnalyzer(code)
+    for requirements in combined_requirements():
+        plan = CheckPlan(requirements)
+        passed, feedback = plan.run(analyzer)
+        short_passed, short_feedback = plan.run(analyzer, short_circuit=True)
+        assert short_passed == passed
+        assert set(short_feedback) <= set(feedback)
+        assert bool(short_feedback) == bool(feedback)
+
+
+def test_short_circuit_stops_at_cheapest_failure():
+    plan = CheckPlan({"forbids_import": ["os"], "requires_if": True})
+    passed, feedback = plan.run(CodeAnalyzer("import os\nprint(1)\n"), short_circuit=True)
+    assert not passed
+    assert feedback == [
+        "❌ 此題目要求使用 if 語句進行條件判斷，但您的代碼中沒有使用。",
+        "💡 提示：使用 if 語句可以根據條件執行不同的代碼。",
+    ]
+
+
+def test_plan_is_reusable_across_submissions():
+    plan = CheckPlan({"requires_loop": True, "loop_type": "for"})
+    assert plan.run(CodeAnalyzer(PROGRAMS[1])) == (True, [])
+    assert plan.run(CodeAnalyzer(PROGRAMS[2]))[0] is False
+    assert plan.run(CodeAnalyzer(PROGRAMS[1])) == (True, [])
+
+
+def test_requirements_are_copied_at_compile_time():
+    variables = ["total"]
+    plan = CheckPlan({"requires_variable": variables})
+    variables.append("missing")
+    assert plan.run(CodeAnalyzer(PROGRAMS[1])) == (True, [])
+
+
+def test_empty_plan_is_falsy():
+    assert not CheckPlan({})
+    assert not CheckPlan({"requires_loop": False})
+    assert CheckPlan({"min_loops": 0})
+
+
+def test_budget_exceeded_fails_without_running_checks():
+    analyzer = CodeAnalyzer(PROGRAMS[1], budget=AnalysisBudget(max_nodes=5))
+    passed, feedback = CheckPlan({"requires_loop": True}).run(analyzer)
+    assert not passed
+    assert len(feedback) == 1 and feedback[0].startswith("⚠️")
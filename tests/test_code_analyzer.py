@@ -0,0 +1,109 @@
+"""code_analyzer: the single-pass facts must answer every query the way the old one-walk-per-query analyzer did."""
+
+import ast
+
+import pytest
+
+import baseline_code_analyzer as baseline
+from web_tutor import code_analyzer
+from web_tutor.code_analyzer import CodeAnalyzer, extract_facts
+
+PROGRAMS = {
+    "hello": 'print("Hello, Python!")\n',
+    "empty": "",
+    "for_loop": "total = 0\nfor i in range(10):\n    total += i\nprint(total)\n",
+    "while_loop": "n = 5\nwhile n > 0:\n    print(n)\n    n -= 1\n",
+    "nested": (
+        "def grid(rows, cols):\n"
+        "    for r in range(rows):\n"
+        "        for c in range(cols):\n"
+        "            if (r + c) % 2:\n"
+        "                print('#', end='')\n"
+        "            else:\n"
+        "                print('.', end='')\n"
+        "        print()\n"
+        "grid(3, 4)\n"
+    ),
+    "functions": (
+        "def add(a, b):\n    return a + b\n\n"
+        "def outer():\n    def inner():\n        return 1\n    return inner()\n\n"
+        "async def fetch():\n    return 2\n\n"
+        "class Point:\n    def norm(self):\n        return 0\n\n"
+        "print(add(1, 2), outer())\n"
+    ),
+    "comprehensions": "squares = [x * x for x in range(5) if x % 2]\nevens = {x for x in range(4)}\nprint(squares, evens)\n",
+    "imports": "import os.path\nimport math as m\nfrom collections import Counter\nfrom . import sibling\nprint(m.pi)\n",
+    "old_hardcode_prints": 'print("1")\nprint("2")\nprint("3")\nprint("4")\n',
+    "old_hardcode_numbers": "a = 1\nb = 1\nc = 1\nd = 2\ne = 2\nf = 2\nprint(a + b + c + d + e + f)\n",
+    "prints_with_loop": "for i in range(3):\n    print(i)\nprint('a')\nprint('b')\nprint('c')\n",
+    "while_else": "i = 0\nwhile i < 3:\n    i += 1\nelse:\n    print('done')\n",
+    "lambda_and_if_expr": "f = lambda x: x if x > 0 else -x\nprint(f(-3))\n",
+    "syntax_error": "for i in range(3)\n    print(i)\n",
+    "generated": code_analyzer.sample_submission(blocks=5),
+}
+
+QUERY_NAMES = ["total", "i", "n", "x", "print", "missing", "m"]
+FUNCTION_NAMES = ["add", "inner", "fetch", "norm", "grid", "step_0", "missing"]
+MODULES = [None, "os", "os.path", "math", "collections", "sys"]
+
+
+@pytest.fixture(params=sorted(PROGRAMS), ids=sorted(PROGRAMS))
+def program(request):
+    code = PROGRAMS[request.param]
+    return baseline.CodeAnalyzer(code), CodeAnalyzer(code)
+
+
+def test_queries_match_baseline(program):
+    old, new = program
+    assert new.errors == old.errors
+    for loop_type in (None, "for", "while"):
+        assert new.has_loop(loop_type) == old.has_loop(loop_type)
+    assert new.has_function_definition() == old.has_function_definition()
+    for name in FUNCTION_NAMES:
+        assert new.has_function_definition(name) == old.has_function_definition(name)
+    assert new.has_if_statement() == old.has_if_statement()
+    assert new.has_list_comprehension() == old.has_list_comprehension()
+    for name in QUERY_NAMES:
+        assert new.has_variable(name) == old.has_variable(name)
+    assert new.count_loops() == old.count_loops()
+    assert new.count_functions() == old.count_functions()
+    assert new.get_function_names() == old.get_function_names()
+    for module in MODULES:
+        assert new.has_import(module) == old.has_import(module)
+
+
+def test_summary_matches_baseline_except_hardcode(program):
+    old, new = program
+    expected = old.get_code_summary()
+    summary = new.get_code_summary()
+    for key, value in expected.items():
+        if key != "has_hardcode":
+            assert summary[key] == value, key
+
+
+def test_function_names_keep_walk_order():
+    code = "def a():\n    def c():\n        pass\n\ndef b():\n    pass\n"
+    assert CodeAnalyzer(code).get_function_names() == baseline.CodeAnalyzer(code).get_function_names() == ["a", "b", "c"]
+
+
+def test_benchmark_reference_is_the_baseline_summary(program):
+    old, _ = program
+    if old.tree is None:
+        pytest.skip("no tree")
+    expected = {key: value for key, value in old.get_code_summary().items() if key not in ("valid", "errors", "warnings")}
+    assert code_analyzer._baseline_code_summary(old.tree) == expected
+
+
+def test_extract_facts_counts():
+    facts = extract_facts(ast.parse(PROGRAMS["nested"]))
+    assert (facts.for_count, facts.while_count, facts.loop_count) == (2, 0, 2)
+    assert facts.function_names == ["grid"]
+    assert facts.print_count == 3
+    assert facts.has_if and not facts.has_list_comprehension and not facts.has_import
+    assert facts.exceeded is None
+
+
+def test_benchmark_checks_agreement_and_reports_timings():
+    result = code_analyzer.benchmark(PROGRAMS["generated"], repeat=2)
+    assert result["nodes"] == sum(1 for _ in ast.walk(ast.parse(PROGRAMS["generated"])))
+    assert result["single_pass_ms"] > 0 and result["repeated_walks_ms"] > 0
@@ -0,0 +1,169 @@
+"""fingerprint: indexed queries and class reports must find exactly the pairs a brute-force Jaccard scan finds."""
+
+import itertools
+import json
+import random
+
+import pytest
+
+from web_tutor import fingerprint
+from web_tutor.fingerprint import DEFAULT_WINDOW, FingerprintIndex, fingerprint_code, winnow
+from web_tutor.parse_cache import PARSE_CACHE
+
+ORIGINAL = (
+    "def average(scores):\n"
+    "    total = 0\n"
+    "    for score in scores:\n"
+    "        total += score\n"
+    "    return total / len(scores)\n"
+    "\n"
+    "print(average([90, 80, 70]))\n"
+)
+RENAMED = (
+    "def mean(values):\n"
+    "    s = 0\n"
+    "    for v in values:\n"
+    "        s += v\n"
+    "    return s / len(values)\n"
+    "\n"
+    "print(mean([1, 2, 3, 4]))\n"
+)
+DIFFERENT = (
+    "name = input()\n"
+    "if name:\n"
+    "    print(f'Hello, {name}!')\n"
+    "else:\n"
+    "    print('Hello, world!')\n"
+)
+DEEP = "x = " + "1+" * 200000 + "1\n"
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+def corpus(size=60, seed=7):
+    """Variations of a few templates: renamed, re-valued, with extra or missing statements."""
+    rng = random.Random(seed)
+    templates = [ORIGINAL, RENAMED, DIFFERENT,
+                 "for i in range(10):\n    if i % 2:\n        print(i)\n    else:\n        print(-i)\n",
+                 "words = input().split()\nprint(len(words), sorted(words))\n"]
+    documents = {}
+    for doc_id in range(size):
+        lines = rng.choice(templates).split("\n")
+        if rng.random() < 0.5:
+            lines.insert(rng.randrange(len(lines)), f"extra_{doc_id} = {doc_id}")
+        if rng.random() < 0.3 and len(lines) > 3:
+            del lines[-2]
+        code = "\n".join(lines)
+        try:
+            compile(code, "<corpus>", "exec")
+        except SyntaxError:
+            continue
+        documents[doc_id] = code
+    return documents
+
+
+def test_renaming_and_constants_do_not_change_fingerprints():
+    assert fingerprint_code(ORIGINAL) == fingerprint_code(RENAMED)
+    assert jaccard(fingerprint_code(ORIGINAL), fingerprint_code(DIFFERENT)) < 0.2
+
+
+def test_builtin_names_are_kept():
+    assert fingerprint_code("print(len(x))\n" * 3) != fingerprint_code("show(size(x))\n" * 3)
+
+
+def test_winnowing_guarantee():
+    # a shared run of `window` k-gram hashes (k + window - 1 tokens) always yields a shared fingerprint
+    rng = random.Random(3)
+    for _ in range(200):
+        shared = [rng.randrange(1 << 30) for _ in range(DEFAULT_WINDOW)]
+        a = [rng.randrange(1 << 30) for _ in range(rng.randrange(20))] + shared
+        b = shared + [rng.randrange(1 << 30) for _ in range(rng.randrange(20))]
+        assert winnow(a) & winnow(b)
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 0.8, 1.0])
+def test_query_matches_brute_force(threshold):
+    documents = corpus()
+    index = FingerprintIndex()
+    for doc_id, code in documents.items():
+        index.add(doc_id, code)
+    for doc_id, code in documents.items():
+        query = fingerprint_code(code)
+        expected = {other: jaccard(query, fingerprint_code(other_code))
+                    for other, other_code in documents.items() if other != doc_id}
+        expected = {other: value for other, value in expected.items() if value >= threshold}
+        found = dict(index.query(code, threshold=threshold, limit=None, exclude=doc_id))
+        assert found.keys() == expected.keys()
+        for other, value in found.items():
+            assert value == pytest.approx(expected[other])
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8])
+def test_report_matches_brute_force(threshold):
+    documents = corpus()
+    index = FingerprintIndex()
+    for doc_id, code in documents.items():
+        index.add(doc_id, code)
+    expected = set()
+    for a, b in itertools.combinations(documents, 2):
+        if jaccard(fingerprint_code(documents[a]), fingerprint_code(documents[b])) >= threshold:
+            expected.add((a, b))
+    assert {(a, b) for a, b, _ in index.report(threshold)} == expected
+
+
+def test_clusters_group_connected_pairs():
+    index = FingerprintIndex()
+    index.add("a", ORIGINAL)
+    index.add("b", RENAMED)
+    index.add("c", DIFFERENT)
+    assert index.clusters(0.9) == [["a", "b"]]
+
+
+def test_add_replaces_and_remove_clears_postings():
+    index = FingerprintIndex()
+    index.add("a", ORIGINAL)
+    index.add("a", DIFFERENT)
+    assert len(index) == 1
+    assert index.query(DIFFERENT, threshold=1.0) == [("a", 1.0)]
+    index.remove("a")
+    assert len(index) == 0 and not index.postings
+
+
+def test_add_accepts_precomputed_fingerprints():
+    index = FingerprintIndex()
+    fingerprints = fingerprint_code(ORIGINAL)
+    assert index.add("a", fingerprints=fingerprints) is fingerprints
+    assert index.query(RENAMED, threshold=1.0) == [("a", 1.0)]
+
+
+def test_unparsable_code_has_no_fingerprints():
+    assert fingerprint_code("for i in range(3)\n    print(i)\n") == frozenset()
+    assert fingerprint_code(DEEP) == frozenset()
+    index = FingerprintIndex()
+    index.add("deep", DEEP)
+    assert index.query(DEEP) == [] and index.report(0.0) == []
+
+
+def test_fingerprinting_leaves_the_shared_parse_cache_alone():
+    before = PARSE_CACHE.stats()
+    fingerprint_code(ORIGINAL + "# private cache\n")
+    after = PARSE_CACHE.stats()
+    assert (after["hits"], after["misses"], after["size"]) == (before["hits"], before["misses"], before["size"])
+
+
+def test_cli_skips_unparsable_submissions(tmp_path, capsys):
+    path = tmp_path / "submissions.jsonl"
+    records = [
+        {"id": "alice", "code": ORIGINAL, "lesson_id": "EX1"},
+        {"id": "bob", "code": RENAMED, "lesson_id": "EX1"},
+        {"id": "carol", "code": DEEP, "lesson_id": "EX1"},
+        {"id": "dave", "code": "print(", "lesson_id": "EX1"},
+    ]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    assert fingerprint.main(["report", str(path), "--threshold", "0.9"]) == 0
+    out, err = capsys.readouterr()
+    assert "2 份作業，1 組相似" in out
+    assert "1.00  alice  bob" in out
+    assert "carol" in err and "dave" in err
@@ -0,0 +1,94 @@
+"""/api/grade_batch: each NDJSON line is the /api/grade verdict of the item at its index, however the items interleave."""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from web_tutor import main, sandbox
+from web_tutor.grade_cache import GradeCache
+
+pytestmark = pytest.mark.skipif(not sandbox.SANDBOX_AVAILABLE, reason="sandbox needs a POSIX platform")
+
+CORRECT = 'print("Hello, Python!")'
+WRONG = 'print("Hello, World!")'
+SLEEP = 'import time\ntime.sleep(0.5)\nprint("Hello, Python!")'
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = sandbox.ExecutionPool(2).start()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(autouse=True)
+def serve(monkeypatch, pool):
+    # main sizes these from the CPU count; give them the pool's size on any machine
+    executor = ThreadPoolExecutor(max_workers=pool.size)
+    monkeypatch.setattr(main, "execution_pool", pool)
+    monkeypatch.setattr(main, "executor", executor)
+    monkeypatch.setattr(main, "SANDBOX_WORKERS", pool.size)
+    monkeypatch.setattr(main, "GRADE_CACHE", GradeCache(0))
+    yield
+    executor.shutdown(wait=True)
+
+
+def grade_batch(client, items, **options):
+    response = client.post("/api/grade_batch", json={"items": items, **options})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_every_line_matches_the_item_at_its_index(client):
+    items = [{"lesson_id": "EX1-0", "code": code, "id": f"student-{i}"}
+             for i, code in enumerate([SLEEP, CORRECT, WRONG, CORRECT, WRONG])]
+    lines = grade_batch(client, items)
+    assert sorted(line["index"] for line in lines) == list(range(len(items)))
+    # the slow first item finishes after the others, so lines arrive out of order
+    assert lines[-1]["index"] == 0
+    for line in lines:
+        item = items[line["index"]]
+        assert (line["id"], line["lesson_id"]) == (item["id"], item["lesson_id"])
+        expected = client.post("/api/grade", json={"lesson_id": "EX1-0", "code": item["code"]}).json()
+        assert (line["is_correct"], line["message"], line["stdout"]) == (
+            expected["is_correct"], expected["message"], expected["stdout"])
+
+
+def test_unknown_lesson_is_reported_on_its_line(client):
+    lines = grade_batch(client, [
+        {"lesson_id": "EX1-0", "code": CORRECT},
+        {"lesson_id": "NO-SUCH-LESSON", "code": CORRECT, "id": "x"},
+    ])
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0]["is_correct"] is True
+    assert by_index[1]["status"] == "unknown_lesson" and by_index[1]["id"] == "x"
+    assert by_index[1]["is_correct"] is False and "NO-SUCH-LESSON" in by_index[1]["message"]
+
+
+def test_items_are_graded_concurrently_up_to_the_limit(client):
+    items = [{"lesson_id": "EX1-0", "code": SLEEP} for _ in range(4)]
+    start = time.monotonic()
+    lines = grade_batch(client, items)
+    parallel = time.monotonic() - start
+    start = time.monotonic()
+    grade_batch(client, items, concurrency=1)
+    serial = time.monotonic() - start
+    assert all(line["is_correct"] for line in lines)
+    # four half-second programs: two at a time takes about 1 s, one at a time about 2 s
+    assert serial >= 2.0
+    assert parallel < serial - 0.5
+
+
+def test_batch_limits_are_validated(client):
+    assert client.post("/api/grade_batch", json={"items": []}).status_code == 422
+    item = {"lesson_id": "EX1-0", "code": CORRECT}
+    assert client.post("/api/grade_batch", json={"items": [item], "concurrency": 0}).status_code == 422
@@ -0,0 +1,166 @@
+"""grade_cache: a cached result must be what a fresh run would print, so only deterministic programs are cached."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from web_tutor.grade_cache import GradeCache, canonical_code
+
+VERSION = "lesson-version"
+
+# Same program, written differently: one cache entry
+VARIANTS = [
+    "total = 0\nfor i in range(5):\n    total += i\nprint(total)\n",
+    "total=0\nfor i in range(5):\n  total+=i\nprint( total )",
+    "# sum the numbers\ntotal = 0\nfor i in range(5):  # loop\n    total += i\n\n\nprint((total))\n",
+    "total = 0\nfor i in range(5): total += i\nprint(total)\n",
+]
+
+# Deterministic programs: any run prints the same output
+CACHEABLE = [
+    'print("Hello, Python!")',
+    "import math\nprint(round(math.pi, 5))",
+    "d = {'b': 1, 'a': 2}\nprint(d, list(d.keys()), sorted(d.items()))",
+    "for key in {'x': 1, 'y': 2}.keys():\n    print(key)",
+    "from collections import Counter\nprint(Counter('banana').most_common())",
+    "class Point:\n    def __init__(self, x):\n        self.x = x\n    def __repr__(self):\n        return f'Point({self.x})'\nprint(Point(1))",
+    "print(10 - 3, 6 & 3, 6 | 1, 6 ^ 2)\nx = 5\nx -= 2\nprint(x)",
+]
+
+# Programs whose output can change from one run to the next
+UNCACHEABLE = {
+    "input": "name = input()\nprint(name)",
+    "random": "import random\nprint(random.random())",
+    "time": "import time\nprint(time.time())",
+    "set_literal": "print({'apple', 'banana', 'cherry'})",
+    "set_comprehension": "print({word for word in 'a b c d'.split()})",
+    "set_builtin": "print(set('hello world'))",
+    "key_intersection": "a = {'x': 1, 'y': 2, 'z': 3}\nb = {'y': 0, 'z': 0, 'w': 0}\nprint(a.keys() & b.keys())",
+    "key_union_via_name": "a = {'p': 1, 'q': 2}\nkeys = a.keys()\nprint(keys | {'r': 3}.keys())",
+    "item_difference": "a = {'p': 1, 'q': 2, 'r': 3}\nprint(a.items() - {'p': 1}.items())",
+    "augmented_view": "a = {'p': 1, 'q': 2}\nk = a.keys()\nk ^= {'r': 0}.keys()\nprint(k)",
+    "object": "print(object())",
+    "id": "x = []\nprint(id(x))",
+    "hash": "print(hash('abc'))",
+    "dunder": "print((1).__class__.__subclasses__)",
+    "dunder_name": "print(__builtins__['__import__']('random').random())",
+    "syntax_error": "print(",
+}
+
+# Reprs with memory addresses: the code looks deterministic, the output is not
+ADDRESS_OUTPUTS = [
+    "def f():\n    pass\nprint(f)",
+    "class A:\n    pass\nprint(A())",
+    "print(map(str, [1]))",
+    "print(x for x in range(3))",
+]
+
+
+def run_with_hash_seed(code, seed):
+    """A fresh interpreter, as the baseline ran every submission; seeds change set and default-repr output."""
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, timeout=30).stdout
+
+
+def ok(stdout):
+    return {"status": "ok", "stdout": stdout, "stderr": "", "truncated": False}
+
+
+def test_formatting_and_comments_share_a_key():
+    cache = GradeCache()
+    keys = {cache.key(VERSION, code) for code in VARIANTS}
+    assert len(keys) == 1 and None not in keys
+
+
+def test_lesson_version_and_options_change_the_key():
+    cache = GradeCache()
+    code = CACHEABLE[0]
+    assert cache.key(VERSION, code) != cache.key("other-version", code)
+    assert cache.key(VERSION, code, ("1",), True) != cache.key(VERSION, code, ("2",), True)
+    assert cache.key(VERSION, code, ("1",), True) != cache.key(VERSION, code, ("1",), False)
+
+
+@pytest.mark.parametrize("code", CACHEABLE)
+def test_cacheable_programs_print_the_same_under_any_hash_seed(code):
+    assert canonical_code(code) is not None
+    outputs = {run_with_hash_seed(code, seed) for seed in (0, 1, 2)}
+    assert len(outputs) == 1
+
+
+@pytest.mark.parametrize("name", sorted(UNCACHEABLE))
+def test_nondeterministic_programs_are_not_cached(name):
+    cache = GradeCache()
+    assert cache.key(VERSION, UNCACHEABLE[name]) is None
+    assert cache.stats()["uncacheable"] == 1
+
+
+@pytest.mark.parametrize("name", ["key_intersection", "key_union_via_name", "item_difference", "set_literal"])
+def test_rejected_set_programs_really_vary(name):
+    outputs = {run_with_hash_seed(UNCACHEABLE[name], seed) for seed in range(8)}
+    assert len(outputs) > 1
+
+
+@pytest.mark.parametrize("code", ADDRESS_OUTPUTS)
+def test_outputs_with_memory_addresses_are_not_stored(code):
+    cache = GradeCache()
+    key = cache.key(VERSION, code)
+    assert key is not None
+    stdout = run_with_hash_seed(code, 0)
+    assert " at 0x" in stdout
+    assert cache.put(key, ok(stdout)) is False
+    assert cache.get(key) is None and cache.stats()["size"] == 0
+
+
+def test_only_environment_independent_statuses_are_stored():
+    cache = GradeCache()
+    key = cache.key(VERSION, CACHEABLE[0])
+    assert cache.put(key, {"status": "error", "stdout": "", "stderr": "Traceback, line 1"}) is False
+    assert cache.put(key, {"status": "timeout", "stdout": "", "stderr": "timed out"}) is False
+    assert cache.put(key, {"status": "ok", "stdout": "x", "stderr": "warning"}) is False
+    assert cache.put(key, {"status": "output_limit", "stdout": "x" * 10, "stderr": "too much"}) is True
+    assert cache.put(key, ok("Hello, Python!\n")) is True
+
+
+def test_get_returns_a_copy():
+    cache = GradeCache()
+    key = cache.key(VERSION, CACHEABLE[0])
+    cache.put(key, ok("Hello, Python!\n"))
+    first = cache.get(key)
+    first["stdout"] = "changed"
+    assert cache.get(key) == ok("Hello, Python!\n")
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = GradeCache(maxsize=2)
+    a, b, c = (cache.key(VERSION, f"print({n})") for n in range(3))
+    cache.put(a, ok("0\n"))
+    cache.put(b, ok("1\n"))
+    assert cache.get(a) is not None
+    cache.put(c, ok("2\n"))
+    assert cache.get(b) is None
+    assert cache.get(a) == ok("0\n") and cache.get(c) == ok("2\n")
+    assert cache.stats()["size"] == 2
+
+
+def test_stats():
+    cache = GradeCache(maxsize=4)
+    key = cache.key(VERSION, CACHEABLE[0])
+    cache.key(VERSION, UNCACHEABLE["input"])
+    cache.get(key)
+    cache.put(key, ok("Hello, Python!\n"))
+    cache.get(key)
+    cache.get(key)
+    assert cache.stats() == {
+        "hits": 2, "misses": 1, "uncacheable": 1,
+        "hit_rate": 2 / 3, "cacheable_rate": 3 / 4,
+        "size": 1, "maxsize": 4,
+    }
+    cache.clear()
+    assert cache.stats()["hits"] == 0 and cache.stats()["size"] == 0
+
+
+def test_zero_size_disables_the_cache():
+    cache = GradeCache(maxsize=0)
+    assert cache.key(VERSION, CACHEABLE[0]) is None
@@ -0,0 +1,301 @@
+"""grading: CompiledValidator must give the verdicts of the old Pyodide-side comparison and the messages of the old tutor."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import baseline_code_analyzer as baseline
+from web_tutor import main, sandbox
+from web_tutor.grade_cache import GradeCache
+from web_tutor.grading import NO_VALIDATOR, CompiledValidator, compile_validator
+from web_tutor.lessons import LIBRARY
+
+KINDS = ["stdout_equals", "stdout_contains", "stdout_ends_with", "stdout_starts_with", "no_error", "unknown"]
+
+
+def js_verdict(validator, stdout):
+    """The comparison gradeLocally() in static/script.js made before /api/grade existed: both sides trimmed."""
+    expected = (validator.get("expected_output") or "").strip()
+    actual = stdout.strip()
+    kind = validator.get("type") or "none"
+    if kind == "stdout_equals":
+        return actual == expected
+    if kind == "stdout_contains":
+        return expected in actual
+    if kind == "stdout_ends_with":
+        return actual.endswith(expected)
+    if kind == "stdout_starts_with":
+        return actual.startswith(expected)
+    return True
+
+
+def tutor_output_check(validator, actual):
+    """Output check of the old tutor.validate_answer (without its own, untrimmed comparisons)."""
+    kind = validator.get("type", "no_error")
+    expected = validator.get("expected_output")
+    if kind == "stdout_equals":
+        if expected.strip() == actual.strip():
+            return True, "做得好！輸出結果完全正確！"
+        return False, f"輸出結果不符。\n預期輸出：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---"
+    if kind == "stdout_contains":
+        if expected in actual:
+            return True, "輸出包含預期的內容！"
+        return False, f"輸出未包含預期內容。\n預期包含：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---"
+    if kind == "stdout_ends_with":
+        if actual.endswith(expected):
+            return True, "輸出結尾符合題目要求！"
+        tail = actual[-len(expected) - 20:] if len(actual) > len(expected) else actual
+        return False, f"輸出結尾不符。\n預期結尾：\n---\n{expected}\n---\n您的輸出結尾：\n---\n{tail}\n---"
+    if kind == "stdout_starts_with":
+        if actual.startswith(expected):
+            return True, "輸出開頭符合題目要求！"
+        return False, f"輸出開頭不符。\n預期開頭：\n---\n{expected}\n---\n您的輸出開頭：\n---\n{actual[:len(expected) + 20]}\n---"
+    return True, "程式執行成功，沒有錯誤。"
+
+
+def tutor_grade(validator, code, output_passed, output_message):
+    """How the old tutor combined the output check with the structure check."""
+    structure_passed, structure_feedback = True, []
+    requirements = validator.get("code_requirements", {})
+    if requirements:
+        structure_passed, structure_feedback = baseline.CodeAnalyzer(code).check_code_structure(requirements)
+    if output_passed and structure_passed:
+        return True, f"🎉 恭喜！{output_message}"
+    if output_passed:
+        return False, "\n".join(["⚠️ 輸出結果正確，但程式寫法不符合題目要求：\n", *structure_feedback,
+                                 "\n💡 請修改程式碼以符合題目的要求。"])
+    if structure_passed:
+        return False, output_message
+    return False, "\n".join(["❌ 程式需要改進：\n", "輸出問題：", output_message, "\n程式結構問題：", *structure_feedback])
+
+
+def outputs_for(expected):
+    """Correct, padded, extended, shortened and altered versions of an expected output."""
+    stripped = expected.strip()
+    yield expected
+    yield stripped
+    yield f"\n  {stripped}  \n\n"
+    yield stripped + "\nextra line"
+    yield "first line\n" + stripped
+    yield stripped[: len(stripped) // 2]
+    yield stripped[len(stripped) // 2:]
+    yield stripped.replace("1", "2", 1)
+    yield ""
+
+
+def lesson_validators():
+    return [lesson["validator"] for lesson in LIBRARY.snapshot.lessons
+            if isinstance(lesson.get("validator"), dict) and "expected_output" in lesson["validator"]]
+
+
+def test_lessons_have_validators():
+    assert len(lesson_validators()) > 20
+
+
+def test_verdicts_match_the_old_pyodide_comparison_for_every_lesson():
+    for validator in lesson_validators():
+        compiled = CompiledValidator(validator)
+        for stdout in outputs_for(validator["expected_output"]):
+            assert compiled.check_output(stdout)[0] == js_verdict(validator, stdout), (validator, stdout)
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_verdicts_match_the_old_pyodide_comparison_for_every_kind(kind):
+    expected = "Line 1\nLine 2\n"
+    validator = {"type": kind, "expected_output": expected}
+    compiled = CompiledValidator(validator)
+    for stdout in list(outputs_for(expected)) + ["Line 1", "Line 2", "x Line 1\nLine 2", "Line 1\nLine 2 x"]:
+        assert compiled.check_output(stdout)[0] == js_verdict(validator, stdout), stdout
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_messages_match_the_old_tutor_for_trimmed_output(kind):
+    # the tutor compared contains/ends_with/starts_with untrimmed; with trimmed text both agree
+    expected = "Line 1\nLine 2"
+    validator = {"type": kind, "expected_output": expected}
+    compiled = CompiledValidator(validator)
+    for actual in ["Line 1\nLine 2", "Line 1", "Line 1\nLine 2\nLine 3", "Line 0\nLine 1\nLine 2",
+                   "something much longer than the expected output", ""]:
+        assert compiled.check_output(actual) == tutor_output_check(validator, actual), actual
+
+
+def test_grades_match_the_old_tutor_with_structure_checks():
+    validator = {
+        "type": "stdout_equals",
+        "expected_output": "0\n1\n2",
+        "code_requirements": {"requires_loop": True, "loop_type": "for"},
+    }
+    compiled = CompiledValidator(validator)
+    submissions = [
+        ("for i in range(3):\n    print(i)\n", "0\n1\n2\n"),
+        ("for i in range(4):\n    print(i)\n", "0\n1\n2\n3\n"),
+        ("print(0)\nprint(1)\nprint(2)\n", "0\n1\n2\n"),
+        ("print(0)\nprint(1)\n", "0\n1\n"),
+    ]
+    for code, stdout in submissions:
+        # the new message shows the trimmed output, as the Pyodide side did
+        expected = tutor_grade(validator, code, *tutor_output_check(validator, stdout.strip()))
+        assert compiled.grade(code, {"stdout": stdout, "stderr": ""}) == expected, code
+
+
+def test_errors_fail_before_any_comparison():
+    compiled = CompiledValidator({"type": "no_error", "code_requirements": {"requires_loop": True}})
+    assert compiled.grade("print(1)", {"stdout": "", "stderr": "NameError"}) == (
+        False, "❌ 您的程式碼產生了錯誤：\nNameError")
+
+
+def test_lessons_without_validator_pass_when_the_run_succeeds():
+    assert compile_validator(None) is NO_VALIDATOR
+    assert compile_validator({"id": "x"}) is NO_VALIDATOR
+    assert NO_VALIDATOR.grade("print(1)", {"stdout": "1", "stderr": ""}) == (True, "✅ 程式執行成功，沒有錯誤。")
+
+
+def test_version_follows_validator_content():
+    validator = {"type": "stdout_equals", "expected_output": "1"}
+    assert CompiledValidator(validator).version == CompiledValidator(dict(validator)).version
+    assert CompiledValidator(validator).version != CompiledValidator({**validator, "expected_output": "2"}).version
+
+
+def test_snapshot_graders_are_compiled_from_each_lesson():
+    snapshot = LIBRARY.snapshot
+    for lesson in snapshot.lessons:
+        grader = snapshot.graders[lesson["id"]]
+        assert grader.version == compile_validator(lesson).version
+
+
+@pytest.fixture(scope="module")
+def client():
+    # No lifespan: the sandbox is not started, as on a server without execution
+    return TestClient(main.app)
+
+
+def test_grade_endpoint_grades_browser_output_without_executing(client):
+    assert main.execution_pool is None
+    lesson = next(lesson for lesson in LIBRARY.snapshot.lessons if lesson["validator"].get("type") == "stdout_equals")
+    grader = LIBRARY.snapshot.graders[lesson["id"]]
+    for stdout in outputs_for(lesson["validator"]["expected_output"]):
+        response = client.post("/api/grade", json={"lesson_id": lesson["id"], "code": "print()", "stdout": stdout})
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["is_correct"], data["message"]) == grader.grade("print()", {"stdout": stdout, "stderr": ""})
+
+
+def test_grade_endpoint_unknown_lesson_is_404(client):
+    response = client.post("/api/grade", json={"lesson_id": "NO-SUCH-LESSON", "code": "print()", "stdout": ""})
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    if not sandbox.SANDBOX_AVAILABLE:
+        pytest.skip("sandbox needs a POSIX platform")
+    pool = sandbox.ExecutionPool(1).start()
+    monkeypatch.setattr(main, "execution_pool", pool)
+    monkeypatch.setattr(main, "GRADE_CACHE", GradeCache(0))
+    yield pool
+    pool.close()
+
+
+def test_grade_endpoint_runs_the_lesson_test_inputs(client, pool):
+    lesson = LIBRARY.snapshot.index["EX2-1"]
+    assert lesson["validator"]["test_inputs"] == ["25"]
+    code = 'age = int(input())\nprint("您是成年人" if age >= 18 else "您是未成年人")\n'
+    data = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": code}).json()
+    assert (data["is_correct"], data["stdout"]) == (True, "您是成年人\n")
+    # explicit inputs replace the lesson's test_inputs
+    data = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": code, "inputs": ["10"]}).json()
+    assert data["is_correct"] is False and data["stdout"].startswith("您是未成年人")
+    assert data["cases"] is None
+
+
+def test_grade_endpoint_reports_every_test_case(client, pool):
+    assert LIBRARY.snapshot.graders["EX2-1"].case_inputs == [["25"], ["18"]]
+    code = 'age = int(input())\nif age >= 18:\n    print("您是成年人")\n'
+    data = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": code}).json()
+    assert data["is_correct"] is True
+    assert [(case["case"], case["passed"]) for case in data["cases"]] == [(1, True), (2, True)]
+    # off by one at the boundary: only the hidden case catches it
+    data = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": code.replace(">=", ">")}).json()
+    assert data["is_correct"] is False
+    assert [case["passed"] for case in data["cases"]] == [True, False]
+    assert data["cases"][1]["inputs"] is None and data["cases"][1]["stdout"] is None
+    assert data["message"].startswith("測試案例 2/2\n❌ 隱藏的測試案例未通過。")
+
+
+def test_stop_on_failure_skips_the_remaining_cases(client, monkeypatch):
+    if not sandbox.SANDBOX_AVAILABLE:
+        pytest.skip("sandbox needs a POSIX platform")
+    pool = sandbox.ExecutionPool(1).start()
+    monkeypatch.setattr(main, "execution_pool", pool)
+    monkeypatch.setattr(main, "GRADE_CACHE", GradeCache(0))
+    try:
+        body = {"lesson_id": "EX2-1", "code": "print(input())", "stop_on_failure": True}
+        data = client.post("/api/grade", json=body).json()
+    finally:
+        pool.close()
+    assert [case["status"] for case in data["cases"]] == ["output_diverged", "skipped"]
+    assert data["is_correct"] is False
+
+
+def test_cached_cases_are_not_run_again(client, pool, monkeypatch):
+    monkeypatch.setattr(main, "GRADE_CACHE", GradeCache())
+    # programs calling input() are never cached (see grade_cache)
+    code = 'print("您是成年人")\n'
+    first = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": code}).json()
+    assert [case["passed"] for case in first["cases"]] == [True, True]
+    monkeypatch.setattr(pool, "run_cases", None)
+    # same program, different formatting: every case comes from the cache
+    second = client.post("/api/grade", json={"lesson_id": "EX2-1", "code": "print( '您是成年人' )"}).json()
+    assert second["cases"] == first["cases"]
+    assert main.GRADE_CACHE.stats()["hits"] == 2
+
+
+CASES_VALIDATOR = {
+    "type": "stdout_equals",
+    "expected_output": "big\n",
+    "test_inputs": ["5"],
+    "test_cases": [
+        {"inputs": ["1"], "expected_output": "small\n"},
+        {"inputs": ["3"], "expected_output": "big\n", "hidden": True},
+    ],
+}
+
+
+def test_every_test_case_is_graded():
+    compiled = CompiledValidator(CASES_VALIDATOR)
+    assert compiled.case_inputs == [["5"], ["1"], ["3"]]
+    results = [{"status": "ok", "stdout": out, "stderr": ""} for out in ("big\n", "small\n", "big\n")]
+    is_correct, message, cases = compiled.grade_cases("print()", results)
+    assert is_correct is True and message == "🎉 恭喜！通過全部 3 個測試案例！"
+    assert [case["passed"] for case in cases] == [True, True, True]
+    # hidden cases never reveal their inputs or output
+    assert (cases[2]["inputs"], cases[2]["stdout"]) == (None, None)
+
+
+def test_first_failing_case_is_reported_and_hidden_cases_stay_hidden():
+    compiled = CompiledValidator(CASES_VALIDATOR)
+    results = [{"status": "ok", "stdout": out, "stderr": ""} for out in ("big\n", "big\n", "small\n")]
+    is_correct, message, cases = compiled.grade_cases("print()", results)
+    assert is_correct is False
+    assert message.startswith("測試案例 2/3（輸入：1）\n輸出結果不符。")
+    assert [case["passed"] for case in cases] == [True, False, False]
+    assert cases[2]["message"] == "❌ 隱藏的測試案例未通過。"
+    assert "small" not in cases[2]["message"]
+
+
+def test_a_single_case_grades_like_grade():
+    compiled = CompiledValidator({"type": "stdout_equals", "expected_output": "1"})
+    for stdout in ("1\n", "2\n"):
+        result = {"status": "ok", "stdout": stdout, "stderr": ""}
+        assert compiled.grade_cases("print()", [result])[:2] == compiled.grade("print()", result)
+
+
+def test_grading_runs_off_the_event_loop():
+    import asyncio
+    import threading
+
+    class RecordingGrader:
+        def grade(self, code, result):
+            return threading.current_thread() is threading.main_thread(), code
+
+    # the event loop runs in the main thread here; grade() must not
+    assert asyncio.run(main.grade_async(RecordingGrader(), "print()", {})) == (False, "print()")
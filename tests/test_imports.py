@@ -0,0 +1,38 @@
+"""Both ways of starting the app (package and from inside web_tutor/) must load each shared cache exactly once."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHECK = """
+import sys
+import {prefix}main as main
+modules = {{name: sys.modules[name] for name in sys.modules
+            if name.rsplit(".", 1)[-1] in ("parse_cache", "grade_cache", "rule_timing", "code_analyzer", "lessons")}}
+assert len(modules) == 5, sorted(modules)
+parse_cache = modules["{prefix}parse_cache"]
+assert main.PARSE_CACHE is parse_cache.PARSE_CACHE
+for name in ("code_analyzer", "realtime_guide", "grade_cache"):
+    __import__("{prefix}" + name)
+    assert sys.modules["{prefix}" + name].parse_code is parse_cache.parse_code, name
+__import__("{prefix}fingerprint")
+assert sys.modules["{prefix}fingerprint"].ParseCache is parse_cache.ParseCache
+assert main.GRADE_CACHE is modules["{prefix}grade_cache"].GRADE_CACHE
+assert main.LIBRARY is modules["{prefix}lessons"].LIBRARY
+"""
+
+
+def run_check(prefix, cwd):
+    result = subprocess.run([sys.executable, "-c", CHECK.format(prefix=prefix)], cwd=cwd,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_package_import_shares_singletons():
+    run_check("web_tutor.", ROOT)
+
+
+def test_direct_import_shares_singletons():
+    run_check("", ROOT / "web_tutor")
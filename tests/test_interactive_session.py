@@ -0,0 +1,90 @@
+"""/ws/run_code: input() is answered over the socket, idle programs are stopped, and sessions are capped."""
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from web_tutor import main, sandbox
+
+pytestmark = pytest.mark.skipif(not sandbox.SANDBOX_AVAILABLE, reason="sandbox needs a POSIX platform")
+
+AGE_PROGRAM = 'age = int(input())\nif age >= 18:\n    print("您是成年人")\n'
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = sandbox.ExecutionPool(1).start()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(autouse=True)
+def serve(monkeypatch, pool):
+    monkeypatch.setattr(main, "execution_pool", pool)
+
+
+def receive_until(websocket, kind):
+    """Messages up to and including the first one of type `kind`."""
+    messages = []
+    while not messages or messages[-1]["type"] != kind:
+        messages.append(websocket.receive_json())
+    return messages
+
+
+def test_input_is_sent_over_the_socket(client):
+    with client.websocket_connect("/ws/run_code") as websocket:
+        websocket.send_json({"type": "start", "code": AGE_PROGRAM, "lesson_id": "EX2-1"})
+        receive_until(websocket, "input_request")
+        websocket.send_json({"type": "input", "value": "25"})
+        messages = receive_until(websocket, "result")
+    assert "".join(m["data"] for m in messages if m["type"] == "stdout") == "您是成年人\n"
+    result = messages[-1]
+    assert result["status"] == "ok" and result["is_correct"] is True
+
+
+def test_eof_raises_eoferror_in_the_program(client):
+    with client.websocket_connect("/ws/run_code") as websocket:
+        websocket.send_json({"type": "start", "code": 'input("年齡：")', "lesson_id": "EX2-1"})
+        # the prompt is flushed before the program waits
+        before_input = receive_until(websocket, "input_request")
+        assert "".join(m["data"] for m in before_input if m["type"] == "stdout") == "年齡："
+        websocket.send_json({"type": "eof"})
+        messages = receive_until(websocket, "result")
+    assert "EOFError" in "".join(m["data"] for m in messages if m["type"] == "stderr")
+    assert messages[-1]["status"] == "error"
+
+
+def test_idle_program_is_stopped(client, monkeypatch):
+    monkeypatch.setattr(main, "INTERACTIVE_IDLE_SECONDS", 0.5)
+    with client.websocket_connect("/ws/run_code") as websocket:
+        websocket.send_json({"type": "start", "code": AGE_PROGRAM, "lesson_id": "EX2-1"})
+        receive_until(websocket, "input_request")
+        # no reply: the session ends on its own
+        result = receive_until(websocket, "result")[-1]
+    assert result["status"] == "idle_timeout" and result["is_correct"] is False
+    assert main.interactive_sessions == 0
+
+
+def test_sessions_over_the_limit_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, "interactive_sessions", main.MAX_INTERACTIVE_SESSIONS)
+    with client.websocket_connect("/ws/run_code") as websocket:
+        assert websocket.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1013
+    # the rejected connection does not take a slot
+    assert main.interactive_sessions == main.MAX_INTERACTIVE_SESSIONS
+
+
+def test_first_message_must_start_a_program(client):
+    with client.websocket_connect("/ws/run_code") as websocket:
+        websocket.send_json({"type": "start", "lesson_id": "EX2-1"})
+        assert websocket.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1008
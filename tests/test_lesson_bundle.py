@@ -0,0 +1,86 @@
+"""lesson_bundle: a fresh bundle must load exactly what the JSON directory holds; a stale one must not be used."""
+
+import json
+import os
+
+import pytest
+
+from web_tutor.lesson_bundle import LessonBundle, load_fresh_bundle, write_bundle
+from web_tutor.lessons import LessonLibrary
+
+
+def write_lesson(directory, name, lesson, bump_ns=0):
+    path = directory / name
+    path.write_text(json.dumps(lesson, ensure_ascii=False), encoding="utf-8")
+    if bump_ns:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump_ns))
+    return path
+
+
+@pytest.fixture
+def content(tmp_path):
+    directory = tmp_path / "lessons"
+    directory.mkdir()
+    for i in range(4):
+        write_lesson(directory, f"EX1-{i}.json", {"id": f"EX1-{i}", "title": f"課程 {i}", "exercise": "print(1)"})
+    (directory / "broken.json").write_text("{", encoding="utf-8")
+    return directory
+
+
+@pytest.fixture
+def bundle_path(content):
+    path = content.parent / "lessons.bundle"
+    write_bundle(LessonLibrary(content, bundle_path=None).snapshot.files, path)
+    return path
+
+
+def test_fresh_bundle_loads_the_same_snapshot(content, bundle_path):
+    from_json = LessonLibrary(content, bundle_path=None).snapshot
+    from_bundle = LessonLibrary(content, bundle_path=bundle_path).snapshot
+    assert from_bundle.lessons == from_json.lessons
+    assert from_bundle.content_hash == from_json.content_hash
+    assert {name: (state.mtime_ns, state.size, state.sha256) for name, state in from_bundle.files.items()} == {
+        name: (state.mtime_ns, state.size, state.sha256) for name, state in from_json.files.items()}
+
+
+def test_single_lessons_are_read_by_offset(content, bundle_path):
+    bundle = LessonBundle.open(bundle_path)
+    for i in range(4):
+        assert bundle.load_lesson(f"EX1-{i}")["title"] == f"課程 {i}"
+    assert bundle.load_lesson("NO-SUCH-LESSON") is None
+
+
+@pytest.mark.parametrize("change", ["edit", "touch", "add", "remove"])
+def test_stale_bundle_falls_back_to_the_json_directory(content, bundle_path, change):
+    if change == "edit":
+        write_lesson(content, "EX1-0.json", {"id": "EX1-0", "title": "Edited"}, bump_ns=10**9)
+    elif change == "touch":
+        # same stat check as LessonLibrary._scan: a new mtime alone makes the bundle stale
+        path = content / "EX1-1.json"
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    elif change == "add":
+        write_lesson(content, "EX2-0.json", {"id": "EX2-0", "title": "New"})
+    else:
+        (content / "EX1-3.json").unlink()
+    assert load_fresh_bundle(content, bundle_path) is None
+    library = LessonLibrary(content, bundle_path=bundle_path)
+    assert library.snapshot.lessons == LessonLibrary(content, bundle_path=None).snapshot.lessons
+
+
+def test_refresh_after_loading_from_the_bundle(content, bundle_path):
+    library = LessonLibrary(content, bundle_path=bundle_path)
+    assert library.refresh() == []
+    write_lesson(content, "EX1-2.json", {"id": "EX1-2", "title": "Edited"}, bump_ns=10**9)
+    assert library.refresh() == ["EX1-2.json"]
+    assert library.snapshot.index["EX1-2"]["title"] == "Edited"
+
+
+@pytest.mark.parametrize("data", [b"", b"not a bundle", b"LPYBNDL\0\x02\x00\x00\x00\x00\x00"])
+def test_missing_or_corrupt_bundle_is_ignored(content, tmp_path, data):
+    assert LessonBundle.open(tmp_path / "missing.bundle") is None
+    path = tmp_path / "corrupt.bundle"
+    path.write_bytes(data)
+    assert LessonBundle.open(path) is None
+    assert LessonLibrary(content, bundle_path=path).snapshot.lessons == LessonLibrary(content).snapshot.lessons
@@ -0,0 +1,133 @@
+"""LessonLibrary.refresh(): incremental hot reload compared with a full load_lessons()-style scan."""
+
+import json
+import os
+
+import pytest
+
+from web_tutor import lessons as lessons_module
+from web_tutor.lessons import LessonLibrary
+
+
+def write_lesson(directory, name, lesson, bump_ns=0):
+    path = directory / name
+    path.write_text(json.dumps(lesson, ensure_ascii=False), encoding="utf-8")
+    if bump_ns:
+        # Make the edit visible even on filesystems with coarse mtime granularity
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump_ns))
+    return path
+
+
+def full_load(directory):
+    """Baseline behavior: glob + json.load every file, sorted by file name, skip invalid ones."""
+    result = []
+    for path in sorted(directory.glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            continue
+        if isinstance(data, dict) and "id" in data and "title" in data:
+            result.append(data)
+    return result
+
+
+@pytest.fixture
+def content(tmp_path):
+    for i in range(4):
+        write_lesson(tmp_path, f"EX1-{i}.json", {"id": f"EX1-{i}", "title": f"Lesson {i}", "exercise": "print(1)"})
+    return tmp_path
+
+
+def test_initial_load_matches_full_scan(content):
+    library = LessonLibrary(content)
+    assert library.snapshot.lessons == full_load(content)
+    assert set(library.snapshot.index) == {f"EX1-{i}" for i in range(4)}
+
+
+def test_refresh_without_changes_keeps_the_snapshot(content):
+    library = LessonLibrary(content)
+    snapshot = library.snapshot
+    assert library.refresh() == []
+    assert library.snapshot is snapshot
+
+
+def test_refresh_reparses_only_changed_files(content):
+    library = LessonLibrary(content)
+    before = library.snapshot
+    write_lesson(content, "EX1-2.json", {"id": "EX1-2", "title": "Edited", "exercise": "print(2)"}, bump_ns=10**9)
+
+    assert library.refresh() == ["EX1-2.json"]
+    after = library.snapshot
+    assert after is not before
+    assert after.lessons == full_load(content)
+    assert after.index["EX1-2"]["title"] == "Edited"
+    # Untouched lessons are the same objects, so their payloads and graders are reused
+    for lesson_id in ("EX1-0", "EX1-1", "EX1-3"):
+        assert after.index[lesson_id] is before.index[lesson_id]
+        assert after.graders[lesson_id] is before.graders[lesson_id]
+    assert after.content_hash != before.content_hash
+
+
+def test_refresh_picks_up_added_and_removed_files(content):
+    library = LessonLibrary(content)
+    (content / "EX1-0.json").unlink()
+    write_lesson(content, "EX1-9.json", {"id": "EX1-9", "title": "New"})
+    assert library.refresh() == ["EX1-0.json", "EX1-9.json"]
+    assert library.snapshot.lessons == full_load(content)
+
+
+def test_touch_without_content_change_is_not_a_change(content):
+    library = LessonLibrary(content)
+    path = content / "EX1-1.json"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    lesson = library.snapshot.index["EX1-1"]
+    assert library.refresh() == []
+    assert library.snapshot.index["EX1-1"] is lesson
+
+
+def test_half_written_file_keeps_the_last_good_version(content):
+    library = LessonLibrary(content)
+    lesson = library.snapshot.index["EX1-3"]
+    path = content / "EX1-3.json"
+    path.write_text('{"id": "EX1-3", "tit', encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    library.refresh()
+    assert library.snapshot.index["EX1-3"] is lesson
+
+
+def test_module_globals_follow_reloads(content, monkeypatch):
+    library = LessonLibrary(content)
+    monkeypatch.setattr(lessons_module, "LIBRARY", library)
+    assert lessons_module.LESSONS is library.snapshot.lessons
+
+    write_lesson(content, "EX1-0.json", {"id": "EX1-0", "title": "Edited again"}, bump_ns=10**9)
+    library.refresh()
+    assert lessons_module.LESSONS is library.snapshot.lessons
+    assert lessons_module.LESSON_INDEX["EX1-0"]["title"] == "Edited again"
+    assert lessons_module.CONTENT_HASH == library.snapshot.content_hash
+    with pytest.raises(AttributeError):
+        lessons_module.NOT_A_GLOBAL
+
+
+def test_served_lessons_and_payloads_are_swapped_together(content, monkeypatch):
+    from web_tutor import main
+
+    library = LessonLibrary(content)
+    monkeypatch.setattr(main, "LIBRARY", library)
+    monkeypatch.setattr(main, "SERVED", main.ServedLessons(library.snapshot))
+    before = main.SERVED
+    assert main.reload_lessons() == ([], None)
+
+    write_lesson(content, "EX1-1.json", {"id": "EX1-1", "title": "Edited"}, bump_ns=10**9)
+    changed, served = main.reload_lessons()
+    assert changed == ["EX1-1.json"]
+    # Building the next state does not touch the one being served
+    assert main.SERVED is before and main.PAYLOADS is before.payloads
+    assert served.snapshot is library.snapshot
+    assert served.payloads.content_hash == served.snapshot.content_hash
+    assert json.loads(served.payloads.lesson("EX1-1").body)["title"] == "Edited"
+    assert main.find_lesson("EX1-1", served.snapshot)[0]["title"] == "Edited"
+    assert main.find_lesson("EX1-1")[0]["title"] == "Lesson 1"
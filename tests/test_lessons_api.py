@@ -0,0 +1,118 @@
+"""/api/lessons and /api/lessons/{id}: per-lesson lookup from the prebuilt index with ETag revalidation."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from web_tutor import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    # No context manager: the lifespan (sandbox workers, reload watcher) is not needed here
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return main.LIBRARY.snapshot
+
+
+def test_single_lesson_matches_the_lesson_file(client, snapshot):
+    for name, state in list(snapshot.files.items())[:10]:
+        if state.lesson is None:
+            continue
+        response = client.get(f"/api/lessons/{state.lesson['id']}")
+        assert response.status_code == 200
+        assert response.json() == state.lesson
+
+
+def test_single_lesson_matches_the_full_list(client, snapshot):
+    full = client.get("/api/lessons").json()
+    assert full == snapshot.lessons
+    lesson = full[len(full) // 2]
+    assert client.get(f"/api/lessons/{lesson['id']}").json() == lesson
+
+
+def test_unknown_lesson_is_404(client):
+    assert client.get("/api/lessons/NO-SUCH-LESSON").status_code == 404
+
+
+def test_single_lesson_revalidates_with_etag(client, snapshot):
+    lesson_id = snapshot.lessons[0]["id"]
+    first = client.get(f"/api/lessons/{lesson_id}")
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    cached = client.get(f"/api/lessons/{lesson_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    stale = client.get(f"/api/lessons/{lesson_id}", headers={"If-None-Match": '"something-else"'})
+    assert stale.status_code == 200
+    assert json.loads(stale.content) == first.json()
+
+
+def test_each_lesson_has_its_own_etag(client, snapshot):
+    etags = {client.get(f"/api/lessons/{lesson['id']}").headers["etag"] for lesson in snapshot.lessons[:5]}
+    assert len(etags) == min(5, len(snapshot.lessons))
+
+
+def test_catalog_is_a_projection_of_the_full_list(client, snapshot):
+    response = client.get("/api/lessons?fields=id,title")
+    assert response.status_code == 200
+    assert response.json() == [{"id": lesson["id"], "title": lesson["title"]} for lesson in snapshot.lessons]
+    assert response.headers["x-total-count"] == str(len(snapshot.lessons))
+
+
+def test_catalog_is_the_prebuilt_view(client):
+    from web_tutor.payload_cache import CATALOG_FIELDS
+
+    # The client's request maps onto the view serialized when the cache was built
+    assert main.parse_fields("id,title") == CATALOG_FIELDS
+    assert (CATALOG_FIELDS, 0, None) in main.PAYLOADS._views
+
+
+def test_catalog_is_much_smaller_than_the_full_list(client):
+    full = client.get("/api/lessons", headers={"Accept-Encoding": "identity"})
+    catalog = client.get("/api/lessons?fields=id,title", headers={"Accept-Encoding": "identity"})
+    assert len(catalog.content) * 10 < len(full.content)
+
+
+def test_catalog_paging(client, snapshot):
+    page = client.get("/api/lessons?fields=id&offset=2&limit=3").json()
+    assert page == [{"id": lesson["id"]} for lesson in snapshot.lessons[2:5]]
+
+
+def test_catalog_revalidates_with_etag(client):
+    first = client.get("/api/lessons?fields=id,title")
+    etag = first.headers["etag"]
+    cached = client.get("/api/lessons?fields=id,title", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["x-total-count"] == first.headers["x-total-count"]
+    # Other projections and pages are validated separately
+    assert client.get("/api/lessons", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/api/lessons?fields=id,title&limit=5", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/api/lessons?fields=id,title", headers={"If-None-Match": "*"}).status_code == 304
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip", "identity"])
+def test_each_encoding_is_served_with_its_own_etag(client, snapshot, encoding):
+    from web_tutor import payload_cache
+
+    if encoding == "br" and payload_cache.brotli is None:
+        pytest.skip("brotli is not installed")
+    response = client.get("/api/lessons", headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding", "identity") == encoding
+    assert response.json() == snapshot.lessons
+    etag = response.headers["etag"]
+    base = main.PAYLOADS.view(None, 0, None).etag
+    assert etag == payload_cache.encoded_etag(base, None if encoding == "identity" else encoding)
+    # the cached variant revalidates whatever the next request accepts
+    for other in ["br", "gzip", "identity"]:
+        cached = client.get("/api/lessons", headers={"Accept-Encoding": other, "If-None-Match": etag})
+        assert cached.status_code == 304
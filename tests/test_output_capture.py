@@ -0,0 +1,226 @@
+"""output_capture: BoundedOutput must capture exactly what io.StringIO captured, up to its byte limit;
+ExpectedOutput must only stop programs whose finished output would fail the comparison."""
+
+import contextlib
+import io
+import random
+
+import pytest
+
+from web_tutor.output_capture import BoundedOutput, ExpectedOutput, OutputDiverged, OutputLimitExceeded
+
+ALPHABET = "abc xyz\n0123456789" + "中文輸出" + "é" + "😀"
+
+
+def utf8(text):
+    return len(text.encode("utf-8"))
+
+
+def first_bytes(text, size):
+    return text.encode("utf-8")[:size].decode("utf-8", "ignore")
+
+
+def last_bytes(text, size):
+    return text.encode("utf-8")[-size:].decode("utf-8", "ignore") if size else ""
+
+
+def random_writes(rng, total_chars):
+    writes = []
+    while total_chars > 0:
+        size = min(total_chars, rng.choice([1, 2, 5, 17, 100, 1000]))
+        writes.append("".join(rng.choice(ALPHABET) for _ in range(size)))
+        total_chars -= size
+    return writes
+
+
+def capture(writes, **kwargs):
+    bounded = BoundedOutput(**kwargs)
+    baseline = io.StringIO()
+    for text in writes:
+        assert bounded.write(text) == baseline.write(text)
+    return bounded, baseline.getvalue()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_identical_to_stringio_under_the_limit(seed):
+    rng = random.Random(seed)
+    writes = random_writes(rng, rng.randrange(0, 300))
+    full = "".join(writes)
+    bounded, expected = capture(writes, limit=utf8(full) + rng.randrange(0, 10))
+    assert bounded.getvalue() == expected
+    assert bounded.truncated is False
+    assert bounded.written == utf8(full)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_keeps_head_and_tail_over_the_limit(seed):
+    rng = random.Random(seed)
+    writes = random_writes(rng, rng.randrange(200, 3000))
+    limit = rng.randrange(16, 400)
+    tail = rng.choice([None, 0, limit // 2, limit])
+    bounded, full = capture(writes, limit=limit, tail=tail)
+    assert bounded.written == utf8(full)
+    if utf8(full) <= limit:
+        assert bounded.getvalue() == full
+        return
+    head = first_bytes(full, bounded.head_limit)
+    kept_tail = last_bytes(full[len(head):], bounded.tail_limit)
+    dropped = utf8(full) - utf8(head) - utf8(kept_tail)
+    assert bounded.truncated is True
+    assert bounded.dropped == dropped
+    assert bounded.getvalue() == f"{head}\n…（輸出過長，已省略 {dropped} 位元組）…\n{kept_tail}"
+    assert utf8(head) + utf8(kept_tail) <= limit
+
+
+def test_exactly_at_the_limit_is_not_truncated():
+    bounded, full = capture(["x" * 60, "y" * 40], limit=100)
+    assert bounded.getvalue() == full and bounded.truncated is False
+    bounded.write("z")
+    assert bounded.truncated is True
+
+
+def test_multibyte_characters_are_never_split():
+    bounded, full = capture(["中" * 100], limit=31, tail=10)
+    value = bounded.getvalue()
+    head, _, tail = value.partition("\n…")
+    assert head == "中" * 7 and tail.endswith("\n" + "中" * 3)
+    assert set(head + tail.rsplit("\n", 1)[1]) == {"中"}
+
+
+def test_print_through_redirect_stdout_matches_stringio():
+    def program():
+        print("a", 1, sep="-", end="!\n")
+        print("你好", [1, 2])
+        print()
+
+    baseline = io.StringIO()
+    with contextlib.redirect_stdout(baseline):
+        program()
+    bounded = BoundedOutput()
+    with contextlib.redirect_stdout(bounded):
+        program()
+    assert bounded.getvalue() == baseline.getvalue()
+
+
+def test_rejects_non_text_like_stringio():
+    with pytest.raises(TypeError):
+        io.StringIO().write(b"bytes")
+    with pytest.raises(TypeError):
+        BoundedOutput().write(b"bytes")
+
+
+def test_stop_raises_once_over_the_limit_and_keeps_raising():
+    bounded = BoundedOutput(limit=50, stop=True)
+    bounded.write("x" * 50)
+    with pytest.raises(OutputLimitExceeded):
+        bounded.write("y")
+    # the student's except Exception does not swallow it, and later writes raise again
+    with pytest.raises(OutputLimitExceeded):
+        try:
+            bounded.write("z")
+        except Exception:
+            pass
+    assert bounded.truncated is True
+    # the write that crossed the limit is kept, nothing after it
+    assert bounded.getvalue().endswith("xy") and bounded.written == 51
+
+
+def test_runaway_loop_is_stopped_with_bounded_memory():
+    bounded = BoundedOutput(limit=1000, stop=True)
+    with pytest.raises(OutputLimitExceeded), contextlib.redirect_stdout(bounded):
+        while True:
+            print("x" * 100)
+    assert bounded.written <= 1000 + 101
+    assert bounded.getvalue().startswith("x" * 100 + "\n")
+
+
+def test_tail_buffer_stays_bounded_without_stop():
+    bounded = BoundedOutput(limit=100, tail=20)
+    for i in range(10000):
+        bounded.write(f"line {i}\n")
+        assert bounded.tail_size <= 2 * bounded.tail_limit + 20
+    assert bounded.getvalue().endswith("line 9998\nline 9999\n")
+
+
+# --- ExpectedOutput ---
+
+def final_verdict(output, expected, prefix):
+    """How grading.py compares the finished output."""
+    actual, expected = output.strip(), expected.strip()
+    return actual.startswith(expected) if prefix else actual == expected
+
+
+def chunks(rng, text):
+    pieces = []
+    while text:
+        size = rng.randrange(1, 6)
+        pieces.append(text[:size])
+        text = text[size:]
+    return pieces
+
+
+def mutate(rng, text):
+    """The expected output, or a version of it that is close but (usually) wrong."""
+    choice = rng.randrange(7)
+    if choice == 0:
+        return text
+    if choice == 1:
+        return "  \n" + text + rng.choice(["", "\n", " \n\n"])
+    if choice == 2 and text:
+        index = rng.randrange(len(text))
+        return text[:index] + rng.choice("x \n中") + text[index + 1:]
+    if choice == 3:
+        return text[:rng.randrange(len(text) + 1)]
+    if choice == 4:
+        return text + rng.choice(["extra", "\nmore\n", " ", "\t"])
+    if choice == 5 and text:
+        index = rng.randrange(len(text))
+        return text[:index] + text[index + 1:]
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(0, 20)))
+
+
+EXPECTED = ["Hello, Python!\n", "1\n2\n3\n", "  indented\n\nblank lines inside\n", "您是成年人\n", "", "a b  c\n"]
+
+
+@pytest.mark.parametrize("prefix", [False, True])
+@pytest.mark.parametrize("seed", range(30))
+def test_incremental_verdict_equals_the_final_comparison(seed, prefix):
+    rng = random.Random(seed)
+    for _ in range(50):
+        expected = rng.choice(EXPECTED)
+        output = mutate(rng, expected)
+        expect = ExpectedOutput(expected, prefix)
+        fed = ""
+        for piece in chunks(rng, output):
+            fed += piece
+            if not expect.feed(piece):
+                # diverged: no continuation can pass, including the rest of the expected output
+                assert not final_verdict(fed, expected, prefix), (expected, fed)
+                assert not final_verdict(fed + expected.strip()[expect.position:], expected, prefix)
+                assert not final_verdict(output, expected, prefix)
+                break
+            # not diverged yet: finishing with the rest of the expected output would pass
+            assert final_verdict(fed + expected.strip()[expect.position:], expected, prefix), (expected, fed)
+        else:
+            # never diverged: the output passes exactly when all of the expected output was seen
+            assert final_verdict(output, expected, prefix) == (expect.position == len(expected.strip()))
+
+
+def test_diverged_expectation_stops_the_capture():
+    bounded = BoundedOutput(expect=ExpectedOutput("1\n2\n3\n"))
+    bounded.write("1\n")
+    with pytest.raises(OutputDiverged):
+        bounded.write("5\n")
+    # the diverging write is kept for the feedback, later writes raise
+    assert bounded.getvalue() == "1\n5\n"
+    with pytest.raises(OutputDiverged):
+        try:
+            bounded.write("3\n")
+        except Exception:
+            pass
+
+
+def test_prefix_expectation_accepts_anything_after_the_prefix():
+    expect = ExpectedOutput("Menu:\n", prefix=True)
+    for piece in ["\n", "Menu", ":", "\n1. start", "\n2. quit\n"]:
+        assert expect.feed(piece)
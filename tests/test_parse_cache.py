@@ -0,0 +1,140 @@
+"""parse_cache: cached trees must equal ast.parse, and the cache must stay within its source-byte budget."""
+
+import ast
+import threading
+
+import pytest
+
+from web_tutor.parse_cache import ParseCache
+
+SOURCES = [
+    'print("Hello, Python!")\n',
+    "for i in range(3):\n    print(i)\n",
+    "def f(x):\n    return x * 2\n\nprint(f(4))\n",
+    'name = "小明"\nprint(f"你好，{name}")\n',
+    "",
+]
+
+
+@pytest.mark.parametrize("code", SOURCES)
+def test_parse_matches_ast_parse(code):
+    cache = ParseCache()
+    expected = ast.dump(ast.parse(code), include_attributes=True)
+    assert ast.dump(cache.parse(code), include_attributes=True) == expected
+    assert ast.dump(cache.parse(code), include_attributes=True) == expected
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_same_source_returns_shared_tree():
+    cache = ParseCache()
+    assert cache.parse(SOURCES[1]) is cache.parse(SOURCES[1])
+
+
+def test_syntax_error_is_cached_and_raised_fresh():
+    cache = ParseCache()
+    code = "for i in range(3)\n    print(i)\n"
+    with pytest.raises(SyntaxError) as baseline:
+        ast.parse(code)
+    errors = []
+    for _ in range(2):
+        with pytest.raises(SyntaxError) as raised:
+            cache.parse(code)
+        errors.append(raised.value)
+    assert errors[0] is not errors[1]
+    for error in errors:
+        assert (error.msg, error.lineno, error.offset) == (baseline.value.msg, baseline.value.lineno, baseline.value.offset)
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_by_total_source_bytes():
+    cache = ParseCache(maxbytes=100, max_entry_bytes=100)
+    sources = [f"x = {i}\n" + "#" * 30 + "\n" for i in range(5)]
+    size = len(sources[0].encode())
+    for code in sources:
+        cache.parse(code)
+    stats = cache.stats()
+    assert stats["bytes"] <= 100
+    assert stats["size"] == 100 // size
+    assert stats["bytes"] == stats["size"] * size
+    # the oldest entries were evicted, the newest is still cached
+    cache.parse(sources[-1])
+    assert cache.stats()["hits"] == 1
+    cache.parse(sources[0])
+    assert cache.stats()["misses"] == len(sources) + 1
+
+
+def test_recently_used_entry_survives_eviction():
+    cache = ParseCache(maxbytes=30, max_entry_bytes=30)
+    a, b, c = "a = 1\n" * 2, "b = 2\n" * 2, "c = 3\n" * 2
+    cache.parse(a)
+    cache.parse(b)
+    cache.parse(a)
+    cache.parse(c)
+    cache.parse(a)
+    assert cache.stats()["hits"] == 2
+    cache.parse(b)
+    assert cache.stats()["hits"] == 2
+
+
+def test_sizes_count_utf8_bytes():
+    cache = ParseCache()
+    code = 'print("你好")\n'
+    cache.parse(code)
+    assert cache.stats()["bytes"] == len(code.encode("utf-8"))
+
+
+def test_large_sources_are_parsed_but_not_cached():
+    cache = ParseCache(maxbytes=1000, max_entry_bytes=50)
+    code = "total = 0\n" + "total += 1\n" * 20
+    assert ast.dump(cache.parse(code)) == ast.dump(ast.parse(code))
+    cache.parse(code)
+    stats = cache.stats()
+    assert stats["skipped"] == 2
+    assert stats["size"] == 0 and stats["bytes"] == 0
+    assert stats["hits"] == 0 and stats["misses"] == 0
+
+
+def test_zero_budget_disables_cache():
+    cache = ParseCache(maxbytes=0)
+    tree = cache.parse(SOURCES[0])
+    assert cache.parse(SOURCES[0]) is not tree
+    assert cache.stats()["size"] == 0
+
+
+def test_lone_surrogates_fail_like_ast_parse():
+    cache = ParseCache()
+    code = 'print("\ud800")\n'
+    with pytest.raises(UnicodeEncodeError):
+        ast.parse(code)
+    with pytest.raises(UnicodeEncodeError):
+        cache.parse(code)
+    assert cache.stats()["size"] == 0
+
+
+def test_clear_resets_counters():
+    cache = ParseCache()
+    cache.parse(SOURCES[0])
+    cache.parse(SOURCES[0])
+    cache.clear()
+    assert cache.stats() == {
+        "hits": 0, "misses": 0, "hit_rate": 0.0, "skipped": 0,
+        "size": 0, "bytes": 0, "maxbytes": cache.maxbytes,
+    }
+
+
+def test_concurrent_parses_keep_byte_count_consistent():
+    cache = ParseCache(maxbytes=200, max_entry_bytes=200)
+    sources = [f"value_{i} = {i}\n" for i in range(40)]
+
+    def worker():
+        for code in sources:
+            cache.parse(code)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["bytes"] <= 200
+    assert stats["bytes"] == sum(size for _, size in cache._entries.values())
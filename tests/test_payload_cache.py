@@ -0,0 +1,133 @@
+"""payload_cache: pre-serialized, pre-compressed lesson responses must match what JSONResponse used to send."""
+
+import gzip
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from web_tutor import payload_cache
+from web_tutor.payload_cache import (
+    CATALOG_FIELDS,
+    MIN_COMPRESS_SIZE,
+    LessonPayloadCache,
+    Payload,
+    choose_encoding,
+    encoded_etag,
+    etag_matches,
+    make_lessons_etag,
+    parse_fields,
+)
+
+LESSONS = [
+    {"id": "EX1-0", "title": "第一課", "explanation": "說明 " * 200, "validator": {"type": "stdout_equals"}},
+    {"id": "EX1-1", "title": "Second", "explanation": "short"},
+    {"id": "EX1-2", "title": "Third", "explanation": "x" * 2000, "hint": None},
+]
+
+
+def build(lessons=LESSONS, previous=None, content_hash="a" * 64):
+    return LessonPayloadCache(lessons, {lesson["id"]: lesson for lesson in lessons}, content_hash, previous)
+
+
+def test_bodies_match_json_response():
+    cache = build()
+    assert cache.view(None, 0, None).body == JSONResponse(LESSONS).body
+    for lesson in LESSONS:
+        assert cache.lesson(lesson["id"]).body == JSONResponse(lesson).body
+
+
+def test_views_match_projection():
+    cache = build()
+    expected = [{name: lesson[name] for name in CATALOG_FIELDS} for lesson in LESSONS]
+    assert cache.view(CATALOG_FIELDS, 0, None).body == JSONResponse(expected).body
+    assert cache.view(("id",), 1, 1).body == JSONResponse([{"id": "EX1-1"}]).body
+    # Fields a lesson does not have are left out rather than sent as null
+    assert cache.view(("id", "hint"), 0, None).body == JSONResponse(
+        [{"id": "EX1-0"}, {"id": "EX1-1"}, {"id": "EX1-2", "hint": None}]).body
+
+
+def test_compressed_variants_decode_to_the_body():
+    payload = Payload(b'{"a":"' + b"x" * 4096 + b'"}', '"tag"')
+    assert gzip.decompress(payload.gzip) == payload.body
+    assert payload.encoded("gzip") == (payload.gzip, "gzip", '"tag-gzip"')
+    assert payload.encoded(None) == (payload.body, None, '"tag"')
+    if payload_cache.brotli is not None:
+        assert payload_cache.brotli.decompress(payload.br) == payload.body
+        assert payload.encoded("br") == (payload.br, "br", '"tag-br"')
+    else:
+        # Without brotli a br request falls back to gzip
+        assert payload.encoded("br") == (payload.gzip, "gzip", '"tag-gzip"')
+
+
+def test_small_bodies_are_not_compressed():
+    payload = Payload(b"x" * (MIN_COMPRESS_SIZE - 1), '"tag"')
+    assert payload.gzip is None and payload.br is None
+    assert payload.encoded("gzip") == (payload.body, None, '"tag"')
+
+
+def test_gzip_is_deterministic():
+    body = b"y" * 4096
+    assert Payload(body, '"a"').gzip == Payload(body, '"b"').gzip
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip, deflate", "gzip"),
+    ("deflate", None),
+    ("gzip;q=0, deflate", None),
+    ("*", "gzip"),
+    ("GZIP", "gzip"),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_prefers_brotli_when_available():
+    assert choose_encoding("gzip, br") == ("br" if payload_cache.brotli is not None else "gzip")
+
+
+def test_etag_matching():
+    etag = make_lessons_etag("f" * 64, None, 0, None)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+    # a compressed variant of the same content is still fresh
+    assert etag_matches(encoded_etag(etag, "gzip"), etag)
+    assert etag_matches(encoded_etag(etag, "br"), etag)
+    assert not etag_matches(encoded_etag('"other"', "gzip"), etag)
+
+
+def test_each_encoding_has_its_own_etag():
+    assert encoded_etag('"abc"', None) == '"abc"'
+    assert encoded_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert encoded_etag('"abc"', "br") == '"abc-br"'
+
+
+def test_etags_depend_on_content_and_view():
+    base = make_lessons_etag("a" * 64, None, 0, None)
+    assert make_lessons_etag("b" * 64, None, 0, None) != base
+    assert make_lessons_etag("a" * 64, CATALOG_FIELDS, 0, None) != base
+    assert make_lessons_etag("a" * 64, None, 0, 10) != base
+    cache = build()
+    assert cache.view(None, 0, None).etag == base
+    assert cache.view(("id",), 3, 1).etag == make_lessons_etag("a" * 64, ("id",), 3, 1)
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields("id, title,,id") == ("id", "title")
+
+
+def test_unchanged_lessons_are_reused_after_reload():
+    first = build()
+    edited = dict(LESSONS[1], title="Edited")
+    lessons = [LESSONS[0], edited, LESSONS[2]]
+    second = build(lessons, previous=first, content_hash="b" * 64)
+    assert second.lesson("EX1-0") is first.lesson("EX1-0")
+    assert second.lesson("EX1-2") is first.lesson("EX1-2")
+    assert second.lesson("EX1-1").body == JSONResponse(edited).body
+    assert second.lesson("EX1-1").etag != first.lesson("EX1-1").etag
+    assert second.view(None, 0, None).body == JSONResponse(lessons).body
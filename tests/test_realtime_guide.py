@@ -0,0 +1,159 @@
+"""RealtimeGuide with a GuideSession must give the same guidance as a full reparse of every version."""
+
+import random
+
+import pytest
+
+from web_tutor import realtime_guide
+from web_tutor.realtime_guide import GuideSession, RealtimeGuide, sample_program, split_top_level_blocks
+
+# random edits produce code such as "1for", which the parser warns about
+pytestmark = pytest.mark.filterwarnings("ignore::SyntaxWarning")
+
+REQUIREMENTS = [
+    {"requires_loop": True, "forbids_hardcode": True},
+    {"requires_loop": True, "loop_type": "for", "requires_if": True},
+    {"requires_function": True, "function_name": "reverse_string", "forbids_hardcode": True},
+]
+
+BASE = (
+    "import math\n"
+    "\n"
+    "@staticmethod\n"
+    "def area(r):\n"
+    "    return math.pi * r * r\n"
+    "\n"
+    "if area(1) > 3:\n"
+    "    print('big')\n"
+    "else:\n"
+    "    print('small')\n"
+    "\n"
+    "values = [\n"
+    "    1, 2, 3,\n"
+    "]\n"
+    "text = '''\n"
+    "column zero inside a string\n"
+    "'''\n"
+    "try:\n"
+    "    print(values)\n"
+    "except ValueError:\n"
+    "    pass\n"
+    "print('a', 1)\n"
+    "print('b', 2)\n"
+    "print('c', 3)\n"
+)
+
+
+def keystrokes(code, line_index, text):
+    """Versions produced while typing `text` at the end of a line, one character at a time."""
+    lines = code.split("\n")
+    for count in range(1, len(text) + 1):
+        edited = list(lines)
+        edited[line_index] = lines[line_index] + text[:count]
+        yield "\n".join(edited), line_index + 1
+
+
+def edit_sequence():
+    yield BASE, 1
+    yield from keystrokes(BASE, 4, " + 1")
+    # a new top-level loop typed from scratch (incomplete while typing)
+    yield from keystrokes(BASE + "\n", BASE.count("\n"), "for i in range(3):")
+    grown = BASE + "for i in range(3):\n    print(i)\n"
+    yield grown, grown.count("\n")
+    # more copies of an existing block, spread across blocks
+    grown += "print('d', 4)\nprint('e', 5)\n"
+    yield grown, grown.count("\n")
+    # delete a block in the middle
+    trimmed = grown.replace("if area(1) > 3:\n    print('big')\nelse:\n    print('small')\n", "")
+    yield trimmed, 3
+    # break and repair a block
+    broken = trimmed.replace("def area(r):", "def area(r)")
+    yield broken, 4
+    yield trimmed, 4
+
+
+def analyze(guide, code, cursor_line, session=None):
+    return guide.analyze_partial_code(code, cursor_line, 1, session)
+
+
+@pytest.mark.parametrize("requirements", REQUIREMENTS)
+def test_session_matches_full_reparse_over_edits(requirements):
+    guide = RealtimeGuide({"validator": {"code_requirements": requirements}})
+    session = GuideSession()
+    for code, cursor_line in edit_sequence():
+        assert analyze(guide, code, cursor_line, session) == analyze(guide, code, cursor_line), code
+
+
+def test_session_matches_full_reparse_under_random_edits():
+    guide = RealtimeGuide({"validator": {"code_requirements": REQUIREMENTS[0]}})
+    session = GuideSession()
+    rng = random.Random(1234)
+    lines = sample_program(80).split("\n")
+    snippets = ["for", " x", ":", "print(1)", "    ", "(", ")", "else:", "#", "'''"]
+    for _ in range(300):
+        index = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.6:
+            lines[index] += rng.choice(snippets)
+        elif action < 0.8 and len(lines) > 1:
+            del lines[index]
+        else:
+            lines.insert(index, lines[rng.randrange(len(lines))])
+        code = "\n".join(lines)
+        cursor_line = min(index + 1, len(lines))
+        assert analyze(guide, code, cursor_line, session) == analyze(guide, code, cursor_line)
+
+
+def test_typing_in_one_block_reparses_only_that_block():
+    guide = RealtimeGuide({"validator": {"code_requirements": REQUIREMENTS[0]}})
+    session = GuideSession()
+    code = sample_program(200)
+    analyze(guide, code, 1, session)
+    total_blocks = len(session.order)
+    assert session.reparsed == total_blocks
+    lines = code.split("\n")
+    target = next(i for i in range(len(lines) // 2, len(lines)) if lines[i].startswith("    total = 0"))
+    for edited, cursor_line in keystrokes(code, target, "1234"):
+        analyze(guide, edited, cursor_line, session)
+        assert session.reparsed == 1
+        assert len(session.order) == total_blocks
+    # a comment above the first block shifts every line without reparsing anything below it
+    analyze(guide, "# header\n" + edited, 1, session)
+    assert session.reparsed == 1
+
+
+def test_hardcode_line_numbers_follow_shifted_blocks():
+    guide = RealtimeGuide({"validator": {"code_requirements": {"forbids_hardcode": True}}})
+    session = GuideSession()
+    code = "x = 1\n" + "".join(f"print('item', {i}, {i} * {i})\n" for i in range(4))
+    first = analyze(guide, code, 1, session)["warnings"][0]
+    shifted = analyze(guide, "# header\n\n" + code, 1, session)["warnings"][0]
+    assert shifted["line"] == first["line"] + 2
+    assert shifted == analyze(guide, "# header\n\n" + code, 1)["warnings"][0]
+
+
+def test_hasher_reset_keeps_results(monkeypatch):
+    monkeypatch.setattr(GuideSession, "MAX_HASHED_SUBTREES", 10)
+    guide = RealtimeGuide({"validator": {"code_requirements": REQUIREMENTS[0]}})
+    session = GuideSession()
+    code = sample_program(60)
+    for edited, cursor_line in keystrokes(code, 2, "0000"):
+        assert analyze(guide, edited, cursor_line, session) == analyze(guide, edited, cursor_line)
+
+
+@pytest.mark.parametrize("code", [BASE, sample_program(40), "", "\n\n", "x = (\n1)\n", "@d\n\ndef f():\n    pass\n"])
+def test_blocks_join_back_to_the_source(code):
+    lines = code.split("\n")
+    assert "\n".join(split_top_level_blocks(lines)) == code
+
+
+def test_block_split_keeps_compound_statements_together():
+    blocks = split_top_level_blocks(BASE.split("\n"))
+    assert any(block.startswith("if area(1) > 3:\n    print('big')\nelse:\n    print('small')\n") for block in blocks)
+    assert any(block.startswith("@staticmethod\ndef area(r):") for block in blocks)
+    assert any(block.startswith("try:") and "except ValueError:" in block for block in blocks)
+
+
+def test_guide_benchmark_runs():
+    result = realtime_guide.benchmark(lines=40, keystrokes=3)
+    assert result["full_ms"] > 0 and result["incremental_ms"] > 0
@@ -0,0 +1,158 @@
+"""repeated_code: forbids_hardcode flags copy-paste a loop could replace, and nothing a loop could not produce."""
+
+import ast
+
+import pytest
+
+import baseline_code_analyzer as baseline
+from web_tutor.code_analyzer import CheckPlan, CodeAnalyzer
+from web_tutor.realtime_guide import GuideSession, RealtimeGuide
+from web_tutor.repeated_code import (
+    DUPLICATE_MIN_NODES,
+    MIN_NODES,
+    MIN_REPEATS,
+    StructuralHasher,
+    find_repeated_blocks,
+)
+
+POEM = (
+    "def f(x):\n"
+    "    return x\n"
+    "\n"
+    'print("Roses are red")\n'
+    'print("Violets are blue")\n'
+    'print("Sugar is sweet")\n'
+    'print("And so are you")\n'
+)
+
+# a loop could print every one of these
+HARDCODED = {
+    "counting": "".join(f"print({i})\n" for i in range(1, 6)),
+    "same_line": 'print("*")\n' * 5,
+    "squares": "".join(f"print({i} * {i})\n" for i in range(1, 6)),
+    "step": "".join(f"print({i * 10})\n" for i in range(5)),
+    "floats": "".join(f"print({i / 2})\n" for i in range(5)),
+    "numbered_text": "".join(f'print("第 {i} 題：", {i} + 1)\n' for i in range(1, 6)),
+    "letters": "".join(f'print("{c}")\n' for c in "abcde"),
+    "accumulate": "total = 0\n" + "".join(f"total += {i}\n" for i in range(1, 7)) + "print(total)\n",
+    "pairs": "".join(f'name = "s{i}"\nprint(name, {i})\n' for i in range(1, 5)),
+    "after_a_loop": "for i in range(3):\n    print(i)\n" + "".join(f"print({i})\n" for i in range(3, 8)),
+    "inside_function": "def show():\n" + "".join(f"    print({i})\n" for i in range(1, 6)) + "show()\n",
+    "copied_block": (
+        "a = int(input())\nb = a * 2 + 1\nprint('result:', a, b * b)\n"
+        "x = 0\n"
+        "a = int(input())\nb = a * 2 + 1\nprint('result:', a, b * b)\n"
+    ),
+}
+
+# nothing here can be generated by a loop
+NOT_HARDCODED = {
+    "poem": POEM,
+    "unrelated_numbers": "".join(f"print({n})\n" for n in (3, 9, 1, 7, 2)),
+    "names": "".join(f'print("Hello, {name}!")\n' for name in ("Ann", "Bob", "Cid", "Dee")),
+    "loop": "for i in range(1, 6):\n    print(i)\n",
+    "two_copies": "print(1)\nprint(2)\n",
+    "tiny_statements": "a\nb\nc\nd\n",
+    "different_structure": "print(1)\nx = 2\nprint(x, 3)\ny = [x]\n",
+    "mixed_kinds": 'print(1)\nprint("1")\nprint(1.5)\nprint(None)\n',
+}
+
+
+def analyzer_flags(code):
+    return CheckPlan({"forbids_hardcode": True}).run(CodeAnalyzer(code))[0] is False
+
+
+def guide_flags(code, session=None):
+    guide = RealtimeGuide({"validator": {"code_requirements": {"forbids_hardcode": True}}})
+    result = guide.analyze_partial_code(code, 1, 1, session)
+    return any(warning["type"] == "hardcode_detected" for warning in result["warnings"])
+
+
+@pytest.mark.parametrize("name", sorted(HARDCODED))
+def test_hardcoded_code_is_flagged(name):
+    code = HARDCODED[name]
+    assert find_repeated_blocks(ast.parse(code))
+    assert analyzer_flags(code)
+    assert guide_flags(code) and guide_flags(code, GuideSession())
+
+
+@pytest.mark.parametrize("name", sorted(NOT_HARDCODED))
+def test_code_a_loop_cannot_replace_passes(name):
+    code = NOT_HARDCODED[name]
+    assert find_repeated_blocks(ast.parse(code)) == []
+    assert not analyzer_flags(code)
+    assert not guide_flags(code) and not guide_flags(code, GuideSession())
+
+
+def test_poem_with_a_function_passes_the_lesson_requirements():
+    requirements = {"forbids_hardcode": True, "requires_function": True}
+    assert CodeAnalyzer(POEM).check_code_structure(requirements) == (True, [])
+
+
+def test_feedback_points_at_the_repeated_lines():
+    code = "name = input()\n" + HARDCODED["counting"]
+    passed, feedback = CodeAnalyzer(code).check_code_structure({"forbids_hardcode": True})
+    assert not passed
+    assert feedback == [
+        "❌ 檢測到硬編碼的寫法。雖然結果可能正確，但此題目要求使用更靈活的方法（如循環）。",
+        "📍 第 2～6 行是 5 段結構相同的程式碼。",
+        "💡 提示：嘗試使用循環來處理重複的操作，這樣代碼更簡潔且易於維護。",
+    ]
+
+
+def test_consecutive_repeat_thresholds():
+    statement = "print(1 + 2)\n"
+    tree = ast.parse(statement)
+    nodes = sum(1 for node in ast.walk(tree.body[0]) if not isinstance(node, ast.expr_context))
+    needed = max(MIN_REPEATS, -(-MIN_NODES // nodes))
+    assert find_repeated_blocks(ast.parse(statement * (needed - 1))) == []
+    [block] = find_repeated_blocks(ast.parse(statement * needed))
+    assert (block.copies, block.statements, block.nodes, block.consecutive) == (needed, 1, needed * nodes, True)
+
+
+def test_duplicate_block_threshold():
+    small = "a = int(input())\nprint(a)\n"
+    large = "a = int(input())\nb = a * 2 + 1\nprint('result:', a, b * b)\n"
+    sizes = {}
+    for name, block in (("small", small), ("large", large)):
+        top_level, _ = StructuralHasher().statement_lists(ast.parse(block))
+        sizes[name] = sum(statement[1] for statement in top_level)
+    assert sizes["small"] < DUPLICATE_MIN_NODES <= sizes["large"]
+    assert find_repeated_blocks(ast.parse(small + "x = 0\n" + small)) == []
+    [block] = find_repeated_blocks(ast.parse(large + "x = 0\n" + large))
+    assert (block.start_line, block.end_line, block.copies, block.consecutive) == (1, 3, 2, False)
+
+
+def test_shortest_period_wins():
+    [block] = find_repeated_blocks(ast.parse("print(0)\n" * 6))
+    assert (block.statements, block.copies) == (1, 6)
+
+
+def test_period_two_sequence():
+    code = "".join(f"x = {i}\nprint(x * {i + 1})\n" for i in range(4))
+    [block] = find_repeated_blocks(ast.parse(code))
+    assert (block.statements, block.copies, block.start_line, block.end_line) == (2, 4, 1, 8)
+
+
+# The old heuristic (more than 3 prints and no loop, or many repeated numbers) on the same cases.
+# These differences from the old rule are intended:
+OLD_RULE_DIFFERENCES = {
+    # different lines of text cannot be produced by a loop
+    "poem": (True, False),
+    "names": (True, False),
+    "unrelated_numbers": (True, False),
+    "mixed_kinds": (True, False),
+    # repetition is hardcoding even when a loop appears elsewhere, and does not need print()
+    "after_a_loop": (False, True),
+    "accumulate": (False, True),
+    "copied_block": (False, True),
+}
+
+
+@pytest.mark.parametrize("name", sorted(HARDCODED) + sorted(NOT_HARDCODED))
+def test_compared_with_the_old_heuristic(name):
+    code = HARDCODED.get(name) or NOT_HARDCODED[name]
+    old = baseline.CodeAnalyzer(code).has_hardcoded_values()
+    new = CodeAnalyzer(code).has_hardcoded_values()
+    assert new == (name in HARDCODED)
+    assert (old, new) == OLD_RULE_DIFFERENCES.get(name, (new, new))
@@ -0,0 +1,119 @@
+"""rule_timing: @timed methods are only wrapped while timing is on, and counts survive export/merge across processes."""
+
+import pytest
+
+from web_tutor import rule_timing
+from web_tutor.code_analyzer import analyze_code_batch
+from web_tutor.rule_timing import RULE_TIMINGS, RuleTimings
+
+
+def make_class(timings):
+    class Doubler:
+        @timings.timed("demo.double")
+        def double(self, x):
+            return x * 2
+    return Doubler
+
+
+def count(timings, rule):
+    return timings.export().get(rule, (0,))[0]
+
+
+def test_enable_and_disable_swap_the_method():
+    timings = RuleTimings()
+    Doubler = make_class(timings)
+    original = Doubler.double
+    # disabled: the class holds the plain function, and calls are not recorded
+    assert not hasattr(original, "__wrapped__")
+    assert Doubler().double(2) == 4 and count(timings, "demo.double") == 0
+
+    timings.enable()
+    assert Doubler.double.__wrapped__ is original
+    assert Doubler().double(3) == 6 and count(timings, "demo.double") == 1
+
+    timings.disable()
+    assert Doubler.double is original
+    assert Doubler().double(4) == 8 and count(timings, "demo.double") == 1
+
+
+def test_class_defined_while_enabled_starts_wrapped():
+    timings = RuleTimings(enabled=True)
+    Doubler = make_class(timings)
+    Doubler().double(1)
+    assert count(timings, "demo.double") == 1
+    timings.disable()
+    assert not hasattr(Doubler.double, "__wrapped__")
+
+
+def test_plain_functions_check_the_flag():
+    timings = RuleTimings()
+    square = timings.timed("demo.square")(lambda x: x * x)
+    assert square(3) == 9 and count(timings, "demo.square") == 0
+    timings.enable()
+    assert square(4) == 16 and count(timings, "demo.square") == 1
+
+
+def test_measure_is_free_when_disabled():
+    timings = RuleTimings()
+    assert timings.measure("demo.block") is rule_timing._NULL_TIMER
+    timings.enable()
+    with timings.measure("demo.block"):
+        pass
+    assert count(timings, "demo.block") == 1
+
+
+def test_histogram_and_percentiles():
+    timings = RuleTimings()
+    for _ in range(8):
+        timings.record("rule", 1_500)
+    timings.record("rule", 3_000)
+    timings.record("rule", 100_000)
+    stats = timings.snapshot()["rules"]["rule"]
+    assert stats["histogram"] == {"2": 8, "4": 1, "128": 1}
+    assert (stats["count"], stats["total_ms"], stats["mean_us"], stats["max_us"]) == (10, 0.115, 11.5, 100.0)
+    # each percentile is its bucket's upper bound, capped at the longest call
+    assert (stats["p50_us"], stats["p90_us"], stats["p99_us"]) == (2.0, 4.0, 100.0)
+
+
+def test_sub_microsecond_and_huge_calls_land_in_the_end_buckets():
+    timings = RuleTimings()
+    timings.record("rule", 500)
+    timings.record("rule", 10 ** 15)
+    histogram = timings.snapshot()["rules"]["rule"]["histogram"]
+    assert histogram == {"1": 1, str(1 << (rule_timing.BUCKETS - 1)): 1}
+
+
+def test_merge_adds_exported_counts():
+    first, second = RuleTimings(), RuleTimings()
+    first.record("shared", 1_500)
+    first.record("first_only", 3_000)
+    second.record("shared", 100_000)
+    second.merge(first.export())
+    merged = second.export()
+    buckets = [0] * rule_timing.BUCKETS
+    buckets[1] = buckets[7] = 1
+    assert merged["shared"] == (2, 101_500, 100_000, buckets)
+    assert merged["first_only"] == first.export()["first_only"]
+
+
+@pytest.fixture
+def rule_timings():
+    enabled = RULE_TIMINGS.enabled
+    RULE_TIMINGS.reset()
+    RULE_TIMINGS.enable()
+    yield RULE_TIMINGS
+    if not enabled:
+        RULE_TIMINGS.disable()
+    RULE_TIMINGS.reset()
+
+
+def test_batch_merges_counts_from_worker_processes(rule_timings):
+    items = [('print("Hello, Python!")\n', {"requires_loop": True})] * 7 + [("for i in range(3)\n", None)] * 3
+    list(analyze_code_batch(items, workers=1, chunk_size=3))
+    serial = {rule: stats[0] for rule, stats in rule_timings.export().items()}
+    rule_timings.reset()
+    list(analyze_code_batch(items, workers=2, chunk_size=3))
+    parallel = {rule: stats[0] for rule, stats in rule_timings.export().items()}
+    assert parallel == serial
+    # every item is parsed; only the seven without a syntax error get their facts
+    assert (parallel["analyzer.parse"], parallel["analyzer.facts"]) == (10, 7)
@@ -0,0 +1,112 @@
+"""/api/run_code/stream: the SSE chunks add up to the program's output and end with one graded result event."""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from web_tutor import main, sandbox
+
+pytestmark = pytest.mark.skipif(not sandbox.SANDBOX_AVAILABLE, reason="sandbox needs a POSIX platform")
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = sandbox.ExecutionPool(1).start()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(autouse=True)
+def serve(monkeypatch, pool):
+    monkeypatch.setattr(main, "execution_pool", pool)
+
+
+def parse_events(text):
+    """(event, data) pairs of a text/event-stream body."""
+    events = []
+    for block in text.split("\n\n"):
+        if not block:
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def stream(client, code, lesson_id="EX1-0"):
+    response = client.post("/api/run_code/stream", json={"code": code, "lesson_id": lesson_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_events(response.text)
+
+
+def test_chunks_add_up_to_the_output_and_the_result_comes_last(client):
+    events = stream(client, 'for i in range(2000):\n    print(i)\nprint("Hello, Python!")')
+    kinds = [event for event, _ in events]
+    assert kinds[-1] == "result" and kinds.count("result") == 1
+    # long output arrives in several chunks
+    assert kinds.count("stdout") > 1
+    stdout = "".join(data for event, data in events if event == "stdout")
+    assert stdout == "".join(f"{i}\n" for i in range(2000)) + "Hello, Python!\n"
+    result = events[-1][1]
+    assert result["status"] == "ok" and result["truncated"] is False
+    assert result["is_correct"] is False
+
+
+def test_result_event_carries_the_grade(client):
+    events = stream(client, 'print("Hello, Python!")')
+    assert events == [
+        ("stdout", "Hello, Python!\n"),
+        ("result", {"is_correct": True, "message": "🎉 恭喜！做得好！輸出結果完全正確！", "status": "ok",
+                    "truncated": False}),
+    ]
+
+
+def test_errors_are_streamed_on_stderr(client):
+    events = stream(client, 'print("before")\n1 / 0')
+    assert ("stdout", "before\n") in events
+    assert "ZeroDivisionError" in "".join(data for event, data in events if event == "stderr")
+    assert events[-1][0] == "result" and events[-1][1]["status"] == "error"
+    assert events[-1][1]["is_correct"] is False
+
+
+def test_timeout_ends_the_stream_with_its_status(client, monkeypatch, pool):
+    monkeypatch.setattr(pool.limits, "wall_seconds", 1)
+    events = stream(client, 'print("start", flush=True)\nwhile True:\n    pass')
+    assert events[0] == ("stdout", "start\n")
+    assert events[-1][0] == "result" and events[-1][1]["status"] in ("timeout", "cpu_limit")
+
+
+def test_streams_over_the_limit_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, "stream_sessions", main.MAX_STREAM_SESSIONS)
+    response = client.post("/api/run_code/stream", json={"code": "print(1)", "lesson_id": "EX1-0"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"]
+    monkeypatch.setattr(main, "stream_sessions", 0)
+    assert stream(client, "print(1)")[-1][0] == "result"
+    assert main.stream_sessions == 0
+
+
+def test_a_client_that_stops_reading_cannot_hold_the_run_past_its_deadline():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(maxsize=1)
+        await events.put("unread")
+        with ThreadPoolExecutor(1) as pool:
+            start = time.monotonic()
+            put = await loop.run_in_executor(pool, main.put_from_thread, loop, events, "next", start + 0.3)
+            return put, time.monotonic() - start, events.qsize()
+
+    put, elapsed, size = asyncio.run(scenario())
+    assert put is False
+    assert 0.25 <= elapsed < 2
+    # the abandoned put does not land later
+    assert size == 1
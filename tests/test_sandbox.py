@@ -0,0 +1,356 @@
+"""Sandbox execution pool: framed pipe protocol, resource-limit statuses and pool lifecycle."""
+
+import contextlib
+import io
+import os
+import time
+
+import pytest
+
+from web_tutor import sandbox
+from web_tutor.grading import CompiledValidator
+from web_tutor.sandbox import ExecutionPool, FrameReader, SandboxLimits, write_frame
+
+pytestmark = pytest.mark.skipif(not sandbox.SANDBOX_AVAILABLE, reason="sandbox needs a POSIX platform")
+
+PROGRAMS = [
+    ('print("Hello, Python!")', []),
+    ("for i in range(5):\n    print(i, i * i)", []),
+    ('name = input("名字：")\nprint(f"你好，{name}")', ["小明"]),
+    ("a = int(input())\nb = int(input())\nprint(a + b)", ["3", "4"]),
+    ("print(repr(input()))", []),
+    ("import math\nprint(round(math.pi, 3))", []),
+    ('print("a", "b", sep="-", end="!")\nprint()', []),
+    ("def f(n):\n    return 1 if n < 2 else n * f(n - 1)\nprint(f(10))", []),
+    ('print("多位元組 ✓ " * 3)', []),
+]
+
+
+def run_in_process(code, inputs):
+    """Baseline behavior: exec in the server process with stdout captured by io.StringIO."""
+    stdout = io.StringIO()
+    values = iter(inputs)
+
+    def fake_input(prompt=""):
+        stdout.write(str(prompt))
+        return next(values, "")
+
+    with contextlib.redirect_stdout(stdout):
+        exec(code, {"__name__": "__main__", "input": fake_input})
+    return stdout.getvalue()
+
+
+@pytest.fixture(scope="module", params=["fork", "prefork"])
+def pool(request):
+    pool = ExecutionPool(2, SandboxLimits(cpu_seconds=2, wall_seconds=5), mode=request.param).start()
+    yield pool
+    pool.close()
+
+
+# --- Framing ---
+
+def test_frames_round_trip():
+    r, w = os.pipe()
+    try:
+        messages = [{"event": "ready"}, {"data": "中文 ✓"}, {"data": "x" * 200_000}]
+        # Small messages fit in the pipe buffer; the large one is written after the first two are read
+        write_frame(w, messages[0])
+        write_frame(w, messages[1])
+        reader = FrameReader(r)
+        assert reader.read(timeout=1) == messages[0]
+        assert reader.has_frame()
+        assert reader.read(timeout=1) == messages[1]
+        assert not reader.has_frame()
+    finally:
+        os.close(w)
+    assert reader.read(timeout=1) is None
+    os.close(r)
+
+
+def test_frame_split_across_reads():
+    r, w = os.pipe()
+    data = b'{"a":1}'
+    header = sandbox._FRAME_HEADER.pack(len(data))
+    reader = FrameReader(r)
+    os.write(w, header[:2])
+    with pytest.raises(TimeoutError):
+        reader.read(timeout=0.05)
+    os.write(w, header[2:] + data[:3])
+    with pytest.raises(TimeoutError):
+        reader.read(timeout=0.05)
+    os.write(w, data[3:])
+    assert reader.read(timeout=1) == {"a": 1}
+    os.close(w)
+    os.close(r)
+
+
+def test_oversized_frame_is_rejected():
+    r, w = os.pipe()
+    os.write(w, sandbox._FRAME_HEADER.pack(sandbox.MAX_FRAME_SIZE + 1))
+    with pytest.raises(ValueError):
+        FrameReader(r).read(timeout=1)
+    os.close(w)
+    os.close(r)
+
+
+# --- Execution ---
+
+@pytest.mark.parametrize("code, inputs", PROGRAMS)
+def test_stdout_matches_in_process_execution(pool, code, inputs):
+    result = pool.run(code, inputs)
+    assert result["status"] == "ok", result["stderr"]
+    assert result["stdout"] == run_in_process(code, inputs)
+    assert result["stderr"] == ""
+    assert result["truncated"] is False
+
+
+def test_runtime_error(pool):
+    result = pool.run("print('before')\n1 / 0")
+    assert result["status"] == "error"
+    assert result["stdout"] == "before\n"
+    assert "ZeroDivisionError" in result["stderr"]
+    # Only the student's frames are shown
+    assert "sandbox.py" not in result["stderr"]
+
+
+def test_syntax_error(pool):
+    result = pool.run("print('x'")
+    assert result["status"] == "error"
+    assert "SyntaxError" in result["stderr"]
+
+
+def test_nonzero_exit(pool):
+    result = pool.run("import sys\nsys.exit(3)")
+    assert result["status"] == "error"
+    assert "SystemExit: 3" in result["stderr"]
+    assert pool.run("import sys\nsys.exit(0)")["status"] == "ok"
+
+
+def test_wall_clock_timeout(pool):
+    start = time.monotonic()
+    result = pool.run("import time\ntime.sleep(30)", timeout=1)
+    assert result["status"] == "timeout"
+    assert time.monotonic() - start < 5
+    # The pool recovers: the next run gets a working worker
+    assert pool.run("print(1)")["stdout"] == "1\n"
+
+
+def test_cpu_limit(pool):
+    result = pool.run("while True:\n    pass", timeout=20)
+    assert result["status"] in ("cpu_limit", "error")
+    if result["status"] == "error":
+        # prefork workers re-arm RLIMIT_CPU; SIGXCPU may surface as a raised exception
+        assert "CPU" in result["stderr"] or "Killed" in result["stderr"]
+    assert pool.run("print(2)")["stdout"] == "2\n"
+
+
+def test_memory_limit(pool):
+    result = pool.run("x = bytearray(2 * 1024 ** 3)\nprint('allocated')")
+    assert result["status"] in ("error", "crashed")
+    assert "allocated" not in result["stdout"]
+
+
+def test_process_spawning_is_blocked(pool):
+    result = pool.run("import os\nos.system('echo hi')")
+    assert result["status"] == "error"
+    assert "PermissionError" in result["stderr"]
+
+
+@pytest.mark.parametrize("call", ["posix.fork()", "posix.system('echo hi')", "posix.posix_spawn('/bin/true', ['true'], {})"])
+def test_posix_module_cannot_spawn_either(pool, call):
+    result = pool.run(f"import posix\n{call}\nprint('spawned')")
+    assert result["status"] == "error"
+    assert "PermissionError" in result["stderr"]
+    assert "spawned" not in result["stdout"]
+
+
+@pytest.mark.parametrize("mode", ["fork", "prefork"])
+def test_workers_get_a_minimal_environment_and_an_empty_directory(monkeypatch, mode):
+    monkeypatch.setenv("SECRET_TOKEN", "do-not-leak")
+    with contextlib.closing(ExecutionPool(1, mode=mode).start()) as pool:
+        result = pool.run("import os\nprint(sorted(os.environ))\nprint(os.listdir('.'))")
+    environment, files = result["stdout"].splitlines()
+    assert "SECRET_TOKEN" not in environment
+    assert set(eval(environment)) <= {"PATH", "LANG", "LC_CTYPE"}
+    assert files == "[]"
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0, reason="switching users needs root")
+@pytest.mark.parametrize("mode", ["fork", "prefork"])
+def test_root_workers_switch_to_the_sandbox_user(mode):
+    with contextlib.closing(ExecutionPool(1, SandboxLimits(user="nobody"), mode=mode).start()) as pool:
+        result = pool.run("import os\nprint(os.getuid(), os.getgid(), os.getgroups())\nopen('notes.txt', 'w').write('x')")
+    assert result["status"] == "ok", result["stderr"]
+    assert result["stdout"] == "65534 65534 []\n"
+
+
+def test_runaway_output_stops_the_program(pool):
+    start = time.monotonic()
+    result = pool.run("while True:\n    print('x' * 100)")
+    assert result["status"] == "output_limit"
+    assert time.monotonic() - start < 5
+    assert result["truncated"] is True
+    assert len(result["stdout"].encode()) <= pool.limits.max_output + 200
+
+
+def test_globals_do_not_leak_between_runs(pool):
+    pool.run("leaked = 1")
+    assert pool.run("print('leaked' in globals())")["stdout"] == "False\n"
+
+
+def test_fork_mode_runs_start_from_a_clean_interpreter(pool):
+    if pool.mode != "fork":
+        pytest.skip("prefork workers share imported modules between runs")
+    pool.run("import math\nmath.pi = 3")
+    assert pool.run("import math\nprint(math.pi > 3)")["stdout"] == "True\n"
+
+
+def test_streaming_output(pool):
+    chunks = []
+    result = pool.run("for i in range(3):\n    print(i)", on_output=lambda stream, data: chunks.append((stream, data)))
+    assert result["status"] == "ok"
+    assert "".join(data for stream, data in chunks if stream == "stdout") == "0\n1\n2\n"
+
+
+# --- Early exit ---
+
+EXPECTED_COUNT = {"type": "stdout_equals", "expected_output": "0\n1\n2\n3\n4\n"}
+COUNTING = [
+    "for i in range(5):\n    print(i)",
+    "for i in range(1, 6):\n    print(i)",
+    "for i in range(6):\n    print(i)",
+    "for i in range(4):\n    print(i)",
+    "print('0 1 2 3 4')",
+    "print()\nfor i in range(5):\n    print(i)\nprint('   ')",
+    "for i in range(5):\n    print(i)\nprint('done')",
+]
+
+
+@pytest.mark.parametrize("code", COUNTING)
+def test_early_exit_gives_the_same_verdict_as_a_full_run(pool, code):
+    grader = CompiledValidator(EXPECTED_COUNT)
+    full = pool.run(code)
+    early = pool.run(code, expect=grader.expectation())
+    assert grader.grade(code, early)[0] == grader.grade(code, full)[0]
+    if early["status"] == "ok":
+        assert early["stdout"] == full["stdout"]
+    else:
+        # stopped before the end, with the output up to the divergence
+        assert early["status"] == "output_diverged"
+        assert full["stdout"].startswith(early["stdout"]) and early["stdout"] != full["stdout"]
+
+
+def test_diverged_program_is_stopped_at_once(pool):
+    start = time.monotonic()
+    result = pool.run("print(1)\nprint(9)\nimport time\ntime.sleep(30)", timeout=10,
+                      expect={"expected": "1\n2\n", "prefix": False})
+    assert result["status"] == "output_diverged"
+    assert result["stdout"].startswith("1\n9")
+    assert time.monotonic() - start < 5
+
+
+def test_student_except_does_not_hide_the_divergence(pool):
+    code = "try:\n    print('wrong')\nexcept BaseException:\n    pass\nprint('still running')"
+    result = pool.run(code, expect={"expected": "right", "prefix": False})
+    assert result["status"] == "output_diverged"
+    assert "still running" not in result["stdout"]
+
+
+# --- Test cases ---
+
+CASES = [["1", "2"], ["10", "-3"], ["7", "7"], ["0", "0"], ["123", "456"]]
+ADD = "a = int(input())\nb = int(input())\nprint(a + b)"
+
+
+def test_run_cases_match_one_run_per_case(pool):
+    results = pool.run_cases(ADD, CASES)
+    assert [result["stdout"] for result in results] == [run_in_process(ADD, inputs) for inputs in CASES]
+    assert all(result["status"] == "ok" for result in results)
+
+
+def test_run_cases_keep_case_order_under_parallelism(pool):
+    code = "import time\nn = int(input())\ntime.sleep((5 - n) * 0.05)\nprint(n)"
+    results = pool.run_cases(code, [[str(n)] for n in range(5)])
+    assert [result["stdout"] for result in results] == [f"{n}\n" for n in range(5)]
+
+
+def test_run_cases_syntax_error_reported_by_the_workers(pool, monkeypatch):
+    # the server process never compiles student code
+    def no_compile(*args, **kwargs):
+        raise AssertionError("compiled in the server process")
+
+    monkeypatch.setattr(sandbox, "compile", no_compile, raising=False)
+    results = pool.run_cases("print('x'", CASES[:3])
+    assert [result["status"] for result in results] == ["error"] * 3
+    assert all("SyntaxError" in result["stderr"] for result in results)
+
+
+def test_run_cases_stop_on_failure_skips_the_rest(pool):
+    check = lambda index, result: result["stdout"] != "7\n"
+    results = pool.run_cases("print(int(input()))", [["1"], ["7"], ["2"], ["3"], ["4"]],
+                             check=check, stop_on_failure=True, max_parallel=1)
+    assert [result["status"] for result in results] == ["ok", "ok", "skipped", "skipped", "skipped"]
+    # without stop_on_failure every case runs
+    results = pool.run_cases("print(int(input()))", [["1"], ["7"], ["2"]], check=check, max_parallel=1)
+    assert [result["stdout"] for result in results] == ["1\n", "7\n", "2\n"]
+
+
+def test_run_cases_without_cases():
+    assert ExecutionPool(1).run_cases("print(1)", []) == []
+
+
+# --- Pool lifecycle ---
+
+class FailingWorker:
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("sandbox worker failed to start")
+
+
+def test_start_raises_when_no_worker_starts(monkeypatch):
+    monkeypatch.setattr(sandbox, "SandboxWorker", FailingWorker)
+    pool = ExecutionPool(2)
+    with pytest.raises(RuntimeError):
+        pool.start()
+    assert pool.stats()["live"] == 0
+
+
+def test_dead_pool_fails_fast_and_recovers_with_backoff(monkeypatch):
+    pool = ExecutionPool(1, acquire_timeout=30).start()
+    try:
+        assert pool.stats()["live"] == 1
+        monkeypatch.setattr(sandbox, "SandboxWorker", FailingWorker)
+        pool._retire(pool._idle.get())
+        # The replacement fails in the background; wait for it to finish
+        deadline = time.monotonic() + 5
+        while pool.stats()["spawning"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        result = pool.run("print(1)")
+        assert result["status"] == "unavailable"
+        assert time.monotonic() - start < 2
+        stats = pool.stats()
+        assert stats["live"] == 0 and stats["spawn_failures"] >= 1
+
+        monkeypatch.undo()
+        time.sleep(pool.SPAWN_BACKOFF_MAX if stats["retry_in"] > 5 else stats["retry_in"] + 0.05)
+        result = pool.run("print(1)")
+        assert result["status"] == "ok"
+        assert pool.stats()["live"] == 1
+        assert pool.stats()["spawn_failures"] == 0
+    finally:
+        pool.close()
+
+
+def test_backoff_grows_between_failures(monkeypatch):
+    pool = ExecutionPool(1)
+    monkeypatch.setattr(sandbox, "SandboxWorker", FailingWorker)
+    delays = []
+    for _ in range(3):
+        pool._retry_at = 0.0
+        pool._replenish()
+        deadline = time.monotonic() + 5
+        while pool.stats()["spawning"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        delays.append(pool.stats()["retry_in"])
+    assert delays[0] < delays[1] < delays[2] <= pool.SPAWN_BACKOFF_MAX
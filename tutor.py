@@ -5,48 +5,35 @@ import sys
 import subprocess
 from io import StringIO
 
-# Import code analyzer for intelligent validation
-try:
-    from web_tutor.code_analyzer import analyze_code
-except ImportError:
-    # Fallback for direct import
-    import sys
-    from pathlib import Path
-    analyzer_path = Path(__file__).parent / "web_tutor" / "code_analyzer.py"
-    if analyzer_path.exists():
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("code_analyzer", analyzer_path)
-        analyzer_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(analyzer_module)
-        analyze_code = analyzer_module.analyze_code
-    else:
-        analyze_code = None
+# Grading is shared with the web server (see web_tutor/grading.py)
+from web_tutor.grading import compile_validator
+
+# Bounded output capture (a runaway print loop must not exhaust memory)
+from web_tutor.output_capture import BoundedOutput, OutputLimitExceeded
 
 # We will import the lessons from a separate file
 # 優先使用 web_tutor/lessons.py（最完整的課程列表）
 try:
-    # 先嘗試從 web_tutor 目錄導入（最完整）
-    import sys
-    from pathlib import Path
-    web_lessons_path = Path(__file__).parent / "web_tutor" / "lessons.py"
-    if web_lessons_path.exists():
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("web_lessons", web_lessons_path)
-        web_lessons_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(web_lessons_module)
-        LESSONS = web_lessons_module.LESSONS
-        print(f"✓ 已載入 {len(LESSONS)} 個課程（來自 web_tutor/lessons.py）")
-    else:
+    from web_tutor.lessons import LIBRARY
+    LESSONS = LIBRARY.snapshot.lessons
+    # Validators (with their structure checks) compiled when the lessons were loaded
+    GRADERS = LIBRARY.snapshot.graders
+    print(f"✓ 已載入 {len(LESSONS)} 個課程（來自 web_tutor/lessons.py）")
+except ImportError:
+    try:
         # 回退到根目錄的 lessons.py
         from lessons import LESSONS
         print(f"✓ 已載入 {len(LESSONS)} 個課程（來自 lessons.py）")
-except ImportError:
-    print("錯誤：找不到課程檔案或檔案中未定義 LESSONS。")
-    LESSONS = []
+    except ImportError:
+        print("錯誤：找不到課程檔案或檔案中未定義 LESSONS。")
+        LESSONS = []
 except Exception as e:
     print(f"錯誤：載入課程時發生問題：{e}")
     LESSONS = []
 
+if 'GRADERS' not in globals():
+    GRADERS = {}
+
 # Keep track of user's progress
 # In a real application, you'd save/load this from a file.
 progress = {
@@ -60,15 +47,18 @@ def clear_screen():
 def run_code(code_string):
     """
     Executes a string of Python code and captures its stdout, stderr, and any exceptions.
-    Returns a dictionary with 'stdout', 'stderr', and 'error'.
+    Returns a dictionary with 'stdout', 'stderr', and 'truncated'.
+    Output is capped (see web_tutor/output_capture.py); the program is stopped once it exceeds the cap.
     """
     old_stdout = sys.stdout
-    redirected_output = sys.stdout = StringIO()
+    redirected_output = sys.stdout = BoundedOutput(stop=True)
     error_output = StringIO()
     
     try:
         # Using a restricted globals dict for some safety
         exec(code_string, {'__builtins__': __builtins__})
+    except OutputLimitExceeded:
+        error_output.write(f"輸出超過 {redirected_output.limit} 位元組，程式已停止。請檢查是否有無窮迴圈一直在 print()。")
     except Exception as e:
         error_output.write(str(e))
     finally:
@@ -76,105 +66,22 @@ def run_code(code_string):
 
     return {
         "stdout": redirected_output.getvalue(),
-        "stderr": error_output.getvalue()
+        "stderr": error_output.getvalue(),
+        "truncated": redirected_output.truncated
     }
 
 def validate_answer(lesson, user_code):
     """
     Validates the user's code against the lesson's validator.
+    Grading uses the same compiled validator as the web server (web_tutor/grading.py).
     """
     validator = lesson.get('validator')
     if not validator:
         return True, "這個單元沒有自動驗證。"
 
+    grader = GRADERS.get(lesson.get('id')) or compile_validator(lesson)
     result = run_code(user_code)
-    
-    # Check for runtime errors first
-    if result['stderr']:
-        return False, f"您的程式碼產生了錯誤：\n{result['stderr']}"
-
-    # Check code structure requirements first (if any)
-    structure_passed = True
-    structure_feedback = []
-    code_requirements = validator.get("code_requirements", {})
-    
-    if code_requirements and analyze_code:
-        structure_passed, structure_feedback, code_summary = analyze_code(
-            user_code, 
-            code_requirements
-        )
-    
-    # Check validation type
-    validator_type = validator.get('type', 'no_error')
-    output_passed = False
-    output_message = ""
-    
-    if validator_type == 'stdout_equals':
-        expected = validator['expected_output']
-        actual = result['stdout']
-        if expected.strip() == actual.strip():
-            output_passed = True
-            output_message = "做得好！輸出結果完全正確！"
-        else:
-            output_passed = False
-            output_message = f"輸出結果不符。\n預期輸出：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---"
-    elif validator_type == 'stdout_contains':
-        expected = validator['expected_output']
-        actual = result['stdout']
-        if expected in actual:
-            output_passed = True
-            output_message = "輸出包含預期的內容！"
-        else:
-            output_passed = False
-            output_message = f"輸出未包含預期內容。\n預期包含：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---"
-    elif validator_type == 'stdout_ends_with':
-        expected = validator['expected_output']
-        actual = result['stdout']
-        if actual.endswith(expected):
-            output_passed = True
-            output_message = "輸出結尾符合題目要求！"
-        else:
-            output_passed = False
-            output_message = f"輸出結尾不符。\n預期結尾：\n---\n{expected}\n---\n您的輸出結尾：\n---\n{actual[-len(expected)-20:] if len(actual) > len(expected) else actual}\n---"
-    elif validator_type == 'stdout_starts_with':
-        expected = validator['expected_output']
-        actual = result['stdout']
-        if actual.startswith(expected):
-            output_passed = True
-            output_message = "輸出開頭符合題目要求！"
-        else:
-            output_passed = False
-            output_message = f"輸出開頭不符。\n預期開頭：\n---\n{expected}\n---\n您的輸出開頭：\n---\n{actual[:len(expected)+20]}\n---"
-    elif validator_type == 'no_error':
-        output_passed = True
-        output_message = "程式執行成功，沒有錯誤。"
-    else:
-        output_passed = True
-        output_message = "程式執行成功，沒有錯誤。"
-    
-    # Combine structure and output checks
-    is_correct = structure_passed and output_passed
-    
-    # Build comprehensive message
-    if output_passed and structure_passed:
-        return True, f"🎉 恭喜！{output_message}"
-    elif output_passed and not structure_passed:
-        message_parts = ["⚠️ 輸出結果正確，但程式寫法不符合題目要求：\n"]
-        message_parts.extend(structure_feedback)
-        message_parts.append("\n💡 請修改程式碼以符合題目的要求。")
-        return False, "\n".join(message_parts)
-    elif not output_passed and structure_passed:
-        message_parts = [output_message]
-        if structure_feedback:
-            message_parts.append("\n📝 程式結構檢查通過。")
-        return False, "\n".join(message_parts)
-    else:
-        message_parts = ["❌ 程式需要改進：\n"]
-        message_parts.append("輸出問題：")
-        message_parts.append(output_message)
-        message_parts.append("\n程式結構問題：")
-        message_parts.extend(structure_feedback)
-        return False, "\n".join(message_parts)
+    return grader.grade(user_code, result)
 
 
 def run_lesson(lesson):
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析資源上限
+限制單次代碼分析可使用的資源（原始碼大小、語法樹節點數、巢狀深度與時間），
+避免一份異常的提交（例如貼上 2 MB 的程式或極深的巢狀運算式）長時間佔用分析執行緒。
+
+超出上限時分析會提早停止，結果標記為 partial，並以 budget_exceeded 指出是哪一項限制。
+"""
+
+import os
+import time
+from typing import Optional
+
+# 超出上限的原因
+MAX_BYTES = "max_bytes"
+MAX_NODES = "max_nodes"
+MAX_DEPTH = "max_depth"
+TIME_LIMIT = "time_limit"
+
+
+class AnalysisBudget:
+    """單次分析的資源上限"""
+
+    __slots__ = ("max_bytes", "max_nodes", "max_depth", "time_limit")
+
+    def __init__(self, max_bytes: int = 100_000, max_nodes: int = 50_000, max_depth: int = 200,
+                 time_limit: float = 1.0):
+        """
+        Args:
+            max_bytes: 原始碼最大位元組數（UTF-8），超過時不解析
+            max_nodes: 語法樹最多節點數
+            max_depth: 語法樹最大深度
+            time_limit: 分析時間上限（秒）
+        """
+        self.max_bytes = max_bytes
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+
+    def deadline(self) -> float:
+        """從現在起算的截止時間（time.perf_counter() 的值）"""
+        return time.perf_counter() + self.time_limit
+
+    def source_exceeded(self, code: str) -> bool:
+        """原始碼是否超過 max_bytes（ASCII 為主的程式碼不需要實際編碼）"""
+        if len(code) > self.max_bytes:
+            return True
+        if len(code) * 4 <= self.max_bytes:
+            return False
+        return len(code.encode("utf-8", "surrogatepass")) > self.max_bytes
+
+    def describe(self, reason: Optional[str]) -> str:
+        """給學生看的說明"""
+        if reason == MAX_BYTES:
+            return f"程式碼太大（超過 {self.max_bytes // 1000} KB），未進行分析。"
+        if reason == MAX_NODES:
+            return f"程式碼太長（超過 {self.max_nodes} 個語法節點），只完成部分分析。"
+        if reason == MAX_DEPTH:
+            return f"程式碼的巢狀層數太深（超過 {self.max_depth} 層），只完成部分分析。"
+        if reason == TIME_LIMIT:
+            return f"分析時間超過 {self.time_limit:g} 秒，只完成部分分析。"
+        return ""
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+# 預設上限（可用環境變數調整）
+DEFAULT_BUDGET = AnalysisBudget(
+    max_bytes=_env_number("ANALYSIS_MAX_BYTES", 100_000, int),
+    max_nodes=_env_number("ANALYSIS_MAX_NODES", 50_000, int),
+    max_depth=_env_number("ANALYSIS_MAX_DEPTH", 200, int),
+    time_limit=_env_number("ANALYSIS_TIME_LIMIT", 1.0, float),
+)
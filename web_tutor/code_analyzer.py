@@ -6,31 +6,350 @@
 """
 
 import ast
+import itertools
+import json
+import os
 import re
-from typing import Dict, List, Tuple, Optional, Any
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, Any
+
+# Shared parse cache (one per process, see parse_cache.py)
+try:
+    from .parse_cache import parse_code
+except ImportError:
+    from parse_cache import parse_code
+
+# Per-rule timing (one registry per process, see rule_timing.py)
+try:
+    from .rule_timing import RULE_TIMINGS
+except ImportError:
+    from rule_timing import RULE_TIMINGS
+
+# Resource limits for a single analysis (see analysis_budget.py)
+try:
+    from .analysis_budget import DEFAULT_BUDGET, MAX_BYTES, MAX_DEPTH, MAX_NODES, TIME_LIMIT, AnalysisBudget
+except ImportError:
+    from analysis_budget import DEFAULT_BUDGET, MAX_BYTES, MAX_DEPTH, MAX_NODES, TIME_LIMIT, AnalysisBudget
+
+# Structural repetition detector used for forbids_hardcode (see repeated_code.py)
+try:
+    from .repeated_code import RepeatedBlock, find_repeated_blocks
+except ImportError:
+    from repeated_code import RepeatedBlock, find_repeated_blocks
+
+
+class CodeFacts:
+    """
+    走訪一次語法樹所收集的代碼事實
+    CodeAnalyzer 的查詢方法都由這份記錄回答，不需要再次走訪語法樹。
+    """
+    
+    __slots__ = (
+        "for_count", "while_count", "function_names", "has_if", "has_list_comprehension",
+        "names", "print_count", "has_import", "imported_modules", "from_modules", "exceeded",
+    )
+    
+    def __init__(self):
+        self.for_count = 0
+        self.while_count = 0
+        self.function_names: List[str] = []
+        self.has_if = False
+        self.has_list_comprehension = False
+        self.names = set()
+        self.print_count = 0
+        self.has_import = False
+        self.imported_modules = set()
+        self.from_modules = set()
+        # 走訪因超出 AnalysisBudget 而提早停止時，記錄超出的限制（此時其他欄位只涵蓋已走訪的部分）
+        self.exceeded: Optional[str] = None
+    
+    @property
+    def loop_count(self) -> int:
+        return self.for_count + self.while_count
+
+
+def extract_facts(tree: ast.AST, budget: Optional[AnalysisBudget] = None,
+                  deadline: Optional[float] = None) -> CodeFacts:
+    """
+    以單次走訪（與 ast.walk 相同的廣度優先順序，逐層進行）收集所有代碼事實
+    
+    Args:
+        tree: 已解析的語法樹
+        budget: 可選，節點數與深度的上限；超出時停止走訪並設定 facts.exceeded
+        deadline: 可選，time.perf_counter() 的截止時間（每走完一層檢查一次）
+    
+    Returns:
+        CodeFacts
+    """
+    facts = CodeFacts()
+    max_nodes = budget.max_nodes if budget is not None else None
+    max_depth = budget.max_depth if budget is not None else None
+    visited = 0
+    depth = 0
+    level = [tree]
+    while level:
+        depth += 1
+        visited += len(level)
+        if max_depth is not None and depth > max_depth:
+            facts.exceeded = MAX_DEPTH
+            break
+        if max_nodes is not None and visited > max_nodes:
+            facts.exceeded = MAX_NODES
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            facts.exceeded = TIME_LIMIT
+            break
+        next_level = []
+        for node in level:
+            next_level.extend(ast.iter_child_nodes(node))
+            node_type = type(node)
+            if node_type is ast.Name:
+                facts.names.add(node.id)
+            elif node_type is ast.Call:
+                if isinstance(node.func, ast.Name) and node.func.id == 'print':
+                    facts.print_count += 1
+            elif node_type is ast.For:
+                facts.for_count += 1
+            elif node_type is ast.While:
+                facts.while_count += 1
+            elif node_type is ast.If:
+                facts.has_if = True
+            elif node_type is ast.FunctionDef:
+                facts.function_names.append(node.name)
+            elif node_type is ast.ListComp:
+                facts.has_list_comprehension = True
+            elif node_type is ast.Import:
+                facts.has_import = True
+                facts.imported_modules.update(alias.name for alias in node.names)
+            elif node_type is ast.ImportFrom:
+                facts.has_import = True
+                facts.from_modules.add(node.module)
+        level = next_level
+    return facts
+
+
+class CheckPlan:
+    """
+    由 code_requirements 編譯出的檢查計畫
+    
+    設定只在編譯時解讀一次（例如把字串形式的 forbids_import 正規化成列表、預先產生反饋訊息），
+    每個檢查都是直接讀取 CodeFacts 的函數，並依成本由低到高排序執行。
+    反饋訊息仍依原本的檢查順序排列，因此結果與逐項解讀設定時相同。
+    """
+    
+    __slots__ = ("requirements", "checks")
+    
+    # 檢查成本：只讀取計數的檢查最便宜，需要比對名稱集合的次之，硬編碼偵測最貴
+    COST_COUNT = 0
+    COST_LOOKUP = 1
+    COST_HARDCODE = 2
+    
+    def __init__(self, requirements: Dict[str, Any]):
+        """
+        Args:
+            requirements: 課程 validator 的 code_requirements
+        """
+        self.requirements = requirements
+        checks = []
+        
+        def add(cost, rule, check):
+            # len(checks) 記錄原本的檢查順序，用於排列反饋訊息；rule 是計時用的名稱
+            checks.append((cost, len(checks), "check." + rule, check))
+        
+        # 檢查是否需要循環
+        if requirements.get("requires_loop", False):
+            loop_type = requirements.get("loop_type")
+            if loop_type == "for":
+                loop_feedback = [
+                    "❌ 此題目要求使用 for 循環，但您的代碼中沒有使用 for 循環。",
+                    "💡 提示：使用 for 循環可以讓代碼更簡潔，避免重複寫多行相似的代碼。",
+                ]
+            elif loop_type == "while":
+                loop_feedback = [
+                    "❌ 此題目要求使用 while 循環，但您的代碼中沒有使用 while 循環。",
+                    "💡 提示：while 循環適合在條件滿足時重複執行。",
+                ]
+            else:
+                loop_feedback = [
+                    "❌ 此題目要求使用循環（for 或 while），但您的代碼中沒有使用循環。",
+                    "💡 提示：使用循環可以讓代碼更簡潔，避免重複寫多行相似的代碼。",
+                ]
+            add(self.COST_COUNT, "requires_loop", lambda analyzer: None if analyzer.has_loop(loop_type) else loop_feedback)
+        
+        # 檢查是否禁止硬編碼
+        if requirements.get("forbids_hardcode", False):
+            def check_hardcode(analyzer):
+                repeated = analyzer.find_repeated_blocks()
+                if not repeated:
+                    return None
+                first = repeated[0]
+                if first.consecutive:
+                    location = f"📍 第 {first.start_line}～{first.end_line} 行是 {first.copies} 段結構相同的程式碼。"
+                else:
+                    location = f"📍 第 {first.start_line}～{first.end_line} 行的程式碼在其他地方又重複出現了 {first.copies - 1} 次。"
+                return [
+                    "❌ 檢測到硬編碼的寫法。雖然結果可能正確，但此題目要求使用更靈活的方法（如循環）。",
+                    location,
+                    "💡 提示：嘗試使用循環來處理重複的操作，這樣代碼更簡潔且易於維護。",
+                ]
+            add(self.COST_HARDCODE, "forbids_hardcode", check_hardcode)
+        
+        # 檢查是否需要函數
+        if requirements.get("requires_function", False):
+            function_name = requirements.get("function_name")
+            if function_name:
+                function_feedback = [f"❌ 此題目要求定義名為 '{function_name}' 的函數，但您的代碼中沒有找到。"]
+            else:
+                function_feedback = ["❌ 此題目要求定義函數，但您的代碼中沒有函數定義。"]
+            function_feedback.append("💡 提示：使用 def 關鍵字定義函數，例如：def my_function():")
+            add(self.COST_LOOKUP, "requires_function",
+                lambda analyzer: None if analyzer.has_function_definition(function_name) else function_feedback)
+        
+        # 檢查是否需要 if 語句
+        if requirements.get("requires_if", False):
+            if_feedback = [
+                "❌ 此題目要求使用 if 語句進行條件判斷，但您的代碼中沒有使用。",
+                "💡 提示：使用 if 語句可以根據條件執行不同的代碼。",
+            ]
+            add(self.COST_COUNT, "requires_if", lambda analyzer: None if analyzer.has_if_statement() else if_feedback)
+        
+        # 檢查是否需要特定變數
+        required_vars = list(requirements.get("requires_variable", []))
+        if required_vars:
+            def check_variables(analyzer):
+                missing_vars = [var for var in required_vars if not analyzer.has_variable(var)]
+                if not missing_vars:
+                    return None
+                return [
+                    f"❌ 此題目要求使用變數：{', '.join(missing_vars)}，但您的代碼中沒有找到。",
+                    "💡 提示：使用變數可以儲存和重用數據。",
+                ]
+            add(self.COST_LOOKUP, "requires_variable", check_variables)
+        
+        # 檢查循環數量限制
+        if "max_loops" in requirements:
+            max_loops = requirements["max_loops"]
+            
+            def check_max_loops(analyzer):
+                loop_count = analyzer.count_loops()
+                if loop_count > max_loops:
+                    return [f"❌ 此題目要求最多使用 {max_loops} 個循環，但您的代碼中有 {loop_count} 個。"]
+                return None
+            add(self.COST_COUNT, "max_loops", check_max_loops)
+        
+        if "min_loops" in requirements:
+            min_loops = requirements["min_loops"]
+            
+            def check_min_loops(analyzer):
+                loop_count = analyzer.count_loops()
+                if loop_count < min_loops:
+                    return [f"❌ 此題目要求至少使用 {min_loops} 個循環，但您的代碼中只有 {loop_count} 個。"]
+                return None
+            add(self.COST_COUNT, "min_loops", check_min_loops)
+        
+        # 檢查是否禁止使用某些功能
+        if "forbids_import" in requirements:
+            forbidden_imports = requirements["forbids_import"]
+            if isinstance(forbidden_imports, str):
+                forbidden_imports = [forbidden_imports]
+            forbidden_imports = list(forbidden_imports)
+            
+            def check_imports(analyzer):
+                used = [module for module in forbidden_imports if analyzer.has_import(module)]
+                if not used:
+                    return None
+                return [f"❌ 此題目不允許使用 {module} 模組，但您的代碼中使用了。" for module in used]
+            add(self.COST_LOOKUP, "forbids_import", check_imports)
+        
+        checks.sort(key=lambda item: (item[0], item[1]))
+        self.checks = tuple((order, rule, check) for _, order, rule, check in checks)
+    
+    def __bool__(self) -> bool:
+        return bool(self.checks)
+    
+    def run(self, analyzer: "CodeAnalyzer", short_circuit: bool = False) -> Tuple[bool, List[str]]:
+        """
+        對一份已分析的代碼執行檢查計畫
+        
+        Args:
+            analyzer: CodeAnalyzer
+            short_circuit: 遇到第一個不通過的檢查（依成本順序）就停止
+        
+        Returns:
+            (是否通過, 反饋訊息列表)
+        """
+        if analyzer.budget_exceeded:
+            # 只分析了一部分，無法判斷是否符合要求
+            return False, [f"⚠️ {analyzer.budget.describe(analyzer.budget_exceeded)}無法確認程式結構是否符合題目要求。"]
+        if not analyzer.tree:
+            return False, ["無法解析代碼，請檢查語法錯誤。"]
+        
+        failures = []
+        timings = RULE_TIMINGS if RULE_TIMINGS.enabled else None
+        for order, rule, check in self.checks:
+            if timings is None:
+                feedback = check(analyzer)
+            else:
+                start = time.perf_counter_ns()
+                feedback = check(analyzer)
+                timings.record(rule, time.perf_counter_ns() - start)
+            if feedback:
+                failures.append((order, feedback))
+                if short_circuit:
+                    break
+        failures.sort(key=lambda item: item[0])
+        return not failures, [line for _, feedback in failures for line in feedback]
 
 
 class CodeAnalyzer:
     """分析Python代碼的結構和模式"""
     
-    def __init__(self, code: str):
+    def __init__(self, code: str, budget: Optional[AnalysisBudget] = None):
         """
         初始化代碼分析器
         
         Args:
             code: 要分析的Python代碼字符串
+            budget: 資源上限（預設為 DEFAULT_BUDGET）；超出時分析提早停止，
+                budget_exceeded 記錄超出的限制，結果只涵蓋已分析的部分
         """
         self.code = code
         self.tree = None
+        self.facts = None
+        self._repeated_blocks = None
         self.errors = []
         self.warnings = []
+        self.budget = budget or DEFAULT_BUDGET
+        self.budget_exceeded: Optional[str] = None
+        self.deadline = self.budget.deadline()
+        
+        if self.budget.source_exceeded(code):
+            self._exceed(MAX_BYTES)
+            return
         
         try:
-            self.tree = ast.parse(code)
+            with RULE_TIMINGS.measure("analyzer.parse"):
+                self.tree = parse_code(code)
         except SyntaxError as e:
             self.errors.append(f"語法錯誤：{e.msg} (第 {e.lineno} 行)")
+        except (RecursionError, MemoryError):
+            # 解析器本身的巢狀上限（例如上萬層的 1+1+...）
+            self._exceed(MAX_DEPTH)
         except Exception as e:
             self.errors.append(f"解析錯誤：{str(e)}")
+        
+        if self.tree:
+            with RULE_TIMINGS.measure("analyzer.facts"):
+                self.facts = extract_facts(self.tree, self.budget, self.deadline)
+            if self.facts.exceeded:
+                self._exceed(self.facts.exceeded)
+    
+    def _exceed(self, reason: str) -> None:
+        self.budget_exceeded = reason
+        self.warnings.append(self.budget.describe(reason))
     
     def has_loop(self, loop_type: Optional[str] = None) -> bool:
         """
@@ -42,17 +361,15 @@ class CodeAnalyzer:
         Returns:
             如果找到指定類型的循環則返回 True
         """
-        if not self.tree:
+        if not self.facts:
             return False
         
-        for node in ast.walk(self.tree):
-            if loop_type == 'for' and isinstance(node, ast.For):
-                return True
-            elif loop_type == 'while' and isinstance(node, ast.While):
-                return True
-            elif loop_type is None and (isinstance(node, (ast.For, ast.While))):
-                return True
-        
+        if loop_type == 'for':
+            return self.facts.for_count > 0
+        if loop_type == 'while':
+            return self.facts.while_count > 0
+        if loop_type is None:
+            return self.facts.loop_count > 0
         return False
     
     def has_function_definition(self, function_name: Optional[str] = None) -> bool:
@@ -65,39 +382,20 @@ class CodeAnalyzer:
         Returns:
             如果找到指定函數則返回 True
         """
-        if not self.tree:
+        if not self.facts:
             return False
         
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.FunctionDef):
-                if function_name is None:
-                    return True
-                elif node.name == function_name:
-                    return True
-        
-        return False
+        if function_name is None:
+            return bool(self.facts.function_names)
+        return function_name in self.facts.function_names
     
     def has_if_statement(self) -> bool:
         """檢查代碼中是否包含 if 語句"""
-        if not self.tree:
-            return False
-        
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.If):
-                return True
-        
-        return False
+        return bool(self.facts and self.facts.has_if)
     
     def has_list_comprehension(self) -> bool:
         """檢查代碼中是否包含列表推導式"""
-        if not self.tree:
-            return False
-        
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.ListComp):
-                return True
-        
-        return False
+        return bool(self.facts and self.facts.has_list_comprehension)
     
     def has_variable(self, var_name: str) -> bool:
         """
@@ -109,54 +407,44 @@ class CodeAnalyzer:
         Returns:
             如果找到變數則返回 True
         """
-        if not self.tree:
-            return False
-        
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.Name) and node.id == var_name:
-                return True
-        
-        return False
+        return bool(self.facts and var_name in self.facts.names)
     
     def count_loops(self) -> int:
         """計算代碼中循環的數量"""
-        if not self.tree:
-            return 0
-        
-        count = 0
-        for node in ast.walk(self.tree):
-            if isinstance(node, (ast.For, ast.While)):
-                count += 1
-        
-        return count
+        return self.facts.loop_count if self.facts else 0
     
     def count_functions(self) -> int:
         """計算代碼中函數定義的數量"""
-        if not self.tree:
-            return 0
-        
-        count = 0
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.FunctionDef):
-                count += 1
-        
-        return count
+        return len(self.facts.function_names) if self.facts else 0
     
     def get_function_names(self) -> List[str]:
         """獲取所有定義的函數名稱"""
-        if not self.tree:
-            return []
-        
-        names = []
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.FunctionDef):
-                names.append(node.name)
+        return list(self.facts.function_names) if self.facts else []
+    
+    def find_repeated_blocks(self) -> List[RepeatedBlock]:
+        """
+        找出結構相同、重複出現的語句序列（只改了常數的複製貼上，見 repeated_code.py）
         
-        return names
+        第一次呼叫時計算，之後直接返回結果；超出資源上限時不計算（返回空列表）
+        """
+        if self._repeated_blocks is None:
+            if not self.tree or self.budget_exceeded:
+                self._repeated_blocks = []
+            elif time.perf_counter() > self.deadline:
+                self._exceed(TIME_LIMIT)
+                self._repeated_blocks = []
+            else:
+                try:
+                    with RULE_TIMINGS.measure("analyzer.hardcode_scan"):
+                        self._repeated_blocks = find_repeated_blocks(self.tree, deadline=self.deadline)
+                except TimeoutError:
+                    self._exceed(TIME_LIMIT)
+                    self._repeated_blocks = []
+        return self._repeated_blocks
     
     def has_hardcoded_values(self, pattern: Optional[str] = None) -> bool:
         """
-        檢查代碼中是否包含硬編碼的值（例如多個重複的 print 語句）
+        檢查代碼中是否包含硬編碼的值（例如多個結構相同的 print 語句）
         
         Args:
             pattern: 可選的正則表達式模式，用於匹配特定的硬編碼模式
@@ -164,31 +452,7 @@ class CodeAnalyzer:
         Returns:
             如果檢測到硬編碼模式則返回 True
         """
-        if not self.tree:
-            return False
-        
-        # 計算 print 語句的數量
-        print_count = 0
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.Call):
-                if isinstance(node.func, ast.Name) and node.func.id == 'print':
-                    print_count += 1
-        
-        # 如果有多個 print 語句且沒有循環，可能是硬編碼
-        if print_count > 3 and not self.has_loop():
-            return True
-        
-        # 檢查是否有重複的數字字面量（可能是硬編碼）
-        numbers = []
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
-                numbers.append(node.value)
-        
-        # 如果有很多重複的數字，可能是硬編碼
-        if len(numbers) > 5 and len(set(numbers)) < len(numbers) * 0.5:
-            return True
-        
-        return False
+        return bool(self.find_repeated_blocks())
     
     def has_import(self, module_name: Optional[str] = None) -> bool:
         """
@@ -200,25 +464,14 @@ class CodeAnalyzer:
         Returns:
             如果找到 import 則返回 True
         """
-        if not self.tree:
+        if not self.facts:
             return False
         
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.Import):
-                if module_name is None:
-                    return True
-                for alias in node.names:
-                    if alias.name == module_name:
-                        return True
-            elif isinstance(node, ast.ImportFrom):
-                if module_name is None:
-                    return True
-                if node.module == module_name:
-                    return True
-        
-        return False
+        if module_name is None:
+            return self.facts.has_import
+        return module_name in self.facts.imported_modules or module_name in self.facts.from_modules
     
-    def check_code_structure(self, requirements: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    def check_code_structure(self, requirements, short_circuit: bool = False) -> Tuple[bool, List[str]]:
         """
         根據要求檢查代碼結構
         
@@ -234,93 +487,16 @@ class CodeAnalyzer:
                     "requires_variable": ["i", "result"],  # 可選
                     "max_loops": 2,  # 可選
                     "min_loops": 1,  # 可選
+                    "forbids_import": ["os"],  # 可選
                 }
+                也可以直接傳入已編譯的 CheckPlan（課程載入時已編譯好，不必每次重新解讀）
+            short_circuit: 遇到第一個不通過的檢查就停止
         
         Returns:
             (是否通過, 反饋訊息列表)
         """
-        feedback = []
-        passed = True
-        
-        if not self.tree:
-            return False, ["無法解析代碼，請檢查語法錯誤。"]
-        
-        # 檢查是否需要循環
-        if requirements.get("requires_loop", False):
-            loop_type = requirements.get("loop_type")
-            if not self.has_loop(loop_type):
-                passed = False
-                if loop_type == "for":
-                    feedback.append("❌ 此題目要求使用 for 循環，但您的代碼中沒有使用 for 循環。")
-                    feedback.append("💡 提示：使用 for 循環可以讓代碼更簡潔，避免重複寫多行相似的代碼。")
-                elif loop_type == "while":
-                    feedback.append("❌ 此題目要求使用 while 循環，但您的代碼中沒有使用 while 循環。")
-                    feedback.append("💡 提示：while 循環適合在條件滿足時重複執行。")
-                else:
-                    feedback.append("❌ 此題目要求使用循環（for 或 while），但您的代碼中沒有使用循環。")
-                    feedback.append("💡 提示：使用循環可以讓代碼更簡潔，避免重複寫多行相似的代碼。")
-        
-        # 檢查是否禁止硬編碼
-        if requirements.get("forbids_hardcode", False):
-            if self.has_hardcoded_values():
-                passed = False
-                feedback.append("❌ 檢測到硬編碼的寫法。雖然結果可能正確，但此題目要求使用更靈活的方法（如循環）。")
-                feedback.append("💡 提示：嘗試使用循環來處理重複的操作，這樣代碼更簡潔且易於維護。")
-        
-        # 檢查是否需要函數
-        if requirements.get("requires_function", False):
-            function_name = requirements.get("function_name")
-            if not self.has_function_definition(function_name):
-                passed = False
-                if function_name:
-                    feedback.append(f"❌ 此題目要求定義名為 '{function_name}' 的函數，但您的代碼中沒有找到。")
-                else:
-                    feedback.append("❌ 此題目要求定義函數，但您的代碼中沒有函數定義。")
-                feedback.append("💡 提示：使用 def 關鍵字定義函數，例如：def my_function():")
-        
-        # 檢查是否需要 if 語句
-        if requirements.get("requires_if", False):
-            if not self.has_if_statement():
-                passed = False
-                feedback.append("❌ 此題目要求使用 if 語句進行條件判斷，但您的代碼中沒有使用。")
-                feedback.append("💡 提示：使用 if 語句可以根據條件執行不同的代碼。")
-        
-        # 檢查是否需要特定變數
-        required_vars = requirements.get("requires_variable", [])
-        if required_vars:
-            missing_vars = []
-            for var in required_vars:
-                if not self.has_variable(var):
-                    missing_vars.append(var)
-            if missing_vars:
-                passed = False
-                feedback.append(f"❌ 此題目要求使用變數：{', '.join(missing_vars)}，但您的代碼中沒有找到。")
-                feedback.append("💡 提示：使用變數可以儲存和重用數據。")
-        
-        # 檢查循環數量限制
-        if "max_loops" in requirements:
-            loop_count = self.count_loops()
-            if loop_count > requirements["max_loops"]:
-                passed = False
-                feedback.append(f"❌ 此題目要求最多使用 {requirements['max_loops']} 個循環，但您的代碼中有 {loop_count} 個。")
-        
-        if "min_loops" in requirements:
-            loop_count = self.count_loops()
-            if loop_count < requirements["min_loops"]:
-                passed = False
-                feedback.append(f"❌ 此題目要求至少使用 {requirements['min_loops']} 個循環，但您的代碼中只有 {loop_count} 個。")
-        
-        # 檢查是否禁止使用某些功能
-        if "forbids_import" in requirements:
-            forbidden_imports = requirements["forbids_import"]
-            if isinstance(forbidden_imports, str):
-                forbidden_imports = [forbidden_imports]
-            for module in forbidden_imports:
-                if self.has_import(module):
-                    passed = False
-                    feedback.append(f"❌ 此題目不允許使用 {module} 模組，但您的代碼中使用了。")
-        
-        return passed, feedback
+        plan = CheckPlan(requirements) if isinstance(requirements, dict) else requirements
+        return plan.run(self, short_circuit)
     
     def get_code_summary(self) -> Dict[str, Any]:
         """
@@ -332,10 +508,13 @@ class CodeAnalyzer:
         if not self.tree:
             return {
                 "valid": False,
-                "errors": self.errors
+                "errors": self.errors,
+                "warnings": self.warnings,
+                "partial": self.budget_exceeded is not None,
+                "budget_exceeded": self.budget_exceeded,
             }
         
-        return {
+        summary = {
             "valid": True,
             "has_loop": self.has_loop(),
             "has_for_loop": self.has_loop("for"),
@@ -348,30 +527,326 @@ class CodeAnalyzer:
             "function_names": self.get_function_names(),
             "has_hardcode": self.has_hardcoded_values(),
             "errors": self.errors,
-            "warnings": self.warnings
+            "warnings": self.warnings,
         }
+        # 超出資源上限時，上面的結果只涵蓋已分析的部分
+        summary["partial"] = self.budget_exceeded is not None
+        summary["budget_exceeded"] = self.budget_exceeded
+        return summary
 
 
-def analyze_code(code: str, requirements: Optional[Dict[str, Any]] = None) -> Tuple[bool, List[str], Dict[str, Any]]:
+def analyze_code(code: str, requirements=None, short_circuit: bool = False,
+                 budget: Optional[AnalysisBudget] = None) -> Tuple[bool, List[str], Dict[str, Any]]:
     """
     分析代碼並檢查是否符合要求
     
     Args:
         code: 要分析的Python代碼
-        requirements: 可選的檢查要求字典
+        requirements: 可選的檢查要求字典，或已編譯的 CheckPlan
+        short_circuit: 遇到第一個不通過的檢查就停止
+        budget: 資源上限（預設為 DEFAULT_BUDGET）；超出時摘要的 partial 為 True，有要求時不通過
     
     Returns:
         (是否通過結構檢查, 反饋訊息列表, 代碼摘要)
     """
-    analyzer = CodeAnalyzer(code)
+    analyzer = CodeAnalyzer(code, budget)
     summary = analyzer.get_code_summary()
     
     if requirements:
-        passed, feedback = analyzer.check_code_structure(requirements)
+        passed, feedback = analyzer.check_code_structure(requirements, short_circuit)
         return passed, feedback, summary
     else:
         return True, [], summary
 
 
+def _analyze_chunk(chunk: List[Tuple[str, Optional[Dict[str, Any]]]]) -> List[Tuple[bool, List[str], Dict[str, Any]]]:
+    """在工作行程中分析一批代碼；相同的要求只編譯一次 CheckPlan"""
+    plans = {}
+    results = []
+    for code, requirements in chunk:
+        plan = None
+        if requirements:
+            key = json.dumps(requirements, sort_keys=True, ensure_ascii=False)
+            plan = plans.get(key)
+            if plan is None:
+                plan = plans[key] = CheckPlan(requirements)
+        results.append(analyze_code(code, plan))
+    return results
+
+
+def _analyze_chunk_timed(chunk: List[Tuple[str, Optional[Dict[str, Any]]]]):
+    """開啟計時時使用的 _analyze_chunk：同時返回這一批在工作行程中的計時資料"""
+    RULE_TIMINGS.enable()
+    RULE_TIMINGS.reset()
+    return _analyze_chunk(chunk), RULE_TIMINGS.export()
+
+
+def analyze_code_batch(items: Iterable[Tuple[str, Any]], workers: Optional[int] = None,
+                       chunk_size: int = 200) -> Iterator[Tuple[bool, List[str], Dict[str, Any]]]:
+    """
+    以多個行程批次分析大量代碼
+    
+    items 依 chunk_size 分批送進行程池，結果依輸入順序逐一產出；同時處理中的批次數量有上限，
+    因此 items 可以是很長的迭代器（例如逐行讀取的檔案），不必一次載入記憶體。
+    開啟 RULE_TIMINGS 時，工作行程的計時資料會合併回目前行程。
+    
+    Args:
+        items: (代碼, 要求) 的迭代器；要求可以是 None、字典或 CheckPlan
+        workers: 行程數量（預設為 CPU 核心數）；1 表示在目前行程中依序分析
+        chunk_size: 每批的份數
+    
+    Returns:
+        analyze_code() 結果的迭代器，順序與 items 相同
+    """
+    workers = workers or os.cpu_count() or 1
+    # CheckPlan 含有閉包，無法傳給其他行程，改傳原始的要求字典
+    items = ((code, getattr(requirements, "requirements", requirements)) for code, requirements in items)
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+    
+    if workers == 1:
+        for chunk in chunks:
+            yield from _analyze_chunk(chunk)
+        return
+    
+    timed = RULE_TIMINGS.enabled
+    
+    def collect(future):
+        if not timed:
+            return future.result()
+        results, timings = future.result()
+        RULE_TIMINGS.merge(timings)
+        return results
+    
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(_analyze_chunk_timed if timed else _analyze_chunk, chunk))
+            # 每個行程最多預先排兩批，讓行程保持忙碌但不會讀入所有 items
+            if len(pending) >= workers * 2:
+                yield from collect(pending.popleft())
+        while pending:
+            yield from collect(pending.popleft())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _baseline_code_summary(tree: ast.AST) -> Dict[str, Any]:
+    """
+    單次走訪之前的 get_code_summary：每個查詢各自走訪一次語法樹，僅供 benchmark 比較
+    
+    has_loop() 三次、has_function_definition()、has_if_statement()、has_list_comprehension()、
+    count_loops()、count_functions()、get_function_names() 各走訪一次，
+    舊的 has_hardcoded_values() 再走訪兩到三次（print 計數、has_loop()、數字常數），最多共 12 次。
+    """
+    def walk_any(types):
+        return any(isinstance(node, types) for node in ast.walk(tree))
+    
+    def walk_count(types):
+        return sum(1 for node in ast.walk(tree) if isinstance(node, types))
+    
+    def has_hardcoded_values():
+        print_count = 0
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name) and node.func.id == 'print':
+                    print_count += 1
+        if print_count > 3 and not walk_any(loops):
+            return True
+        numbers = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+                numbers.append(node.value)
+        return len(numbers) > 5 and len(set(numbers)) < len(numbers) * 0.5
+    
+    loops = (ast.For, ast.While)
+    return {
+        "has_loop": walk_any(loops),
+        "has_for_loop": walk_any(ast.For),
+        "has_while_loop": walk_any(ast.While),
+        "has_function": walk_any(ast.FunctionDef),
+        "has_if": walk_any(ast.If),
+        "has_list_comprehension": walk_any(ast.ListComp),
+        "loop_count": walk_count(loops),
+        "function_count": walk_count(ast.FunctionDef),
+        "function_names": [node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)],
+        "has_hardcode": has_hardcoded_values(),
+    }
+
+
+# 硬編碼偵測已改為比對重複的語句結構（repeated_code.py），判斷結果與舊的啟發式規則不同，不列入一致性比較
+_BENCHMARK_CHANGED_KEYS = frozenset(("has_hardcode",))
+
+
+def sample_submission(blocks: int = 200) -> str:
+    """產生一份大型的測試用程式碼（每個區塊是一個含迴圈、條件與列表推導式的函數）"""
+    parts = []
+    for i in range(blocks):
+        parts.append(
+            f"def step_{i}(n):\n"
+            f"    total = 0\n"
+            f"    for k in range(n):\n"
+            f"        if k % 3 == {i % 3}:\n"
+            f"            total += k * {i}\n"
+            f"    return [x * x for x in range(total % 7)]\n"
+            f"\n"
+            f"print(step_{i}({i}))\n"
+        )
+    return "".join(parts)
+
+
+def benchmark(code: Optional[str] = None, repeat: int = 20) -> Dict[str, float]:
+    """
+    比較 get_code_summary() 的單次走訪與舊版逐項走訪的耗時（毫秒，取最佳值，不含解析）
+    
+    兩邊都計算完整的摘要：單次走訪包含重複結構的硬編碼偵測，舊版包含舊的硬編碼啟發式規則。
+    
+    Args:
+        code: 要分析的程式碼；預設使用 sample_submission()
+        repeat: 重複次數
+    
+    Returns:
+        {"nodes": ..., "single_pass_ms": ..., "repeated_walks_ms": ...}
+    """
+    if code is None:
+        code = sample_submission()
+    tree = ast.parse(code)
+    
+    def best_of(func):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+    
+    def single_pass():
+        analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+        analyzer.tree, analyzer.facts, analyzer.errors, analyzer.warnings = tree, extract_facts(tree), [], []
+        analyzer._repeated_blocks = None
+        analyzer.budget, analyzer.budget_exceeded, analyzer.deadline = DEFAULT_BUDGET, None, float("inf")
+        return analyzer.get_code_summary()
+    
+    # 兩種做法的結果必須一致，比較才有意義
+    summary = single_pass()
+    reference = _baseline_code_summary(tree)
+    mismatched = [key for key, value in reference.items()
+                  if key not in _BENCHMARK_CHANGED_KEYS and summary[key] != value]
+    if mismatched:
+        raise AssertionError(f"summary mismatch: {', '.join(mismatched)}")
+    
+    return {
+        "nodes": sum(1 for _ in ast.walk(tree)),
+        "single_pass_ms": best_of(single_pass),
+        "repeated_walks_ms": best_of(lambda: _baseline_code_summary(tree)),
+    }
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="代碼分析器工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="比較單次走訪與逐項走訪的分析時間")
+    bench_parser.add_argument("file", nargs="?", help="要分析的 Python 檔案（預設使用產生的大型程式碼）")
+    bench_parser.add_argument("--repeat", type=int, default=20, help="重複次數")
+    bench_parser.add_argument("--timings", action="store_true", help="結束時輸出每個規則的耗時統計")
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="批次分析 JSON Lines 檔案中的代碼",
+        description="每行輸入為 {\"id\": ..., \"code\": ..., \"requirements\": {...}} 或以 \"lesson_id\" 取代 requirements；"
+                    "每行輸出為 {\"id\", \"passed\", \"feedback\", \"summary\"}，順序與輸入相同",
+    )
+    batch_parser.add_argument("input", help="輸入檔案（- 表示標準輸入）")
+    batch_parser.add_argument("-o", "--output", help="輸出檔案（預設為標準輸出）")
+    batch_parser.add_argument("--workers", type=int, default=None, help="行程數量（預設為 CPU 核心數）")
+    batch_parser.add_argument("--chunk-size", type=int, default=200, help="每批送給行程的份數")
+    batch_parser.add_argument("--timings", action="store_true", help="結束時輸出每個規則的耗時統計（標準錯誤）")
+    args = parser.parse_args(argv)
+    
+    if args.timings:
+        RULE_TIMINGS.enable()
+    
+    if args.command == "batch":
+        status = _run_batch_cli(args)
+        if args.timings:
+            print(RULE_TIMINGS.format_table(), file=sys.stderr)
+        return status
+    
+    if args.command == "bench":
+        code = None
+        if args.file:
+            with open(args.file, encoding="utf-8") as f:
+                code = f.read()
+        result = benchmark(code, repeat=args.repeat)
+        print(f"語法樹節點：{result['nodes']}")
+        print(f"單次走訪  ：{result['single_pass_ms']:.2f} ms")
+        print(f"逐項走訪  ：{result['repeated_walks_ms']:.2f} ms")
+        if result["single_pass_ms"] > 0:
+            print(f"加速      ：{result['repeated_walks_ms'] / result['single_pass_ms']:.1f}x")
+        if args.timings:
+            # 以啟用所有規則的要求完整分析幾次，讓每個規則都有計時資料
+            plan = CheckPlan({
+                "requires_loop": True, "forbids_hardcode": True, "requires_function": True, "requires_if": True,
+                "requires_variable": ["total"], "max_loops": 1000, "min_loops": 1, "forbids_import": ["os"],
+            })
+            sample = code if code is not None else sample_submission()
+            for _ in range(args.repeat):
+                analyze_code(sample, plan)
+            print()
+            print(RULE_TIMINGS.format_table())
+
+
+def _load_lesson_requirements() -> Dict[str, Dict[str, Any]]:
+    """讀取所有課程的 code_requirements（lessons 會匯入本模組，因此在需要時才匯入）"""
+    try:
+        from .lessons import LIBRARY
+    except ImportError:
+        from lessons import LIBRARY
+    return {
+        lesson_id: plan.requirements
+        for lesson_id, plan in LIBRARY.snapshot.check_plans.items()
+    }
+
+
+def _run_batch_cli(args) -> int:
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output is None else open(args.output, "w", encoding="utf-8")
+    lesson_requirements = None
+    ids = deque()
+    
+    def read_items():
+        nonlocal lesson_requirements
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                code = record["code"]
+            except (ValueError, KeyError, TypeError):
+                raise SystemExit(f"第 {line_number} 行不是有效的記錄（需要包含 code 的 JSON 物件）")
+            requirements = record.get("requirements")
+            if requirements is None and record.get("lesson_id") is not None:
+                if lesson_requirements is None:
+                    lesson_requirements = _load_lesson_requirements()
+                requirements = lesson_requirements.get(record["lesson_id"])
+            ids.append(record.get("id", line_number))
+            yield code, requirements
+    
+    count = 0
+    start = time.perf_counter()
+    try:
+        for passed, feedback, summary in analyze_code_batch(read_items(), args.workers, args.chunk_size):
+            record = {"id": ids.popleft(), "passed": passed, "feedback": feedback, "summary": summary}
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"✓ 已分析 {count} 份代碼，耗時 {time.perf_counter() - start:.2f} 秒", file=sys.stderr)
+    return 0
 
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+語法樹指紋索引
+用於找出只改了變數名稱或常數的近似重複作業（抄襲偵測）。
+
+做法（winnowing，與 MOSS 相同的原理）：
+    1. 以深度優先順序把語法樹轉成節點類型的序列；使用者定義的名稱一律視為同一個符號，
+       常數只保留種類（數字、字串...），因此改名或改數字不會改變序列
+    2. 對序列中每 k 個連續節點計算雜湊（k-gram）
+    3. 在每 window 個連續的 k-gram 雜湊中選出最小值，作為這份作業的指紋
+    4. 反向索引記錄每個指紋出現在哪些作業中
+
+查詢一份作業時只需要看與它共享指紋的作業，不必和整個語料逐一比較。
+兩份作業只要有長度至少 k + window - 1 個節點的相同片段，就保證會共享至少一個指紋。
+
+用法：
+    python web_tutor/fingerprint.py report submissions.jsonl --threshold 0.8
+"""
+
+import ast
+import builtins
+import json
+import math
+import sys
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+# 指紋使用自己的解析快取：批次比對大量作業時不會擠掉伺服器共用快取（parse_cache.PARSE_CACHE）中的項目，
+# 全班繳交完全相同的程式碼時仍然只解析一次
+try:
+    from .parse_cache import ParseCache
+except ImportError:
+    from parse_cache import ParseCache
+
+
+DEFAULT_K = 5
+DEFAULT_WINDOW = 4
+
+# Load / Store / Del 只是名稱的用途標記，不屬於程式結構
+_SKIPPED_NODES = (ast.Load, ast.Store, ast.Del)
+
+# 內建函數（print、range、len...）的名稱無法透過改名隱藏，保留下來可以提高準確度
+_BUILTIN_NAMES = frozenset(name for name in dir(builtins) if not name.startswith("_"))
+
+_HASH_MASK = (1 << 64) - 1
+_HASH_BASE = 1000003
+
+_token_ids: Dict[str, int] = {}
+
+_PARSE_CACHE = ParseCache()
+
+
+def _literal_kind(value: Any) -> str:
+    if isinstance(value, bool) or value is None or value is Ellipsis:
+        return "singleton"
+    if isinstance(value, (int, float, complex)):
+        return "number"
+    if isinstance(value, str):
+        return "str"
+    return type(value).__name__
+
+
+def node_tokens(tree: ast.AST) -> List[str]:
+    """
+    以深度優先（前序）順序把語法樹轉成正規化後的節點序列
+
+    使用者定義的名稱（變數、函數、參數、屬性）只保留節點類型，常數只保留種類。
+    """
+    tokens = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, _SKIPPED_NODES):
+            continue
+        node_type = type(node)
+        if node_type is ast.Constant:
+            tokens.append("Constant:" + _literal_kind(node.value))
+        elif node_type is ast.Name and node.id in _BUILTIN_NAMES:
+            tokens.append("Name:" + node.id)
+        else:
+            tokens.append(node_type.__name__)
+        children = list(ast.iter_child_nodes(node))
+        children.reverse()
+        stack.extend(children)
+    return tokens
+
+
+def _token_id(token: str) -> int:
+    # crc32 在不同行程中結果相同（內建的 hash() 對字串會隨機化）
+    token_id = _token_ids.get(token)
+    if token_id is None:
+        token_id = _token_ids[token] = zlib.crc32(token.encode("utf-8"))
+    return token_id
+
+
+def kgram_hashes(tokens: List[str], k: int = DEFAULT_K) -> List[int]:
+    """每 k 個連續節點的滾動雜湊；序列短於 k 時以整個序列計算一個雜湊"""
+    ids = [_token_id(token) for token in tokens]
+    if not ids:
+        return []
+    k = min(k, len(ids))
+    power = pow(_HASH_BASE, k - 1, 1 << 64)
+    value = 0
+    for token_id in ids[:k]:
+        value = (value * _HASH_BASE + token_id) & _HASH_MASK
+    hashes = [value]
+    for i in range(k, len(ids)):
+        value = ((value - ids[i - k] * power) * _HASH_BASE + ids[i]) & _HASH_MASK
+        hashes.append(value)
+    return hashes
+
+
+def winnow(hashes: List[int], window: int = DEFAULT_WINDOW) -> FrozenSet[int]:
+    """
+    Winnowing：在每 window 個連續雜湊中選出最小值（相同時取最右邊的）
+
+    Returns:
+        被選出的雜湊集合
+    """
+    if not hashes:
+        return frozenset()
+    if len(hashes) <= window:
+        return frozenset((min(hashes),))
+    selected = set()
+    min_pos = -1
+    for end in range(window - 1, len(hashes)):
+        start = end - window + 1
+        if min_pos < start:
+            # 上一個最小值已經離開視窗，重新在整個視窗中尋找
+            min_pos = start
+            for pos in range(start + 1, end + 1):
+                if hashes[pos] <= hashes[min_pos]:
+                    min_pos = pos
+            selected.add(hashes[min_pos])
+        elif hashes[end] <= hashes[min_pos]:
+            min_pos = end
+            selected.add(hashes[min_pos])
+    return frozenset(selected)
+
+
+def fingerprint_tree(tree: ast.AST, k: int = DEFAULT_K, window: int = DEFAULT_WINDOW) -> FrozenSet[int]:
+    """計算語法樹（例如 CodeAnalyzer.tree）的指紋集合"""
+    return winnow(kgram_hashes(node_tokens(tree), k), window)
+
+
+def fingerprint_code(code: str, k: int = DEFAULT_K, window: int = DEFAULT_WINDOW) -> FrozenSet[int]:
+    """計算程式碼的指紋集合；有語法錯誤或巢狀太深而無法解析時返回空集合"""
+    try:
+        tree = _PARSE_CACHE.parse(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return frozenset()
+    return fingerprint_tree(tree, k, window)
+
+
+class FingerprintIndex:
+    """
+    作業指紋的反向索引
+
+    add() 加入作業，query() 找出與一份作業相似的已收錄作業，report() 產生全班的相似配對。
+    相似度為兩份作業指紋集合的 Jaccard 係數（共享指紋數 / 聯集大小）。
+    """
+
+    def __init__(self, k: int = DEFAULT_K, window: int = DEFAULT_WINDOW):
+        """
+        Args:
+            k: k-gram 的節點數
+            window: winnowing 視窗大小
+        """
+        self.k = k
+        self.window = window
+        self.documents: Dict[Hashable, FrozenSet[int]] = {}
+        self.postings: Dict[int, set] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def fingerprint(self, code: Optional[str] = None, tree: Optional[ast.AST] = None) -> FrozenSet[int]:
+        if tree is not None:
+            return fingerprint_tree(tree, self.k, self.window)
+        return fingerprint_code(code or "", self.k, self.window)
+
+    def add(self, doc_id: Hashable, code: Optional[str] = None, tree: Optional[ast.AST] = None,
+            fingerprints: Optional[FrozenSet[int]] = None) -> FrozenSet[int]:
+        """
+        收錄一份作業（相同 doc_id 會取代舊的內容）
+
+        Args:
+            doc_id: 作業識別碼
+            code / tree / fingerprints: 程式碼、已解析的語法樹或已計算的指紋（三擇一，提供後兩者時不再解析 code）
+
+        Returns:
+            這份作業的指紋集合
+        """
+        self.remove(doc_id)
+        if fingerprints is None:
+            fingerprints = self.fingerprint(code, tree)
+        self.documents[doc_id] = fingerprints
+        for value in fingerprints:
+            self.postings[value].add(doc_id)
+        return fingerprints
+
+    def remove(self, doc_id: Hashable) -> None:
+        fingerprints = self.documents.pop(doc_id, None)
+        if fingerprints is None:
+            return
+        for value in fingerprints:
+            posting = self.postings[value]
+            posting.discard(doc_id)
+            if not posting:
+                del self.postings[value]
+
+    def query(self, code: Optional[str] = None, tree: Optional[ast.AST] = None,
+              fingerprints: Optional[FrozenSet[int]] = None, threshold: float = 0.5,
+              limit: Optional[int] = 10, exclude: Optional[Hashable] = None) -> List[Tuple[Hashable, float]]:
+        """
+        找出與一份作業相似的已收錄作業
+
+        相似度達到 threshold 的作業至少共享 ceil(threshold * n) 個指紋（n 為查詢的指紋數），
+        因此只要在最少見的 n - ceil(threshold * n) + 1 個指紋的索引中尋找候選作業（prefix filtering），
+        幾乎每份作業都有的常見指紋不會被掃描，成本與語料大小無關。
+
+        Args:
+            code / tree / fingerprints: 要查詢的作業（三擇一）
+            threshold: 最低相似度
+            limit: 最多返回幾份（None 表示全部）
+            exclude: 要排除的 doc_id（例如查詢已收錄的作業本身）
+
+        Returns:
+            [(doc_id, 相似度)]，依相似度由高到低排序
+        """
+        if fingerprints is None:
+            fingerprints = self.fingerprint(code, tree)
+        if not fingerprints:
+            return []
+        postings = self.postings
+        required = max(1, math.ceil(threshold * len(fingerprints) - 1e-9))
+        prefix = sorted(fingerprints, key=lambda value: len(postings.get(value, ())))
+        candidates = set()
+        for value in prefix[:len(fingerprints) - required + 1]:
+            posting = postings.get(value)
+            if posting:
+                candidates.update(posting)
+        candidates.discard(exclude)
+
+        matches = []
+        size = len(fingerprints)
+        # 指紋數相差太多的作業不可能達到 threshold
+        min_size, max_size = threshold * size - 1e-9, (size / threshold + 1e-9) if threshold > 0 else math.inf
+        for doc_id in candidates:
+            other = self.documents[doc_id]
+            if not min_size <= len(other) <= max_size:
+                continue
+            shared = len(fingerprints & other)
+            similarity = shared / (size + len(other) - shared)
+            if similarity >= threshold:
+                matches.append((doc_id, similarity))
+        matches.sort(key=lambda match: -match[1])
+        return matches if limit is None else matches[:limit]
+
+    def report(self, threshold: float = 0.8) -> List[Tuple[Hashable, Hashable, float]]:
+        """
+        全班相似度報告
+
+        依指紋的出現次數由少到多排序後，每份作業只把最少見的前綴放進暫時的索引，
+        再以同樣的前綴查詢之前的作業；相似度達到 threshold 的兩份作業，前綴必定有交集。
+
+        Returns:
+            [(doc_a, doc_b, 相似度)]，每一對只出現一次（doc_a 先被收錄），依相似度由高到低排序
+        """
+        postings = self.postings
+
+        def rarity(value):
+            return len(postings[value]), value
+
+        order = {}
+        prefix_index: Dict[int, List[Hashable]] = defaultdict(list)
+        pairs = []
+        for doc_id, fingerprints in self.documents.items():
+            order[doc_id] = len(order)
+            size = len(fingerprints)
+            if not size:
+                continue
+            required = max(1, math.ceil(threshold * size - 1e-9))
+            prefix = sorted(fingerprints, key=rarity)[:size - required + 1]
+            candidates = set()
+            for value in prefix:
+                candidates.update(prefix_index[value])
+            min_size = threshold * size - 1e-9
+            for other_id in candidates:
+                other = self.documents[other_id]
+                if len(other) < min_size or len(other) * threshold > size + 1e-9:
+                    continue
+                shared = len(fingerprints & other)
+                similarity = shared / (size + len(other) - shared)
+                if similarity >= threshold:
+                    pairs.append((other_id, doc_id, similarity))
+            for value in prefix:
+                prefix_index[value].append(doc_id)
+        pairs.sort(key=lambda pair: (-pair[2], order[pair[0]], order[pair[1]]))
+        return pairs
+
+    def clusters(self, threshold: float = 0.8) -> List[List[Hashable]]:
+        """把相似度達到 threshold 的作業連成群組（只返回兩份以上的群組）"""
+        parent = {}
+
+        def find(doc_id):
+            root = doc_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while doc_id != root:
+                parent[doc_id], doc_id = root, parent.get(doc_id, doc_id)
+            return root
+
+        for doc_a, doc_b, _ in self.report(threshold):
+            parent.setdefault(doc_a, doc_a)
+            parent.setdefault(doc_b, doc_b)
+            root_a, root_b = find(doc_a), find(doc_b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        groups = defaultdict(list)
+        for doc_id in self.documents:
+            if doc_id in parent:
+                groups[find(doc_id)].append(doc_id)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="語法樹指紋：近似重複作業偵測")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser(
+        "report",
+        help="產生全班相似度報告",
+        description="輸入為 JSON Lines，每行 {\"id\": ..., \"code\": ..., \"lesson_id\": ...}；"
+                    "同一個 lesson_id 的作業互相比較",
+    )
+    report_parser.add_argument("input", help="輸入檔案（- 表示標準輸入）")
+    report_parser.add_argument("--threshold", type=float, default=0.8, help="列出的最低相似度")
+    report_parser.add_argument("-k", type=int, default=DEFAULT_K, help="k-gram 的節點數")
+    report_parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="winnowing 視窗大小")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    start = time.perf_counter()
+    indexes: Dict[Any, FingerprintIndex] = {}
+    skipped = []
+    try:
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                code = record["code"]
+            except (ValueError, KeyError, TypeError):
+                raise SystemExit(f"第 {line_number} 行不是有效的記錄（需要包含 code 的 JSON 物件）")
+            doc_id = record.get("id", line_number)
+            fingerprints = fingerprint_code(code, args.k, args.window)
+            if not fingerprints:
+                # 語法錯誤或巢狀太深而無法解析的作業不列入比較
+                skipped.append(doc_id)
+                continue
+            lesson_id = record.get("lesson_id")
+            if lesson_id not in indexes:
+                indexes[lesson_id] = FingerprintIndex(args.k, args.window)
+            indexes[lesson_id].add(doc_id, fingerprints=fingerprints)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    total = 0
+    for lesson_id, index in indexes.items():
+        pairs = index.report(args.threshold)
+        total += len(index)
+        print(f"== 課程 {lesson_id if lesson_id is not None else '（未指定）'}：{len(index)} 份作業，{len(pairs)} 組相似")
+        for members in index.clusters(args.threshold):
+            print(f"   群組：{', '.join(str(member) for member in members)}")
+        for doc_a, doc_b, similarity in pairs:
+            print(f"   {similarity:.2f}  {doc_a}  {doc_b}")
+    if skipped:
+        print(f"⚠️ 略過 {len(skipped)} 份無法解析的作業：{', '.join(str(doc_id) for doc_id in skipped)}", file=sys.stderr)
+    print(f"✓ 已比對 {total} 份作業，耗時 {time.perf_counter() - start:.2f} 秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
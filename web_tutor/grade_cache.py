@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+評分執行結果快取
+同一堂課中大量學生提交完全相同、或只差在空白與註解的程式碼（例如 Hello, Python!），
+這些提交只需要在沙盒中執行一次。
+
+鍵為 (課程 validator 的內容雜湊, 正規化的程式碼, 執行選項與輸入值)，正規化的程式碼是 ast.unparse(語法樹)：
+空白、註解、括號與引號的寫法不同都會得到相同的鍵。validator 改變（預期輸出、test_inputs）時鍵也會改變。
+
+快取的是沙盒的執行結果（stdout、status...）而不是評分訊息：結構檢查與輸出比對仍對每份提交重新進行
+（成本很低），訊息中的行號因此永遠對應學生自己的程式碼。
+
+不快取：
+    - 無法解析或超過分析資源上限的程式碼（ast.unparse 對極深的語法樹會遞迴過深）
+    - 使用 input() 的程式，以及結果可能每次不同的程式：匯入不在 DETERMINISTIC_MODULES 中的模組、
+      使用 id()/hash()/open()/eval()/object() 等內建函數、集合（字串的雜湊值每個行程不同，集合的順序也不同）、
+      dict 的 keys()/items() 之間的集合運算（結果也是集合），或使用 __dunder__ 名稱與屬性
+      （例如 __builtins__['__import__'] 可以繞過匯入與內建函數的檢查）
+    - 執行錯誤（traceback 中有行號）、逾時等與環境有關的結果，以及輸出中有記憶體位址的結果
+      （例如 print(f) 印出的 <function f at 0x7f...>，沒有 __repr__ 的物件也一樣）
+"""
+
+import ast
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    from .analysis_budget import DEFAULT_BUDGET, AnalysisBudget
+    from .parse_cache import parse_code
+except ImportError:
+    from analysis_budget import DEFAULT_BUDGET, AnalysisBudget
+    from parse_cache import parse_code
+
+# 輸出只取決於程式本身的標準函式庫模組
+DETERMINISTIC_MODULES = frozenset((
+    "math", "cmath", "string", "collections", "itertools", "functools", "operator", "fractions",
+    "decimal", "statistics", "re", "json", "copy", "heapq", "bisect", "typing", "dataclasses",
+    "enum", "abc", "textwrap", "array",
+))
+
+# 會讀取外部狀態、產生與行程有關的結果，或可以繞過上面檢查的內建函數
+NONDETERMINISTIC_BUILTINS = frozenset((
+    "input", "open", "id", "hash", "set", "frozenset", "eval", "exec", "compile", "__import__",
+    "globals", "locals", "vars", "breakpoint", "help", "memoryview", "getattr", "setattr", "object",
+))
+
+# 結果是集合的 dict 檢視（d.keys() & e.keys() 的順序取決於雜湊值）與會產生集合的運算
+_SET_VIEWS = frozenset(("keys", "items"))
+_SET_OPERATORS = (ast.BitAnd, ast.BitOr, ast.BitXor, ast.Sub)
+
+# 預設 repr 中的記憶體位址（<function f at 0x7f...>、<__main__.A object at 0x...>）
+_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+
+# 可以快取的執行結果狀態（error 的 traceback 含有行號；timeout 等與機器負載有關）
+CACHEABLE_STATUSES = frozenset(("ok", "output_diverged", "output_limit"))
+
+
+def _is_set_view(node: ast.AST, view_names: set) -> bool:
+    """node 是否為 d.keys() / d.items()，或被指定為它們的變數"""
+    if isinstance(node, ast.Call):
+        return isinstance(node.func, ast.Attribute) and node.func.attr in _SET_VIEWS
+    return isinstance(node, ast.Name) and node.id in view_names
+
+
+def canonical_code(code: str, budget: Optional[AnalysisBudget] = None) -> Optional[str]:
+    """
+    程式碼的正規形式（ast.unparse）
+
+    Returns:
+        正規化的程式碼；無法解析、超過資源上限或執行結果可能每次不同時返回 None
+    """
+    budget = budget or DEFAULT_BUDGET
+    if budget.source_exceeded(code):
+        return None
+    try:
+        tree = parse_code(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+    nodes = 0
+    # 指定為 dict 檢視的變數名稱，以及集合運算子兩邊的運算元（走訪結束後再檢查）
+    view_names = set()
+    set_operands = []
+    for node in ast.walk(tree):
+        nodes += 1
+        if nodes > budget.max_nodes:
+            return None
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] not in DETERMINISTIC_MODULES for alias in node.names):
+                return None
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or (node.module or "").split(".")[0] not in DETERMINISTIC_MODULES:
+                return None
+        elif isinstance(node, ast.Name):
+            if node.id in NONDETERMINISTIC_BUILTINS or (node.id.startswith("__") and node.id.endswith("__")):
+                return None
+        elif isinstance(node, ast.Attribute):
+            if node.attr.startswith("__") and node.attr.endswith("__"):
+                return None
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return None
+        elif isinstance(node, ast.Assign):
+            if _is_set_view(node.value, ()):
+                view_names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+        elif isinstance(node, ast.BinOp):
+            if isinstance(node.op, _SET_OPERATORS):
+                set_operands += (node.left, node.right)
+        elif isinstance(node, ast.AugAssign):
+            if isinstance(node.op, _SET_OPERATORS):
+                set_operands += (node.target, node.value)
+    if any(_is_set_view(operand, view_names) for operand in set_operands):
+        return None
+    try:
+        return ast.unparse(tree)
+    except (RecursionError, MemoryError, ValueError):
+        return None
+
+
+class GradeCache:
+    """有容量上限的 LRU 執行結果快取（執行緒安全）"""
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Args:
+            maxsize: 最多保留的項目數量（0 表示停用）
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # 無法快取的提交（見模組說明）
+        self.uncacheable = 0
+        self._entries: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, version: str, code: str, *options: Any) -> Optional[bytes]:
+        """
+        快取鍵
+
+        Args:
+            version: 課程 validator 的內容雜湊（CompiledValidator.version）
+            code: 學生程式碼
+            *options: 影響執行結果的其他選項（例如 input() 的輸入值）
+
+        Returns:
+            快取鍵；程式碼不能快取時返回 None
+        """
+        if not self.maxsize:
+            return None
+        canonical = canonical_code(code)
+        if canonical is None:
+            with self._lock:
+                self.uncacheable += 1
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (version, repr(options), canonical):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """取得快取的執行結果（新的 dict）；沒有時返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(entry)
+
+    def put(self, key: bytes, result: Dict[str, Any]) -> bool:
+        """
+        儲存執行結果；結果不能快取（執行錯誤、逾時、輸出中有記憶體位址...）時不儲存
+
+        Returns:
+            是否已儲存
+        """
+        status = result.get("status")
+        if status not in CACHEABLE_STATUSES:
+            return False
+        if status in ("ok", "output_diverged") and result.get("stderr"):
+            return False
+        if any(_ADDRESS_RE.search(result.get(stream) or "") for stream in ("stdout", "stderr")):
+            return False
+        entry = dict(result)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計（hit_rate 只計算可以快取的提交，cacheable_rate 是可以快取的比例）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            total = lookups + self.uncacheable
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "cacheable_rate": lookups / total if total else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.uncacheable = 0
+
+
+# 整個行程共用一個快取（GRADE_CACHE_SIZE 可調整容量，0 表示停用）
+GRADE_CACHE = GradeCache(int(os.environ.get("GRADE_CACHE_SIZE", "1024") or 0))
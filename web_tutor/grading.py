@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+伺服器端評分
+根據課程的 validator 判斷一次執行結果是否正確
+
+每個課程的 validator 在載入時編譯成一個 CompiledValidator（見 lessons.LessonSnapshot.graders）：
+比較方式只選擇一次、預期輸出預先去除頭尾空白、結構檢查使用已編譯的 CheckPlan，
+因此評分只需要一次執行加上一次比較。命令列教學（tutor.py）、/api/run_code 與 /api/grade 共用同一份評分邏輯。
+
+測試案例：validator 的 test_inputs / expected_output 是第一個案例，test_cases 可以再加上更多案例
+（[{"inputs": [...], "expected_output": "...", "hidden": true}, ...]，比較方式與第一個案例相同）；
+stop_on_failure 為 true 時第一個未通過的案例之後不再執行其他案例。多個案例由
+ExecutionPool.run_cases() 並行執行，再以 grade_cases() 評分。
+
+提前結束：stdout_equals / stdout_starts_with 的預期輸出事先已知，expectation() 提供給沙盒的 expect，
+輸出一確定不符就停止程式（status 為 output_diverged），評分結果與執行到結束時相同。
+
+version 是 validator 內容的雜湊，validator 改變時執行結果的快取（grade_cache.py）就不再使用。
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Import code analyzer for intelligent validation
+try:
+    from .code_analyzer import CheckPlan, CodeAnalyzer
+except ImportError:
+    from code_analyzer import CheckPlan, CodeAnalyzer
+
+
+NO_ERROR_MESSAGE = "程式執行成功，沒有錯誤。"
+
+
+def _equals(expected: str) -> Callable[[str], bool]:
+    return expected.__eq__
+
+
+def _contains(expected: str) -> Callable[[str], bool]:
+    return lambda actual: expected in actual
+
+
+def _ends_with(expected: str) -> Callable[[str], bool]:
+    return lambda actual: actual.endswith(expected)
+
+
+def _starts_with(expected: str) -> Callable[[str], bool]:
+    return lambda actual: actual.startswith(expected)
+
+
+# 可以在執行中逐段比對的類型 -> 是否只比對開頭（見 output_capture.ExpectedOutput）
+_INCREMENTAL = {"stdout_equals": False, "stdout_starts_with": True}
+
+DIVERGED_NOTE = "⏹️ 輸出已確定與預期不符，程式已提前停止。"
+
+# validator 類型 -> (建立比較函數, 通過訊息, 失敗訊息的格式)
+# 失敗訊息中的 {actual} 依類型截取：結尾比較只顯示輸出結尾，開頭比較只顯示輸出開頭
+_COMPARISONS = {
+    "stdout_equals": (
+        _equals,
+        "做得好！輸出結果完全正確！",
+        "輸出結果不符。\n預期輸出：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---",
+    ),
+    "stdout_contains": (
+        _contains,
+        "輸出包含預期的內容！",
+        "輸出未包含預期內容。\n預期包含：\n---\n{expected}\n---\n您的輸出：\n---\n{actual}\n---",
+    ),
+    "stdout_ends_with": (
+        _ends_with,
+        "輸出結尾符合題目要求！",
+        "輸出結尾不符。\n預期結尾：\n---\n{expected}\n---\n您的輸出結尾：\n---\n{actual}\n---",
+    ),
+    "stdout_starts_with": (
+        _starts_with,
+        "輸出開頭符合題目要求！",
+        "輸出開頭不符。\n預期開頭：\n---\n{expected}\n---\n您的輸出開頭：\n---\n{actual}\n---",
+    ),
+}
+
+
+class TestCase:
+    """一個測試案例：輸入值與預先去除頭尾空白的預期輸出"""
+
+    __slots__ = ("inputs", "expected", "hidden", "compare")
+
+    def __init__(self, inputs: List[str], expected: str, hidden: bool, compare: Optional[Callable[[str], bool]]):
+        self.inputs = inputs
+        self.expected = expected
+        # 隱藏的案例不會在訊息中顯示輸入與預期輸出
+        self.hidden = hidden
+        self.compare = compare
+
+
+class CompiledValidator:
+    """
+    編譯好的課程 validator
+
+    比對方式與前端 Pyodide 模式相同：輸出與預期輸出都先去除頭尾空白再比較。
+    不認得的類型（包括 no_error）只要執行沒有錯誤即通過。
+    """
+
+    __slots__ = ("kind", "expected", "test_inputs", "cases", "stop_on_failure", "plan", "version",
+                 "_compare", "_passed_message", "_failed_format")
+
+    def __init__(self, validator: Optional[Dict[str, Any]], plan=None):
+        """
+        Args:
+            validator: 課程的 validator（None 表示沒有自動驗證）
+            plan: 已編譯的 CheckPlan；未提供時依 validator 的 code_requirements 編譯
+        """
+        validator = validator if isinstance(validator, dict) else {}
+        self.version = hashlib.blake2b(
+            json.dumps(validator, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8", "surrogatepass"),
+            digest_size=16,
+        ).hexdigest()
+        self.kind = validator.get("type", "no_error")
+        self.expected = (validator.get("expected_output") or "").strip()
+        self.test_inputs = list(validator.get("test_inputs") or [])
+
+        requirements = validator.get("code_requirements")
+        if plan is None and requirements and isinstance(requirements, dict):
+            plan = CheckPlan(requirements)
+        self.plan = plan
+
+        comparison = _COMPARISONS.get(self.kind)
+        if comparison is None:
+            self._compare = None
+            self._passed_message = NO_ERROR_MESSAGE
+            self._failed_format = ""
+        else:
+            build, self._passed_message, self._failed_format = comparison
+            self._compare = build(self.expected)
+
+        self.cases = [TestCase(self.test_inputs, self.expected, False, self._compare)]
+        for case in validator.get("test_cases") or []:
+            if not isinstance(case, dict):
+                continue
+            expected = (case.get("expected_output") or "").strip()
+            self.cases.append(TestCase(list(case.get("inputs") or []), expected, bool(case.get("hidden")),
+                                       comparison[0](expected) if comparison else None))
+        self.stop_on_failure = bool(validator.get("stop_on_failure", False))
+
+    @property
+    def case_inputs(self) -> List[List[str]]:
+        """每個測試案例的輸入值（傳給 ExecutionPool.run_cases）"""
+        return [case.inputs for case in self.cases]
+
+    def expectation(self, case: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        沙盒執行時逐段比對用的 expect（見 ExecutionPool.run）
+
+        Returns:
+            {"expected", "prefix"}；無法在執行中判斷的類型返回 None
+        """
+        prefix = _INCREMENTAL.get(self.kind)
+        if prefix is None:
+            return None
+        return {"expected": self.cases[case].expected, "prefix": prefix}
+
+    @property
+    def case_expects(self) -> List[Optional[Dict[str, Any]]]:
+        """每個測試案例的 expect（傳給 ExecutionPool.run_cases）"""
+        return [self.expectation(index) for index in range(len(self.cases))]
+
+    def check_output(self, stdout: str, case: int = 0) -> Tuple[bool, str]:
+        """
+        比對輸出
+
+        Args:
+            stdout: 程式的輸出
+            case: 測試案例的索引（預設為第一個案例，即 validator 的 expected_output）
+
+        Returns:
+            (是否通過, 訊息)
+        """
+        test_case = self.cases[case]
+        if test_case.compare is None:
+            return True, self._passed_message
+        actual = stdout.strip()
+        if test_case.compare(actual):
+            return True, self._passed_message
+        expected = test_case.expected
+        if self.kind == "stdout_ends_with":
+            actual = actual[-len(expected) - 20:]
+        elif self.kind == "stdout_starts_with":
+            actual = actual[:len(expected) + 20]
+        return False, self._failed_format.format(expected=expected, actual=actual)
+
+    def case_passed(self, case: int, result: Dict[str, Any]) -> bool:
+        """一個測試案例的執行結果是否通過（可作為 ExecutionPool.run_cases 的 check）"""
+        return not result.get("stderr") and self.check_output(result.get("stdout") or "", case)[0]
+
+    def check_structure(self, code: str) -> Tuple[bool, list]:
+        """
+        依 CheckPlan 檢查程式結構（沒有結構要求時直接通過）
+
+        Returns:
+            (是否通過, 反饋訊息列表)
+        """
+        if self.plan is None:
+            return True, []
+        return CodeAnalyzer(code).check_code_structure(self.plan)
+
+    def grade(self, code: str, result: Dict[str, Any]) -> Tuple[bool, str]:
+        """
+        評分一次執行結果
+
+        Args:
+            code: 學生程式碼（用於結構檢查）
+            result: 執行結果（至少包含 stdout 與 stderr，例如 ExecutionPool.run() 的返回值）
+
+        Returns:
+            (是否正確, 給學生的訊息)
+        """
+        if result.get("stderr"):
+            return False, f"❌ 您的程式碼產生了錯誤：\n{result['stderr']}"
+
+        output_passed, output_message = self.check_output(result.get("stdout") or "")
+        if result.get("status") == "output_diverged":
+            output_message = f"{output_message}\n{DIVERGED_NOTE}"
+        return self._combine(code, output_passed, output_message)
+
+    def grade_cases(self, code: str, results: List[Dict[str, Any]]) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """
+        評分每個測試案例的執行結果
+
+        Args:
+            code: 學生程式碼（用於結構檢查，只檢查一次）
+            results: 依 cases 順序排列的執行結果（ExecutionPool.run_cases() 的返回值）
+
+        Returns:
+            (是否全部正確, 給學生的訊息, 每個案例的 {"case", "passed", "status", "inputs", "stdout", "message"})
+            隱藏案例的 inputs 與 stdout 為 None；訊息只說明第一個未通過的案例
+        """
+        reports = []
+        first_failure = None
+        crashed = False
+        for index, (case, result) in enumerate(zip(self.cases, results)):
+            status = result.get("status")
+            skipped = status == "skipped"
+            if skipped:
+                passed, message = False, result.get("stderr", "")
+            elif result.get("stderr"):
+                passed, message = False, f"❌ 您的程式碼產生了錯誤：\n{result['stderr']}"
+            else:
+                passed, message = self.check_output(result.get("stdout") or "", index)
+                if status == "output_diverged":
+                    message = f"{message}\n{DIVERGED_NOTE}"
+            if case.hidden and not passed and not skipped:
+                message = "❌ 隱藏的測試案例未通過。"
+            reports.append({
+                "case": index + 1,
+                "passed": passed,
+                "status": status,
+                "inputs": None if case.hidden else case.inputs,
+                "stdout": None if case.hidden else result.get("stdout", ""),
+                "message": message,
+            })
+            if not passed and not skipped and first_failure is None:
+                first_failure = reports[-1]
+                crashed = bool(result.get("stderr"))
+
+        total = len(reports)
+        if first_failure is None:
+            passed_message = self._passed_message if total == 1 else f"通過全部 {total} 個測試案例！"
+            is_correct, message = self._combine(code, True, passed_message)
+            return is_correct, message, reports
+
+        message = first_failure["message"]
+        if total > 1:
+            heading = f"測試案例 {first_failure['case']}/{total}"
+            if first_failure["inputs"]:
+                heading += f"（輸入：{', '.join(first_failure['inputs'])}）"
+            message = f"{heading}\n{message}"
+        if crashed:
+            # 與 grade() 相同：執行錯誤時不再檢查結構
+            return False, message, reports
+        is_correct, message = self._combine(code, False, message)
+        return is_correct, message, reports
+
+    def _combine(self, code: str, output_passed: bool, output_message: str) -> Tuple[bool, str]:
+        """結合輸出比對與結構檢查的結果"""
+        structure_passed, structure_feedback = self.check_structure(code)
+
+        if output_passed and structure_passed:
+            return True, f"🎉 恭喜！{output_message}"
+        if output_passed:
+            message_parts = ["⚠️ 輸出結果正確，但程式寫法不符合題目要求：\n"]
+            message_parts.extend(structure_feedback)
+            message_parts.append("\n💡 請修改程式碼以符合題目的要求。")
+            return False, "\n".join(message_parts)
+        if structure_passed:
+            return False, output_message
+        message_parts = ["❌ 程式需要改進：\n", "輸出問題：", output_message, "\n程式結構問題："]
+        message_parts.extend(structure_feedback)
+        return False, "\n".join(message_parts)
+
+
+class _NoValidator(CompiledValidator):
+    """沒有 validator（或找不到課程）時使用：只要執行無誤即視為通過"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(None)
+
+    def grade(self, code: str, result: Dict[str, Any]) -> Tuple[bool, str]:
+        if result.get("stderr"):
+            return False, f"❌ 您的程式碼產生了錯誤：\n{result['stderr']}"
+        return True, f"✅ {NO_ERROR_MESSAGE}"
+
+
+NO_VALIDATOR = _NoValidator()
+
+
+def compile_validator(lesson: Optional[Dict[str, Any]], plan=None) -> CompiledValidator:
+    """
+    編譯一個課程的 validator
+
+    Args:
+        lesson: 課程資料（None 或沒有 validator 時返回 NO_VALIDATOR）
+        plan: 已編譯的 CheckPlan（例如 LessonSnapshot.check_plans 中的計畫）
+    """
+    validator = (lesson or {}).get("validator")
+    if not validator:
+        return NO_VALIDATOR
+    return CompiledValidator(validator, plan)
+
+
+def check_output(validator: Dict[str, Any], stdout: str) -> Tuple[bool, str]:
+    """
+    依 validator 類型比對輸出（每次呼叫都重新編譯；重複評分時請使用 CompiledValidator）
+
+    Returns:
+        (是否通過, 訊息)
+    """
+    return CompiledValidator(validator).check_output(stdout)
+
+
+def grade_result(lesson: Optional[Dict[str, Any]], code: str, result: Dict[str, Any], plan=None) -> Tuple[bool, str]:
+    """
+    評分一次沙盒執行結果（每次呼叫都重新編譯；課程載入時已編譯好的見 LessonSnapshot.graders）
+
+    Args:
+        lesson: 課程資料（None 表示找不到課程，只要執行無誤即視為通過）
+        code: 學生程式碼（用於結構檢查）
+        result: ExecutionPool.run() 的返回值
+        plan: 課程載入時編譯好的 CheckPlan；未提供時依 code_requirements 編譯
+
+    Returns:
+        (是否正確, 給學生的訊息)
+    """
+    return compile_validator(lesson, plan).grade(code, result)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+課程打包工具
+把 content/lessons/*.json 編譯成單一的版本化 bundle 檔案，啟動時只需一次開檔與一次 JSON 解析。
+
+檔案格式：
+    MAGIC (8 bytes) | 版本 (uint16) | header 長度 (uint32) | header JSON | payload
+
+header 記錄每個來源檔案的 mtime/size/sha256，以及該課程在 payload 中的 offset/length；
+payload 本身是一個 JSON 陣列，因此可以一次解析全部課程，也可以依 offset 單獨讀取一個課程。
+
+用法：
+    python web_tutor/lesson_bundle.py build   # 重新產生 bundle
+    python web_tutor/lesson_bundle.py bench   # 比較 bundle 與 JSON 目錄的載入時間
+"""
+
+import glob
+import json
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).parent
+CONTENT_DIR = BASE_DIR / "content" / "lessons"
+BUNDLE_PATH = BASE_DIR / "content" / "lessons.bundle"
+
+MAGIC = b"LPYBNDL\0"
+BUNDLE_VERSION = 1
+_PREFIX = struct.Struct("<8sHI")
+
+
+def _serialize(lesson: Dict[str, Any]) -> bytes:
+    return json.dumps(lesson, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_bundle(files, bundle_path=BUNDLE_PATH) -> int:
+    """
+    寫入 bundle 檔案
+
+    Args:
+        files: 檔名 -> LessonFile（需有 mtime_ns、size、sha256、lesson 屬性）
+        bundle_path: 輸出路徑
+
+    Returns:
+        寫入的課程數量
+    """
+    entries = []
+    bodies = []
+    offset = 1  # payload 以 "[" 開頭
+    for name in sorted(files):
+        state = files[name]
+        entry = {
+            "name": name,
+            "mtime_ns": state.mtime_ns,
+            "size": state.size,
+            "sha256": state.sha256,
+            "id": None,
+            "offset": 0,
+            "length": 0,
+        }
+        if state.lesson is not None:
+            body = _serialize(state.lesson)
+            if bodies:
+                offset += 1  # 分隔的逗號
+            entry.update(id=state.lesson["id"], offset=offset, length=len(body))
+            offset += len(body)
+            bodies.append(body)
+        entries.append(entry)
+
+    header = json.dumps({"version": BUNDLE_VERSION, "files": entries}, ensure_ascii=False).encode("utf-8")
+    payload = b"[" + b",".join(bodies) + b"]"
+
+    # 先寫入暫存檔再改名，讀取端不會看到寫到一半的 bundle
+    bundle_path = Path(bundle_path)
+    tmp_path = bundle_path.with_name(bundle_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, BUNDLE_VERSION, len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, bundle_path)
+    return len(bodies)
+
+
+class LessonBundle:
+    """已開啟的 bundle，提供新鮮度檢查、一次載入全部課程與依 offset 讀取單一課程"""
+
+    def __init__(self, bundle_path, entries: List[Dict[str, Any]], payload_start: int):
+        self.bundle_path = Path(bundle_path)
+        self.entries = entries
+        self.payload_start = payload_start
+        self._by_id = {entry["id"]: entry for entry in entries if entry["length"]}
+
+    @classmethod
+    def open(cls, bundle_path=BUNDLE_PATH) -> Optional["LessonBundle"]:
+        """讀取 bundle header；檔案不存在、格式錯誤或版本不符時返回 None"""
+        try:
+            with open(bundle_path, "rb") as f:
+                magic, version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+                if magic != MAGIC or version != BUNDLE_VERSION:
+                    return None
+                header = json.loads(f.read(header_len).decode("utf-8"))
+        except (OSError, struct.error, ValueError):
+            return None
+        if header.get("version") != BUNDLE_VERSION:
+            return None
+        return cls(bundle_path, header["files"], _PREFIX.size + header_len)
+
+    def is_fresh(self, content_dir=CONTENT_DIR) -> bool:
+        """
+        檢查 bundle 是否與 JSON 目錄一致（只做 stat，不讀取檔案內容）
+        檔案新增、刪除或 mtime/size 改變都會讓 bundle 過期。
+        """
+        json_files = glob.glob(str(Path(content_dir) / "*.json"))
+        if len(json_files) != len(self.entries):
+            return False
+        expected = {entry["name"]: entry for entry in self.entries}
+        for file_path in json_files:
+            entry = expected.get(os.path.basename(file_path))
+            if entry is None:
+                return False
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return False
+            if stat.st_mtime_ns != entry["mtime_ns"] or stat.st_size != entry["size"]:
+                return False
+        return True
+
+    def load_all(self) -> List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        一次解析全部課程
+
+        Returns:
+            [(header entry, 課程 dict 或 None)]，依檔名排序
+        """
+        with open(self.bundle_path, "rb") as f:
+            f.seek(self.payload_start)
+            lessons = iter(json.loads(f.read().decode("utf-8")))
+        return [(entry, next(lessons) if entry["length"] else None) for entry in self.entries]
+
+    def load_lesson(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        """依 offset 索引只讀取並解析單一課程"""
+        entry = self._by_id.get(lesson_id)
+        if entry is None:
+            return None
+        with open(self.bundle_path, "rb") as f:
+            f.seek(self.payload_start + entry["offset"])
+            return json.loads(f.read(entry["length"]).decode("utf-8"))
+
+
+def load_fresh_bundle(content_dir=CONTENT_DIR, bundle_path=BUNDLE_PATH):
+    """
+    如果 bundle 存在且與 JSON 目錄一致，返回其全部內容，否則返回 None（呼叫端應改讀 JSON 目錄）
+
+    Returns:
+        [(header entry, 課程 dict 或 None)] 或 None
+    """
+    bundle = LessonBundle.open(bundle_path)
+    if bundle is None or not bundle.is_fresh(content_dir):
+        return None
+    try:
+        return bundle.load_all()
+    except (OSError, ValueError, StopIteration):
+        return None
+
+
+def _lesson_library():
+    """延遲導入 LessonLibrary（lessons.py 本身會導入這個模組）"""
+    try:
+        from .lessons import LessonLibrary
+    except ImportError:
+        from lessons import LessonLibrary
+    return LessonLibrary
+
+
+def build(content_dir=CONTENT_DIR, bundle_path=BUNDLE_PATH) -> int:
+    """從 JSON 目錄重新產生 bundle，返回課程數量"""
+    library = _lesson_library()(content_dir, bundle_path=None)
+    return write_bundle(library.snapshot.files, bundle_path)
+
+
+def benchmark(content_dir=CONTENT_DIR, bundle_path=BUNDLE_PATH, repeat: int = 20) -> Dict[str, float]:
+    """
+    比較冷啟動時兩種載入路徑的耗時（毫秒，取最佳值）
+
+    Returns:
+        {"json_dir_ms": ..., "bundle_ms": ...}
+    """
+    LessonLibrary = _lesson_library()
+    bundle = LessonBundle.open(bundle_path)
+    if bundle is None or not bundle.is_fresh(content_dir):
+        build(content_dir, bundle_path)
+
+    def best_of(func):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    json_ms = best_of(lambda: LessonLibrary(content_dir, bundle_path=None))
+    bundle_ms = best_of(lambda: LessonLibrary(content_dir, bundle_path=bundle_path))
+    return {"json_dir_ms": json_ms, "bundle_ms": bundle_ms}
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="課程 bundle 工具")
+    parser.add_argument("command", choices=["build", "bench"], help="build：產生 bundle；bench：比較載入時間")
+    parser.add_argument("--repeat", type=int, default=20, help="bench 重複次數")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build()
+        print(f"✓ 已將 {count} 個課程寫入 {BUNDLE_PATH}")
+    else:
+        result = benchmark(repeat=args.repeat)
+        print(f"JSON 目錄：{result['json_dir_ms']:.2f} ms")
+        print(f"Bundle   ：{result['bundle_ms']:.2f} ms")
+        if result["bundle_ms"] > 0:
+            print(f"加速     ：{result['json_dir_ms'] / result['bundle_ms']:.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,46 +1,266 @@
+import hashlib
 import json
 import os
+import threading
 from pathlib import Path
+from types import MappingProxyType
 import glob
 
+# Compiled single-file bundle (see lesson_bundle.py), used when it is fresh
+try:
+    from .lesson_bundle import BUNDLE_PATH, load_fresh_bundle
+except ImportError:
+    from lesson_bundle import BUNDLE_PATH, load_fresh_bundle
+
+# Structure checks are compiled once per lesson (see code_analyzer.CheckPlan)
+try:
+    from .code_analyzer import CheckPlan
+except ImportError:
+    from code_analyzer import CheckPlan
+
+# Validators are compiled once per lesson as well (see grading.CompiledValidator)
+try:
+    from .grading import compile_validator
+except ImportError:
+    from grading import compile_validator
+
 # Get the directory where this file is located
 BASE_DIR = Path(__file__).parent
 CONTENT_DIR = BASE_DIR / "content" / "lessons"
 
+class LessonFile:
+    """
+    State tracked for a single lesson JSON file.
+    `lesson` is None when the file could not be parsed or failed validation.
+    """
+
+    __slots__ = ('name', 'mtime_ns', 'size', 'sha256', 'lesson')
+
+    def __init__(self, name, mtime_ns, size, sha256, lesson):
+        self.name = name
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.lesson = lesson
+
+def parse_lesson_bytes(name, raw):
+    """
+    Parse and validate the raw bytes of one lesson file.
+    Returns the lesson dict, or None if the file is invalid.
+    """
+    try:
+        lesson_data = json.loads(raw.decode('utf-8'))
+    except Exception as e:
+        print(f"Error loading lesson from {name}: {e}")
+        return None
+
+    # Basic validation
+    if isinstance(lesson_data, dict) and 'id' in lesson_data and 'title' in lesson_data:
+        return lesson_data
+    print(f"Warning: Skipped invalid lesson file {name} (missing id or title)")
+    return None
+
+def read_lesson_file(file_path, previous=None):
+    """
+    Read one lesson file and return its LessonFile state.
+    If the content hash matches `previous`, the already parsed lesson is reused
+    instead of parsing the JSON again.
+    """
+    name = os.path.basename(file_path)
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        raw = f.read()
+    sha256 = hashlib.sha256(raw).hexdigest()
+    if previous is not None and previous.sha256 == sha256:
+        lesson = previous.lesson
+    else:
+        lesson = parse_lesson_bytes(name, raw)
+        if lesson is None and previous is not None and previous.lesson is not None:
+            # Most likely a half-written save; keep serving the last good version
+            print(f"Warning: Keeping the previous version of {name}")
+            lesson = previous.lesson
+    return LessonFile(name, stat.st_mtime_ns, stat.st_size, sha256, lesson)
+
+def build_lesson_index(lessons):
+    """
+    Build an immutable id -> lesson mapping for O(1) lookup.
+    If two files declare the same id, the first one (in load order) wins.
+    """
+    index = {}
+    for lesson in lessons:
+        lesson_id = lesson['id']
+        if lesson_id in index:
+            print(f"Warning: Duplicate lesson id {lesson_id}, keeping the first definition")
+            continue
+        index[lesson_id] = lesson
+    return MappingProxyType(index)
+
+def build_check_plans(index, previous=None):
+    """
+    Compile every lesson's validator.code_requirements into a CheckPlan.
+    Lessons that are the same object as in `previous` keep their compiled plan.
+    """
+    plans = {}
+    for lesson_id, lesson in index.items():
+        if previous is not None and previous.index.get(lesson_id) is lesson:
+            if lesson_id in previous.check_plans:
+                plans[lesson_id] = previous.check_plans[lesson_id]
+            continue
+        validator = lesson.get('validator')
+        requirements = validator.get('code_requirements') if isinstance(validator, dict) else None
+        if requirements and isinstance(requirements, dict):
+            plans[lesson_id] = CheckPlan(requirements)
+    return MappingProxyType(plans)
+
+def build_graders(index, check_plans, previous=None):
+    """
+    Compile every lesson's validator (with its CheckPlan attached) into a CompiledValidator.
+    Lessons that are the same object as in `previous` keep their compiled validator.
+    """
+    graders = {}
+    for lesson_id, lesson in index.items():
+        if previous is not None and previous.index.get(lesson_id) is lesson and lesson_id in previous.graders:
+            graders[lesson_id] = previous.graders[lesson_id]
+            continue
+        graders[lesson_id] = compile_validator(lesson, check_plans.get(lesson_id))
+    return MappingProxyType(graders)
+
+def compute_content_hash(files):
+    """
+    Compute a digest over every lesson file name and the hash of its raw bytes.
+    Any edit, addition or removal under content/lessons changes the digest,
+    so it can be used directly as a strong ETag for lesson responses.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(files[name].sha256.encode('ascii'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class LessonSnapshot:
+    """
+    An immutable view of the lesson content at one point in time.
+    Readers grab `LessonLibrary.snapshot` once and use it for the whole request,
+    so a concurrent reload never exposes a half-updated state.
+    """
+
+    def __init__(self, files, previous=None):
+        self.files = MappingProxyType(files)
+        self.content_hash = compute_content_hash(files)
+        if previous is not None and previous.content_hash == self.content_hash:
+            # Only file metadata changed; the lessons themselves are identical
+            self.lessons = previous.lessons
+            self.index = previous.index
+            self.check_plans = previous.check_plans
+            self.graders = previous.graders
+            return
+        # Values are sorted by their filename (EX1-0, EX1-1...), which is
+        # usually correct for well-named files.
+        self.lessons = [files[name].lesson for name in sorted(files) if files[name].lesson is not None]
+        self.index = build_lesson_index(self.lessons)
+        # Compiled structure checks, keyed by lesson id; kept out of the lesson
+        # dicts themselves because those are served as JSON
+        self.check_plans = build_check_plans(self.index, previous)
+        # Compiled validators used for grading, keyed by lesson id
+        self.graders = build_graders(self.index, self.check_plans, previous)
+
+class LessonLibrary:
+    """
+    Loads lessons from content/lessons and keeps them up to date.
+
+    `refresh()` stats every JSON file and only re-reads files whose mtime or
+    size changed; files whose content hash is unchanged are not re-parsed.
+    A new snapshot is swapped in atomically when anything changed.
+    """
+
+    def __init__(self, content_dir=CONTENT_DIR, bundle_path=None):
+        """
+        Args:
+            content_dir: Directory containing the lesson JSON files
+            bundle_path: Optional compiled bundle; used instead of parsing every
+                JSON file when it is up to date with content_dir
+        """
+        self.content_dir = Path(content_dir)
+        self._lock = threading.Lock()
+        files = self._load_bundle(bundle_path) if bundle_path is not None else None
+        if files is None:
+            files = self._scan({})
+        self.snapshot = LessonSnapshot(files)
+
+    def _load_bundle(self, bundle_path):
+        """Return the LessonFile states stored in a fresh bundle, or None if it is missing or stale."""
+        entries = load_fresh_bundle(self.content_dir, bundle_path)
+        if entries is None:
+            return None
+        return {
+            entry['name']: LessonFile(entry['name'], entry['mtime_ns'], entry['size'], entry['sha256'], lesson)
+            for entry, lesson in entries
+        }
+
+    def _scan(self, previous_files):
+        """Return the LessonFile state for every JSON file, reusing unchanged entries."""
+        if not self.content_dir.exists():
+            print(f"Warning: Content directory not found at {self.content_dir}")
+            return {}
+
+        files = {}
+        for file_path in sorted(glob.glob(str(self.content_dir / "*.json"))):
+            name = os.path.basename(file_path)
+            previous = previous_files.get(name)
+            try:
+                if previous is not None:
+                    stat = os.stat(file_path)
+                    if stat.st_mtime_ns == previous.mtime_ns and stat.st_size == previous.size:
+                        files[name] = previous
+                        continue
+                files[name] = read_lesson_file(file_path, previous)
+            except OSError as e:
+                # The file may have been removed between glob and open
+                print(f"Error loading lesson from {name}: {e}")
+        return files
+
+    def refresh(self):
+        """
+        Pick up added, edited and removed lesson files.
+
+        Returns:
+            The list of file names whose content changed (empty if nothing changed).
+        """
+        with self._lock:
+            old_files = self.snapshot.files
+            new_files = self._scan(old_files)
+            changed = sorted(
+                name for name in set(old_files) | set(new_files)
+                if name not in old_files or name not in new_files
+                or old_files[name].sha256 != new_files[name].sha256
+            )
+            if changed or any(new_files[name] is not old_files[name] for name in new_files):
+                self.snapshot = LessonSnapshot(new_files, self.snapshot)
+            return changed
+
 def load_lessons():
     """
     Load lessons from JSON files in the content/lessons directory.
-    Values are sorted by their filename (or _order field if present).
-    """
-    lessons = []
-    
-    # Ensure the directory exists
-    if not CONTENT_DIR.exists():
-        print(f"Warning: Content directory not found at {CONTENT_DIR}")
-        return []
-
-    # Get all .json files
-    json_files = sorted(glob.glob(str(CONTENT_DIR / "*.json")))
-    
-    for file_path in json_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lesson_data = json.load(f)
-                
-                # Basic validation
-                if 'id' in lesson_data and 'title' in lesson_data:
-                    lessons.append(lesson_data)
-                else:
-                    print(f"Warning: Skipped invalid lesson file {os.path.basename(file_path)} (missing id or title)")
-        except Exception as e:
-            print(f"Error loading lesson from {os.path.basename(file_path)}: {e}")
-            
-    # Optional: Sort by a custom order field if you have it, 
-    # otherwise they are sorted by filename (EX1-0, EX1-1...) which is usually correct
-    # for well-named files.
-    # If you need specific ordering logic, implement it here.
-    
-    return lessons
+    Values are sorted by their filename.
+    """
+    return LessonLibrary().snapshot.lessons
 
 # Load lessons immediately when module is imported
-LESSONS = load_lessons()
+LIBRARY = LessonLibrary(CONTENT_DIR, BUNDLE_PATH)
+
+# LESSONS / LESSON_INDEX / CONTENT_HASH are read from the current snapshot on every
+# access, so they never go stale after a reload. Code that needs several of them
+# consistently should read LIBRARY.snapshot once instead.
+_SNAPSHOT_ATTRIBUTES = {
+    'LESSONS': 'lessons',
+    'LESSON_INDEX': 'index',
+    'CONTENT_HASH': 'content_hash',
+}
+
+def __getattr__(name):
+    attribute = _SNAPSHOT_ATTRIBUTES.get(name)
+    if attribute is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(LIBRARY.snapshot, attribute)
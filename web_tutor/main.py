@@ -1,50 +1,116 @@
 # web_tutor/main.py
 import asyncio
+import functools
+import json
+import logging
 import os
+import queue
 import sys
-import uuid
+import threading
+import time
+from collections import OrderedDict
 from io import StringIO
 from pathlib import Path
 from contextlib import asynccontextmanager
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, ValidationError, Field
 
-# Import code analyzer for intelligent validation
+logger = logging.getLogger(__name__)
+
+# Server-side grading of execution results (validators are compiled when lessons load)
 try:
-    from .code_analyzer import analyze_code
+    from .grading import NO_VALIDATOR
 except ImportError:
-    # Fallback for direct import
-    import sys
-    from pathlib import Path
-    analyzer_path = Path(__file__).parent / "code_analyzer.py"
-    if analyzer_path.exists():
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("code_analyzer", analyzer_path)
-        analyzer_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(analyzer_module)
-        analyze_code = analyzer_module.analyze_code
-    else:
-        analyze_code = None
+    # Fallback for direct import (uvicorn main:app from inside web_tutor/): sibling modules are top-level
+    from grading import NO_VALIDATOR
+
+# Realtime guidance served by /api/analyze
+try:
+    from .realtime_guide import GuideSession, create_guide_for_lesson
+except ImportError:
+    from realtime_guide import GuideSession, create_guide_for_lesson
+
+# Shared parse cache used by the analyzer, the realtime guide and grading
+try:
+    from .parse_cache import PARSE_CACHE
+except ImportError:
+    from parse_cache import PARSE_CACHE
+
+# Sandbox results of graded runs, keyed by lesson validator and canonical code
+try:
+    from .grade_cache import GRADE_CACHE
+except ImportError:
+    from grade_cache import GRADE_CACHE
+
+# Per-rule analyzer timings (enabled with ANALYZER_TIMING=1)
+try:
+    from .rule_timing import RULE_TIMINGS
+except ImportError:
+    from rule_timing import RULE_TIMINGS
+
+# Bounded output capture shared with tutor.py and the sandbox workers
+try:
+    from .output_capture import BoundedOutput, OutputLimitExceeded
+except ImportError:
+    from output_capture import BoundedOutput, OutputLimitExceeded
 
 # --- Code Execution ---
 # 
-# 注意：目前前端使用 Pyodide 在瀏覽器中執行 Python 程式碼，
-# 以下執行邏輯保留作為備用方案或未來擴展使用。
-# 如果不需要服務器端執行，可以移除相關代碼以簡化應用。
+# 注意：前端預設使用 Pyodide 在瀏覽器中執行 Python 程式碼；
+# Pyodide 無法載入時，會改用 /api/run_code 在伺服器端的沙盒工作行程中執行（見 sandbox.py）。
+# 下面的 run_code_sync 會在伺服器行程內直接 exec，不可用於處理使用者請求。
+
+try:
+    from .sandbox import SANDBOX_AVAILABLE, ExecutionPool, SandboxLimits
+except ImportError:
+    from sandbox import SANDBOX_AVAILABLE, ExecutionPool, SandboxLimits
+
+# 沙盒工作行程數量（SANDBOX_WORKERS，預設為 CPU 核心數，最多 8 個）；
+# SANDBOX_MODE 可選 fork（預設，每次執行 fork 一個乾淨的子行程）或 prefork；
+# 以 root 啟動時，SANDBOX_USER（例如 nobody）讓工作行程切換到無特權的使用者；
+# SERVER_EXECUTION=0 可完全停用伺服器端執行
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", "0") or 0) or min(os.cpu_count() or 2, 8)
+SANDBOX_MODE = os.environ.get("SANDBOX_MODE") or None
+SANDBOX_USER = os.environ.get("SANDBOX_USER") or None
+SERVER_EXECUTION = SANDBOX_AVAILABLE and os.environ.get("SERVER_EXECUTION", "1") != "0"
 
-# Use a thread pool executor for running Python code
-executor = ThreadPoolExecutor(max_workers=4)
+# 評分用的執行（/api/grade、/api/grade_batch）在輸出確定與 expected_output 不符時提前停止程式；
+# GRADE_EARLY_EXIT=0 可停用（/api/run_code 等會把輸出顯示給學生的端點不受影響）
+GRADE_EARLY_EXIT = os.environ.get("GRADE_EARLY_EXIT", "1") != "0"
+
+# 互動式執行（/ws/run_code）：同時進行的工作階段上限（避免等待輸入的程式佔滿工作行程，
+# 預設為工作行程數的一半）、等待輸入的閒置逾時與每個工作階段的總時間上限
+MAX_INTERACTIVE_SESSIONS = int(os.environ.get("MAX_INTERACTIVE_SESSIONS", "0") or 0) or max(1, SANDBOX_WORKERS // 2)
+INTERACTIVE_IDLE_SECONDS = float(os.environ.get("INTERACTIVE_IDLE_SECONDS", "60"))
+INTERACTIVE_SESSION_SECONDS = float(os.environ.get("INTERACTIVE_SESSION_SECONDS", "300"))
+interactive_sessions = 0
+
+# 串流執行（/api/run_code/stream）同時進行的串流上限，讀得慢的用戶端會佔住工作行程（預設同上）
+MAX_STREAM_SESSIONS = int(os.environ.get("MAX_STREAM_SESSIONS", "0") or 0) or max(1, SANDBOX_WORKERS // 2)
+stream_sessions = 0
+
+# Started in lifespan() when server-side execution is enabled
+execution_pool = None
+
+# Use a thread pool executor to wait for sandbox workers without blocking the event loop
+executor = ThreadPoolExecutor(max_workers=SANDBOX_WORKERS)
+
+# Realtime analysis is CPU bound and short; it gets its own small pool so a large
+# buffer never blocks the event loop or waits behind sandbox runs
+analysis_executor = ThreadPoolExecutor(max_workers=2)
 
 def run_code_sync(code_string, inputs=None):
     """
     Executes a string of Python code and captures its stdout, stderr, and any exceptions.
-    Returns a dictionary with 'stdout' and 'stderr'.
+    Returns a dictionary with 'stdout', 'stderr' and 'truncated'.
     This is the same implementation as in tutor.py but adapted for web use.
+    Output is capped like in the sandbox; the program is stopped once it exceeds the cap.
     
     Args:
         code_string: Python code to execute
@@ -72,7 +138,7 @@ def run_code_sync(code_string, inputs=None):
             return ""
     
     old_stdout = sys.stdout
-    redirected_output = StringIO()
+    redirected_output = BoundedOutput(stop=True)
     sys.stdout = redirected_output
     error_output = StringIO()
     
@@ -95,6 +161,8 @@ def run_code_sync(code_string, inputs=None):
     
     try:
         exec(code_string, custom_globals)
+    except OutputLimitExceeded:
+        error_output.write(f"輸出超過 {redirected_output.limit} 位元組，程式已停止。請檢查是否有無窮迴圈一直在 print()。")
     except Exception as e:
         error_output.write(str(e))
         import traceback
@@ -105,15 +173,34 @@ def run_code_sync(code_string, inputs=None):
 
     return {
         "stdout": redirected_output.getvalue(),
-        "stderr": error_output.getvalue()
+        "stderr": error_output.getvalue(),
+        "truncated": redirected_output.truncated
     }
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # On startup - nothing special needed
+    global execution_pool
+    # On startup - start the sandbox workers and the lesson watcher if enabled
+    if SERVER_EXECUTION:
+        loop = asyncio.get_running_loop()
+        try:
+            execution_pool = await loop.run_in_executor(executor, ExecutionPool(SANDBOX_WORKERS, SandboxLimits(user=SANDBOX_USER), mode=SANDBOX_MODE).start)
+        except RuntimeError as e:
+            # No worker could start: serve the app with server-side execution disabled
+            logger.error("server-side execution disabled: %s", e)
+            execution_pool = None
+    watcher = None
+    if LESSONS_RELOAD_INTERVAL > 0:
+        watcher = asyncio.create_task(watch_lessons(LESSONS_RELOAD_INTERVAL))
     yield
-    # On shutdown - cleanup executor
+    # On shutdown - stop the watcher, the sandbox workers and cleanup executor
+    if watcher is not None:
+        watcher.cancel()
+    if execution_pool is not None:
+        execution_pool.close()
+        execution_pool = None
     executor.shutdown(wait=True)
+    analysis_executor.shutdown(wait=True)
 
 app = FastAPI(lifespan=lifespan)
 
@@ -148,109 +235,772 @@ class CodeExecutionRequest(BaseModel):
         # Allow extra fields to be ignored
         extra = "forbid"
 
+# 一次批次評分最多接受的份數
+MAX_BATCH_ITEMS = 1000
+
+class GradeItem(BaseModel):
+    lesson_id: str = Field(..., min_length=1, description="課程 ID")
+    code: str = Field(..., min_length=1, description="學生的 Python 程式碼")
+    inputs: Optional[list[str]] = Field(None, description="input() 輸入值；未提供時執行課程 validator 的所有測試案例")
+    id: Optional[str] = Field(None, description="呼叫端自訂的識別碼（例如學號），原樣回傳")
+    
+    class Config:
+        extra = "forbid"
+
+class GradeBatchRequest(BaseModel):
+    items: list[GradeItem] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS, description="要評分的作業")
+    concurrency: Optional[int] = Field(None, ge=1, description="同時執行的數量上限（不超過沙盒工作行程數）")
+    
+    class Config:
+        extra = "forbid"
+
+class GradeRequest(BaseModel):
+    lesson_id: str = Field(..., min_length=1, description="課程 ID")
+    code: str = Field(..., min_length=1, description="學生的 Python 程式碼（用於結構檢查；未提供 stdout 時在沙盒中執行）")
+    stdout: Optional[str] = Field(None, description="已在瀏覽器（Pyodide）執行得到的輸出；提供時不再執行程式")
+    stderr: str = Field("", description="已執行時的錯誤輸出")
+    inputs: Optional[list[str]] = Field(None, description="input() 輸入值；未提供時執行課程 validator 的所有測試案例")
+    stop_on_failure: Optional[bool] = Field(None, description="第一個測試案例未通過後不再執行其他案例（預設依課程 validator 設定）")
+    
+    class Config:
+        extra = "forbid"
+
+class AnalyzeRequest(BaseModel):
+    lesson_id: str = Field(..., min_length=1, description="課程 ID")
+    code: str = Field("", description="編輯器中目前的程式碼")
+    cursor_line: int = Field(1, ge=1, description="游標所在行（從 1 開始）")
+    cursor_col: int = Field(1, ge=1, description="游標所在列（從 1 開始）")
+    client_id: Optional[str] = Field(None, min_length=1, max_length=128,
+                                     description="編輯器識別碼；提供時啟用增量分析，並丟棄被新請求取代的舊請求")
+    
+    class Config:
+        extra = "forbid"
+
+class InteractiveRunRequest(BaseModel):
+    type: str = Field("start", description="訊息類型（固定為 start）")
+    code: str = Field(..., min_length=1, description="要執行的 Python 程式碼")
+    lesson_id: str = Field(..., min_length=1, description="課程 ID")
+    
+    class Config:
+        extra = "forbid"
+
 # --- Helper Functions ---
 
-async def run_code_async(code: str, inputs=None):
+async def run_code_async(code: str, inputs=None, on_output=None, on_input=None, timeout=None, expect=None):
     """
-    Executes code using a thread pool executor and returns the result.
-    This is simpler and more reliable than using Jupyter kernel.
+    Executes code in a sandbox worker process and returns the result.
+    The blocking wait for the worker happens in a thread pool executor.
     
     Args:
         code: Python code to execute
         inputs: List of input values for input() function calls
+        on_output: Optional callback for streamed output (see ExecutionPool.run);
+            it is called from the executor thread
+        on_input: Optional callback answering input() interactively (see ExecutionPool.run);
+            it is called from the executor thread
+        timeout: Wall clock limit in seconds (defaults to the sandbox limit)
+        expect: Optional expected output to stop the program at once when it diverges
+            (see CompiledValidator.expectation)
     """
     try:
         # Run the code execution in a thread pool to avoid blocking
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(executor, run_code_sync, code, inputs)
+        run = functools.partial(execution_pool.run, code, inputs, timeout=timeout,
+                                on_output=on_output, on_input=on_input, expect=expect)
+        result = await loop.run_in_executor(executor, run)
+        return result
+    except Exception as e:
+        print(f"FATAL EXECUTION ERROR: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"status": "crashed", "stdout": "", "stderr": f"A fatal error occurred during code execution: {e}"}
+
+
+async def run_graded_async(code: str, grader, inputs=None):
+    """
+    Run code once for grading with a compiled validator.
+    
+    Args:
+        code: Python code to execute
+        grader: The lesson's CompiledValidator
+        inputs: Values for input() (defaults to the validator's test_inputs)
+    
+    Returns:
+        The execution result (see ExecutionPool.run)
+    
+    Results of deterministic programs are reused from GRADE_CACHE when the same lesson version
+    sees the same code again (up to whitespace and comments); grading itself always runs on the
+    submitted code, so line numbers in the feedback stay correct.
+    """
+    if inputs is None:
+        inputs = grader.test_inputs
+    expect = grader.expectation() if GRADE_EARLY_EXIT else None
+    
+    def run():
+        key = GRADE_CACHE.key(grader.version, code, tuple(inputs), expect)
+        if key is not None:
+            cached = GRADE_CACHE.get(key)
+            if cached is not None:
+                return cached
+        result = execution_pool.run(code, inputs, expect=expect)
+        if key is not None:
+            GRADE_CACHE.put(key, result)
         return result
+    
+    try:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, run)
     except Exception as e:
         print(f"FATAL EXECUTION ERROR: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
-        return {"stdout": "", "stderr": f"A fatal error occurred during code execution: {e}"}
+        return {"status": "crashed", "stdout": "", "stderr": f"A fatal error occurred during code execution: {e}"}
+
+
+async def run_cases_async(code: str, grader, stop_on_failure=None, max_parallel=None):
+    """
+    Run code once per test case of a compiled validator, spread over the sandbox workers.
+    
+    Args:
+        code: Python code to execute
+        grader: The lesson's CompiledValidator (its cases provide the inputs)
+        stop_on_failure: Skip the remaining cases after a failing one (defaults to the validator setting)
+        max_parallel: Maximum number of cases running at the same time (defaults to all workers)
+    
+    Returns:
+        One result per case, in case order (see ExecutionPool.run_cases)
+    
+    Each case is cached like run_graded_async (the first case shares its entry);
+    the submission only runs when some case is not in GRADE_CACHE.
+    """
+    if stop_on_failure is None:
+        stop_on_failure = grader.stop_on_failure
+    case_inputs = grader.case_inputs
+    expects = grader.case_expects if GRADE_EARLY_EXIT else [None] * len(case_inputs)
+    
+    def run():
+        keys = [GRADE_CACHE.key(grader.version, code, tuple(inputs), expect)
+                for inputs, expect in zip(case_inputs, expects)]
+        if None not in keys:
+            cached = [GRADE_CACHE.get(key) for key in keys]
+            if None not in cached:
+                return cached
+        results = execution_pool.run_cases(code, case_inputs, check=grader.case_passed,
+                                           stop_on_failure=stop_on_failure, max_parallel=max_parallel,
+                                           expects=expects)
+        for key, result in zip(keys, results):
+            if key is not None:
+                GRADE_CACHE.put(key, result)
+        return results
+    
+    try:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, run)
+    except Exception as e:
+        print(f"FATAL EXECUTION ERROR: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        crashed = {"status": "crashed", "stdout": "", "stderr": f"A fatal error occurred during code execution: {e}"}
+        return [dict(crashed) for _ in case_inputs]
+
+
+async def grade_async(grader, code: str, result):
+    """
+    Grade an execution result without blocking the event loop.
+    
+    Structure checks parse the code, so they run in analysis_executor like /api/analyze.
+    
+    Returns:
+        (is_correct, message) from CompiledValidator.grade
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(analysis_executor, grader.grade, code, result)
+
+
+async def grade_cases_async(grader, code: str, results):
+    """
+    Grade the results of run_cases_async off the event loop, like grade_async.
+    
+    Returns:
+        (is_correct, message, per-case reports) from CompiledValidator.grade_cases
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(analysis_executor, grader.grade_cases, code, results)
 
 
 # --- API Endpoints ---
 # Import lessons from the same directory
 # 統一使用 web_tutor/lessons.py 作為課程來源
 try:
-    from .lessons import LESSONS
+    from .lessons import LIBRARY
 except ImportError:
-    try:
-        # 如果相對導入失敗，嘗試絕對導入
-        import sys
-        from pathlib import Path
-        lessons_path = Path(__file__).parent / "lessons.py"
-        if lessons_path.exists():
-            import importlib.util
-            spec = importlib.util.spec_from_file_location("lessons", lessons_path)
-            lessons_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(lessons_module)
-            LESSONS = lessons_module.LESSONS
-        else:
-            LESSONS = []
-    except Exception as e:
-        print(f"警告：無法載入課程文件：{e}")
-        LESSONS = []
+    from lessons import LIBRARY
+
+# Pre-serialized, pre-compressed lesson responses (built at startup and on content change)
+try:
+    from .payload_cache import LessonPayloadCache, choose_encoding, etag_matches, parse_fields
+except ImportError:
+    from payload_cache import LessonPayloadCache, choose_encoding, etag_matches, parse_fields
+
+class ServedLessons:
+    """
+    A lesson snapshot and the response cache built from it.
+    
+    兩者總是從同一份快照建立，並以一次賦值整組替換，
+    請求不會看到新課程配上舊回應（或相反）的組合。
+    """
+    
+    def __init__(self, snapshot, previous=None):
+        self.snapshot = snapshot
+        self.payloads = LessonPayloadCache(
+            snapshot.lessons, snapshot.index, snapshot.content_hash,
+            previous.payloads if previous is not None else None,
+        )
+
+SERVED = ServedLessons(LIBRARY.snapshot)
+
+def __getattr__(name):
+    # PAYLOADS always follows the served snapshot
+    if name == "PAYLOADS":
+        return SERVED.payloads
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 課程熱重載：每隔 LESSONS_RELOAD_INTERVAL 秒檢查 content/lessons，
+# 只重新解析有變更的檔案，並以新的快照與快取整組替換 SERVED（0 表示停用）
+LESSONS_RELOAD_INTERVAL = float(os.environ.get("LESSONS_RELOAD_INTERVAL", "0") or 0)
+
+def reload_lessons():
+    """Refresh the library; returns the changed files and the next ServedLessons (None if nothing changed)."""
+    changed = LIBRARY.refresh()
+    if not changed:
+        return changed, None
+    return changed, ServedLessons(LIBRARY.snapshot, SERVED)
+
+async def watch_lessons(interval: float):
+    """Periodically pick up edited lesson files without restarting the server."""
+    global SERVED
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changed, served = await loop.run_in_executor(None, reload_lessons)
+            if served is not None:
+                SERVED = served
+                print(f"✓ 已重新載入課程檔案：{', '.join(changed)}")
+        except Exception as e:
+            print(f"警告：重新載入課程失敗：{e}")
+
+def find_lesson(lesson_id: str, snapshot=None):
+    """
+    Look up a lesson and its compiled validator.
+    
+    Returns:
+        (lesson dict or None, CompiledValidator); unknown lessons get NO_VALIDATOR,
+        which accepts any run without errors
+    """
+    if snapshot is None:
+        snapshot = SERVED.snapshot
+    return snapshot.index.get(lesson_id), snapshot.graders.get(lesson_id, NO_VALIDATOR)
+
+def payload_response(request: Request, payload, extra_headers=None):
+    """
+    Build a response from a pre-serialized payload.
+    Honours If-None-Match (304 without body) and Accept-Encoding (br/gzip variants,
+    each with its own ETag since the bytes differ).
+    """
+    body, encoding, etag = payload.encoded(choose_encoding(request.headers.get("accept-encoding")))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if extra_headers:
+        headers.update(extra_headers)
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/api/lessons")
-async def get_lessons():
+async def get_lessons(
+    request: Request,
+    fields: Optional[str] = Query(None, description="只返回指定欄位，例如 id,title"),
+    offset: int = Query(0, ge=0, description="分頁起始位置"),
+    limit: Optional[int] = Query(None, ge=1, description="分頁大小（不指定則返回全部）"),
+):
     """
     Endpoint to get the list of all lessons.
     
     返回所有可用的課程列表。如果沒有找到課程，會返回 404 錯誤。
+    課程在 web_tutor/lessons.py 載入時已驗證過 id/title，這裡不再逐筆檢查。
+    
+    目錄模式：?fields=id,title 只返回側邊欄需要的欄位（前端使用的預設目錄），可搭配 offset/limit 分頁，
+    總數放在 X-Total-Count 標頭。回應帶有由課程內容計算的強 ETag，
+    瀏覽器重複請求時若 If-None-Match 相符，直接返回 304（視圖建立後即保留在快取中，不會重新序列化）。
+    回應內容來自預先序列化的快取，並依 Accept-Encoding 直接提供 br/gzip 版本。
     """
-    if not LESSONS:
+    payloads = SERVED.payloads
+    if not payloads.total:
         raise HTTPException(
             status_code=404, 
             detail="找不到課程內容。請確認 web_tutor/lessons.py 文件存在且包含有效的 LESSONS 列表。"
         )
     
-    # 驗證課程數據的完整性
-    valid_lessons = []
-    for lesson in LESSONS:
-        if isinstance(lesson, dict) and 'id' in lesson and 'title' in lesson:
-            valid_lessons.append(lesson)
-        else:
-            print(f"警告：發現無效的課程數據：{lesson}")
+    field_names = parse_fields(fields)
+    extra_headers = {"X-Total-Count": str(payloads.total)}
+    return payload_response(request, payloads.view(field_names, offset, limit), extra_headers)
+
+@app.get("/api/lessons/{lesson_id}")
+async def get_lesson(request: Request, lesson_id: str):
+    """
+    Endpoint to get a single lesson by id.
     
-    if not valid_lessons:
-        raise HTTPException(
-            status_code=500,
-            detail="課程數據格式錯誤。請檢查 web_tutor/lessons.py 文件。"
-        )
+    透過預先建立的索引以 O(1) 查找單一課程，切換課程時不必重新下載整個課程列表。
+    回應內容在啟動時已序列化並壓縮完成。
+    """
+    payload = SERVED.payloads.lesson(lesson_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"找不到課程：{lesson_id}")
     
-    return valid_lessons
+    return payload_response(request, payload)
 
-@app.post("/api/run_code")
-async def execute_code(request: CodeExecutionRequest):
+# --- Realtime Guidance ---
+
+# 保留增量分析狀態的編輯器數量上限（最久未使用的先淘汰）
+MAX_ANALYZE_CLIENTS = 1024
+
+class AnalyzeClient:
+    """Per-editor state for /api/analyze: the incremental session and request coalescing."""
+    
+    def __init__(self):
+        self.lesson_id = None
+        self.session = GuideSession()
+        # Sequence number of the newest request; older ones still waiting are dropped
+        self.latest = 0
+        self.lock = asyncio.Lock()
+
+# lesson id -> (lesson dict, RealtimeGuide); rebuilt when the lesson is reloaded
+guides = {}
+analyze_clients = OrderedDict()
+
+def guide_for_lesson(lesson_id: str):
+    """Return the cached RealtimeGuide for a lesson, or None if the lesson does not exist."""
+    lesson, _ = find_lesson(lesson_id)
+    if lesson is None:
+        return None
+    cached = guides.get(lesson_id)
+    if cached is None or cached[0] is not lesson:
+        cached = (lesson, create_guide_for_lesson(lesson))
+        guides[lesson_id] = cached
+    return cached[1]
+
+def analyze_client(client_id: str) -> AnalyzeClient:
+    client = analyze_clients.get(client_id)
+    if client is None:
+        client = AnalyzeClient()
+        analyze_clients[client_id] = client
+        while len(analyze_clients) > MAX_ANALYZE_CLIENTS:
+            analyze_clients.popitem(last=False)
+    else:
+        analyze_clients.move_to_end(client_id)
+    return client
+
+@app.post("/api/analyze")
+async def analyze(request: AnalyzeRequest):
     """
-    Endpoint to execute user code.
+    Realtime guidance for the code being typed.
     
-    SECURITY CHANGE: Server-side execution has been disabled for security reasons.
-    This endpoint now returns a 501 Not Implemented error to inform the client
-    that they should rely on the client-side Pyodide environment.
+    每個課程共用一個 RealtimeGuide。提供 client_id 時，同一個編輯器的請求依序處理並保留增量分析狀態；
+    排隊中的請求若已被同一編輯器更新的請求取代，會直接返回 {"stale": true} 而不進行分析。
     """
-    # 為了安全起見，已禁用服務器端代碼執行
-    # 這樣可以防止惡意代碼損害主機
+    guide = guide_for_lesson(request.lesson_id)
+    if guide is None:
+        raise HTTPException(status_code=404, detail=f"找不到課程：{request.lesson_id}")
+    loop = asyncio.get_running_loop()
+    
+    if request.client_id is None:
+        result = await loop.run_in_executor(
+            analysis_executor, guide.analyze_partial_code, request.code, request.cursor_line, request.cursor_col
+        )
+        return {"stale": False, **result}
     
+    client = analyze_client(request.client_id)
+    client.latest += 1
+    sequence = client.latest
+    async with client.lock:
+        if sequence != client.latest:
+            return {"stale": True}
+        if client.lesson_id != request.lesson_id:
+            client.lesson_id = request.lesson_id
+            client.session = GuideSession()
+        result = await loop.run_in_executor(
+            analysis_executor, guide.analyze_partial_code,
+            request.code, request.cursor_line, request.cursor_col, client.session,
+        )
+    return {"stale": False, **result}
+
+def execution_disabled_response():
+    """501 response used by the execution endpoints when the sandbox is not running."""
     return JSONResponse(
         status_code=501,
         content={
-            "detail": "為了系統安全，已禁用服務器端代碼執行功能。請確保您的瀏覽器支持並已啟用 WebAssembly 以使用本地 Pyodide 環境。",
+            "detail": "此伺服器未啟用伺服器端代碼執行功能。請確保您的瀏覽器支持並已啟用 WebAssembly 以使用本地 Pyodide 環境。",
             "is_correct": False,
             "stdout": "",
-            "stderr": "Security Error: Server-side execution is disabled.",
-            "message": "❌ 為了安全起見，不支援伺服器端執行。\n請使用瀏覽器本地環境 (Pyodide) 進行練習。"
+            "stderr": "Server-side execution is disabled.",
+            "message": "❌ 此伺服器不支援伺服器端執行。\n請使用瀏覽器本地環境 (Pyodide) 進行練習。"
         }
     )
 
-# --- Deprecated / Removed Execution Logic ---
-# Previous implementation of run_code_async and run_code_sync has been removed
-# to prevent potential remote code execution vulnerabilities.
-# If server-side execution is absolutely required in the future,
-# it MUST be implemented using a secure sandbox (e.g., Docker, nsjail).
+@app.post("/api/run_code")
+async def execute_code(request: CodeExecutionRequest):
+    """
+    Endpoint to execute user code.
+    
+    程式碼在預先啟動的沙盒工作行程中執行（有 CPU、記憶體、檔案與子行程限制及牆鐘逾時），
+    並依課程的 validator 評分。平台不支援沙盒或以 SERVER_EXECUTION=0 停用時，
+    返回 501，前端應改用瀏覽器本地的 Pyodide 環境。
+    """
+    if execution_pool is None:
+        return execution_disabled_response()
+    
+    result = await run_code_async(request.code, request.inputs)
+    _, grader = find_lesson(request.lesson_id)
+    is_correct, message = await grade_async(grader, request.code, result)
+    
+    return {
+        "is_correct": is_correct,
+        "stdout": result.get("stdout", ""),
+        "stderr": result.get("stderr", ""),
+        "message": message,
+        "status": result.get("status"),
+        "truncated": result.get("truncated", False),
+    }
+
+# 串流執行時伺服器端最多暫存的輸出批次，用戶端讀得慢時沙盒中的程式會暫停輸出
+STREAM_QUEUE_SIZE = 16
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message with a JSON encoded data field."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def put_from_thread(loop, events: asyncio.Queue, item, deadline: float) -> bool:
+    """
+    Put an event on an asyncio queue from an executor thread.
+    
+    Blocks while the queue is full (the client reads slowly), but never past `deadline`
+    (a time.monotonic() value, the end of the run's time limit).
+    
+    Returns:
+        False when the run's time ran out first; the caller should cancel the run
+    """
+    future = asyncio.run_coroutine_threadsafe(events.put(item), loop)
+    try:
+        future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        future.cancel()
+        return False
+    return True
+
+def streams_full_response():
+    """503 response used by /api/run_code/stream when MAX_STREAM_SESSIONS streams are running."""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "5"},
+        content={"detail": "目前串流執行的人數已滿，請稍後再試。"},
+    )
+
+@app.post("/api/run_code/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    """
+    Endpoint to execute user code and stream its output.
+    
+    以 Server-Sent Events 回應：程式執行期間送出 stdout / stderr 事件（data 為 JSON 字串），
+    結束後送出一個 result 事件（is_correct、message、status、truncated）。
+    輸出經由有上限的佇列傳遞，用戶端讀得慢時佇列與沙盒管道會被填滿，
+    學生程式的 print() 隨之暫停；用戶端中斷連線、或到了執行時間上限仍讀不完時取消執行。
+    同時進行的串流超過 MAX_STREAM_SESSIONS 時返回 503。
+    """
+    if execution_pool is None:
+        return execution_disabled_response()
+    if stream_sessions >= MAX_STREAM_SESSIONS:
+        return streams_full_response()
+    
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+    deadline = time.monotonic() + execution_pool.limits.wall_seconds
+    
+    def on_output(stream, data):
+        # Runs in the executor thread; blocks while the queue is full, up to the run's time limit
+        if cancelled.is_set() or not put_from_thread(loop, events, (stream, data), deadline):
+            cancelled.set()
+            return False
+        return not cancelled.is_set()
+    
+    async def run_and_grade():
+        result = await run_code_async(request.code, request.inputs, on_output=on_output)
+        _, grader = find_lesson(request.lesson_id)
+        is_correct, message = await grade_async(grader, request.code, result)
+        await events.put(("result", {
+            "is_correct": is_correct,
+            "message": message,
+            "status": result.get("status"),
+            "truncated": result.get("truncated", False),
+        }))
+    
+    async def event_stream():
+        global stream_sessions
+        # Counted once the stream starts, so a response that is never sent holds no slot
+        if stream_sessions >= MAX_STREAM_SESSIONS:
+            yield sse_event("result", {"is_correct": False, "message": "目前串流執行的人數已滿，請稍後再試。",
+                                       "status": "busy", "truncated": False})
+            return
+        stream_sessions += 1
+        task = asyncio.ensure_future(run_and_grade())
+        try:
+            while True:
+                event, data = await events.get()
+                yield sse_event(event, data)
+                if event == "result":
+                    break
+        finally:
+            # Client went away: stop the program and unblock the executor thread
+            stream_sessions -= 1
+            cancelled.set()
+            while not events.empty():
+                events.get_nowait()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/ws/run_code")
+async def execute_code_interactive(websocket: WebSocket):
+    """
+    Interactive execution session.
+    
+    用戶端先送出 {"type": "start", "code": ..., "lesson_id": ...}；執行期間伺服器送出
+    {"type": "stdout" | "stderr", "data": ...}，程式呼叫 input() 時送出 {"type": "input_request"}，
+    用戶端以 {"type": "input", "value": ...} 或 {"type": "eof"} 回覆。
+    結束時送出 {"type": "result", ...}（與 /api/run_code 相同的評分欄位）並關閉連線。
+    
+    等待輸入超過 INTERACTIVE_IDLE_SECONDS 秒會結束程式（status 為 idle_timeout）；
+    同時進行的工作階段超過 MAX_INTERACTIVE_SESSIONS 時，新的連線會以 1013 關閉。
+    """
+    global interactive_sessions
+    await websocket.accept()
+    if execution_pool is None:
+        await websocket.send_json({"type": "error", "message": "此伺服器不支援伺服器端執行。"})
+        await websocket.close(code=1011)
+        return
+    if interactive_sessions >= MAX_INTERACTIVE_SESSIONS:
+        await websocket.send_json({"type": "error", "message": "目前互動執行的人數已滿，請稍後再試。"})
+        await websocket.close(code=1013)
+        return
+    
+    interactive_sessions += 1
+    try:
+        await run_interactive_session(websocket)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        interactive_sessions -= 1
+
+async def run_interactive_session(websocket: WebSocket):
+    """Run one program for execute_code_interactive, relaying output and input()."""
+    try:
+        start = InteractiveRunRequest.model_validate(
+            await asyncio.wait_for(websocket.receive_json(), INTERACTIVE_IDLE_SECONDS)
+        )
+    except asyncio.TimeoutError:
+        await websocket.close(code=1008)
+        return
+    except (ValidationError, ValueError):
+        await websocket.send_json({"type": "error", "message": "第一個訊息必須包含 code 與 lesson_id。"})
+        await websocket.close(code=1008)
+        return
+    
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    replies = queue.Queue()
+    cancelled = threading.Event()
+    idle = threading.Event()
+    deadline = time.monotonic() + INTERACTIVE_SESSION_SECONDS
+    
+    def on_output(stream, data):
+        # Runs in the executor thread; blocks while the queue is full, up to the session's time limit
+        if cancelled.is_set() or not put_from_thread(loop, events, (stream, {"data": data}), deadline):
+            cancelled.set()
+            return False
+        return not cancelled.is_set()
+    
+    def on_input():
+        # Runs in the executor thread; the worker stays blocked in input() meanwhile
+        if cancelled.is_set() or not put_from_thread(loop, events, ("input_request", {}), deadline):
+            cancelled.set()
+            return False
+        try:
+            return replies.get(timeout=INTERACTIVE_IDLE_SECONDS)
+        except queue.Empty:
+            idle.set()
+            return False
+    
+    async def run_and_grade():
+        result = await run_code_async(start.code, on_output=on_output, on_input=on_input,
+                                      timeout=INTERACTIVE_SESSION_SECONDS)
+        if idle.is_set():
+            payload = {
+                "is_correct": False,
+                "message": f"⏱️ 超過 {INTERACTIVE_IDLE_SECONDS:g} 秒沒有輸入，程式已停止。",
+                "status": "idle_timeout",
+                "truncated": result.get("truncated", False),
+            }
+        else:
+            _, grader = find_lesson(start.lesson_id)
+            is_correct, message = await grade_async(grader, start.code, result)
+            payload = {
+                "is_correct": is_correct,
+                "message": message,
+                "status": result.get("status"),
+                "truncated": result.get("truncated", False),
+            }
+        await events.put(("result", payload))
+    
+    async def receive_replies():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "input":
+                    replies.put(str(message.get("value", "")))
+                elif kind == "eof":
+                    replies.put(None)
+        except (WebSocketDisconnect, ValueError):
+            cancelled.set()
+            replies.put(False)
+    
+    task = asyncio.ensure_future(run_and_grade())
+    receiver = asyncio.ensure_future(receive_replies())
+    try:
+        while True:
+            event, data = await events.get()
+            await websocket.send_json({"type": event, **data})
+            if event == "result":
+                break
+        await websocket.close()
+    finally:
+        # Stop the program if the client went away and unblock the executor thread
+        cancelled.set()
+        replies.put(False)
+        receiver.cancel()
+        while not events.empty():
+            events.get_nowait()
+
+@app.post("/api/grade_batch")
+async def grade_batch(request: GradeBatchRequest):
+    """
+    Endpoint to grade many submissions at once.
+    
+    每份作業依其課程的 validator 評分，分散到沙盒工作行程中並行執行
+    （同時執行數量受 concurrency 與工作行程數限制）。結果以 NDJSON 串流返回，
+    每完成一份就輸出一行，行內的 index 對應請求中 items 的位置。
+    未提供 inputs 的作業會執行課程 validator 的所有測試案例，cases 列出每個案例的結果。
+    """
+    if execution_pool is None:
+        return execution_disabled_response()
+    
+    snapshot = SERVED.snapshot
+    concurrency = min(request.concurrency or SANDBOX_WORKERS, SANDBOX_WORKERS)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def grade_item(index: int, item: GradeItem):
+        lesson, grader = find_lesson(item.lesson_id, snapshot)
+        line = {"index": index, "id": item.id, "lesson_id": item.lesson_id}
+        if lesson is None:
+            line.update(is_correct=False, status="unknown_lesson", stdout="", stderr="",
+                        message=f"找不到課程：{item.lesson_id}")
+            return line
+        cases = None
+        async with semaphore:
+            if item.inputs is None:
+                # Submissions already run in parallel; keep each one to a single worker
+                results = await run_cases_async(item.code, grader, max_parallel=1)
+            else:
+                results = [await run_graded_async(item.code, grader, item.inputs)]
+        if item.inputs is None:
+            is_correct, message, cases = await grade_cases_async(grader, item.code, results)
+        else:
+            is_correct, message = await grade_async(grader, item.code, results[0])
+        result = results[0]
+        line.update(is_correct=is_correct, status=result.get("status"), message=message,
+                    stdout=result.get("stdout", ""), stderr=result.get("stderr", ""), cases=cases)
+        return line
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(grade_item(i, item)) for i, item in enumerate(request.items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: drop the submissions that have not started yet
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/api/grade")
+async def grade(request: GradeRequest):
+    """
+    Endpoint to grade one submission with the lesson's precompiled validator.
+    
+    提供 stdout 時（程式已在瀏覽器的 Pyodide 中執行），只做比對與結構檢查，不再執行程式，
+    伺服器未啟用執行功能時也可使用；提供 inputs 時在沙盒中以這組輸入執行一次再評分。
+    兩者都未提供時，課程 validator 的每個測試案例（test_inputs 與 test_cases）分散到沙盒工作行程中並行執行，
+    cases 欄位列出每個案例的結果。與 /api/run_code 使用同一份評分邏輯。
+    """
+    lesson, grader = find_lesson(request.lesson_id)
+    if lesson is None:
+        raise HTTPException(status_code=404, detail=f"找不到課程：{request.lesson_id}")
+    
+    cases = None
+    if request.stdout is not None:
+        result = {"stdout": request.stdout, "stderr": request.stderr, "status": None}
+    elif execution_pool is None:
+        return execution_disabled_response()
+    elif request.inputs is not None:
+        result = await run_graded_async(request.code, grader, request.inputs)
+    else:
+        results = await run_cases_async(request.code, grader, request.stop_on_failure)
+        is_correct, message, cases = await grade_cases_async(grader, request.code, results)
+        result = results[0]
+    
+    if cases is None:
+        is_correct, message = await grade_async(grader, request.code, result)
+    return {
+        "is_correct": is_correct,
+        "message": message,
+        "stdout": result.get("stdout", ""),
+        "stderr": result.get("stderr", ""),
+        "status": result.get("status"),
+        "truncated": result.get("truncated", False),
+        "cases": cases,
+    }
+
+@app.get("/api/debug/stats")
+async def get_debug_stats():
+    """Internal cache statistics (hit/miss counters), sandbox pool size and per-rule analyzer timings for monitoring."""
+    return {
+        "parse_cache": PARSE_CACHE.stats(),
+        "grade_cache": GRADE_CACHE.stats(),
+        "execution_pool": execution_pool.stats() if execution_pool is not None else None,
+        "rule_timings": RULE_TIMINGS.snapshot(),
+    }
 
 
 # --- Static Files ---
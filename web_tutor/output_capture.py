@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有上限的輸出擷取
+取代 io.StringIO 擷取學生程式的 stdout / stderr：保留的內容有固定的位元組上限，
+`while True: print(x)` 這類失控的輸出不會讓記憶體無限制成長，回應大小也有上限。
+
+保留輸出的開頭（head）與最後一段（tail，環狀緩衝區），中間被丟棄的部分以一行說明取代；
+設定 stop=True 時，輸出超過上限的那次寫入會拋出 OutputLimitExceeded 讓程式停止。
+提供 expect（ExpectedOutput）時，輸出一確定與預期輸出不符就拋出 OutputDiverged，評分時不必等錯誤的程式執行完。
+
+tutor.run_code、main.run_code_sync 與沙盒工作行程（sandbox.py）共用這個類別。
+"""
+
+import io
+
+# 預設每個串流最多保留的位元組數
+DEFAULT_LIMIT = 64 * 1024
+
+
+class OutputLimitExceeded(BaseException):
+    """
+    輸出超過上限（stop=True 時拋出）
+
+    繼承 BaseException 而不是 Exception，學生程式的 except Exception 不會攔下它；
+    即使被攔下，之後的每次寫入也會再次拋出，保留的內容不會再增加。
+    """
+
+
+class OutputDiverged(BaseException):
+    """輸出已確定與預期輸出不符（提供 expect 時拋出；與 OutputLimitExceeded 一樣不會被 except Exception 攔下）"""
+
+
+class ExpectedOutput:
+    """
+    逐段比對輸出與預期輸出
+
+    判斷與評分（grading.py）完全相同：輸出去除頭尾空白後等於（prefix=True 時以它開頭）
+    去除頭尾空白的預期輸出。只有在之後無論再輸出什麼都不可能通過時才判定為不符：
+        - 開頭的空白略過，之後的字元必須與預期輸出逐字相同
+        - 完全相同的比對在預期輸出結束後，只允許再出現空白
+        - 開頭比對在預期輸出全部相符後就不再檢查
+    """
+
+    __slots__ = ("expected", "prefix", "position", "started", "diverged")
+
+    def __init__(self, expected: str, prefix: bool = False):
+        """
+        Args:
+            expected: 預期輸出
+            prefix: True 表示只要求輸出以預期輸出開頭（stdout_starts_with）
+        """
+        self.expected = expected.strip()
+        self.prefix = prefix
+        # 已相符的預期輸出字元數；started 表示已經略過開頭的空白
+        self.position = 0
+        self.started = False
+        self.diverged = False
+
+    def feed(self, text: str) -> bool:
+        """
+        比對下一段輸出
+
+        Returns:
+            False 表示輸出已確定不符
+        """
+        if self.diverged:
+            return False
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return True
+            self.started = True
+        expected = self.expected
+        remaining = len(expected) - self.position
+        if remaining > 0:
+            piece = text[:remaining]
+            if piece != expected[self.position:self.position + len(piece)]:
+                self.diverged = True
+                return False
+            self.position += len(piece)
+            text = text[remaining:]
+        if text and not self.prefix and not text.isspace():
+            self.diverged = True
+            return False
+        return True
+
+
+def _byte_len(s: str) -> int:
+    return len(s) if s.isascii() else len(s.encode("utf-8", "surrogatepass"))
+
+
+def _first_bytes(s: str, size: int) -> str:
+    """s 開頭最多 size 個位元組（不切斷多位元組字元）"""
+    if s.isascii():
+        return s[:size]
+    return s.encode("utf-8", "surrogatepass")[:size].decode("utf-8", "ignore")
+
+
+def _last_bytes(s: str, size: int) -> str:
+    """s 結尾最多 size 個位元組（不切斷多位元組字元）"""
+    if size <= 0:
+        return ""
+    if s.isascii():
+        return s[-size:]
+    return s.encode("utf-8", "surrogatepass")[-size:].decode("utf-8", "ignore")
+
+
+class BoundedOutput(io.TextIOBase):
+    """
+    只保留前 limit - tail 個位元組與最後 tail 個位元組的文字輸出緩衝
+
+    truncated 表示有輸出被丟棄（或因 stop 而停止），written 是程式實際寫入的位元組總數。
+    記憶體中最多暫存 limit + tail 個位元組，getvalue() 返回的內容不超過 limit 個位元組（加上省略說明）。
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, tail: int = None, stop: bool = False,
+                 expect: ExpectedOutput = None):
+        """
+        Args:
+            limit: 最多保留的位元組數（UTF-8）
+            tail: 其中保留給輸出結尾的位元組數（預設為 limit 的四分之一）
+            stop: 輸出超過 limit 時拋出 OutputLimitExceeded
+            expect: 可選，輸出確定與它不符時拋出 OutputDiverged（造成不符的那段輸出仍會保留）
+        """
+        self.limit = limit
+        self.tail_limit = min(limit // 4 if tail is None else tail, limit)
+        self.head_limit = limit - self.tail_limit
+        self.stop = stop
+        self.expect = expect
+        self.head_parts = []
+        self.head_size = 0
+        # head 一旦放不下整段寫入就不再接受內容（避免多位元組字元切不齊時之後的短字串又接到 head）
+        self.head_open = self.head_limit > 0
+        self.tail_parts = []
+        self.tail_size = 0
+        self.written = 0
+        self.dropped = 0
+        self.stopped = False
+
+    @property
+    def truncated(self) -> bool:
+        self._compact()
+        return self.dropped > 0 or self.stopped
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if not isinstance(s, str):
+            raise TypeError(f"write() argument must be str, not {type(s).__name__}")
+        if self.stopped:
+            raise OutputLimitExceeded(f"output exceeded {self.limit} bytes")
+        if self.expect is not None and self.expect.diverged:
+            raise OutputDiverged("output no longer matches the expected output")
+        size = _byte_len(s)
+        self.written += size
+        text = s
+        if self.head_open:
+            room = self.head_limit - self.head_size
+            if size <= room:
+                self.head_parts.append(text)
+                self.head_size += size
+                text = ""
+            else:
+                piece = _first_bytes(text, room)
+                self.head_parts.append(piece)
+                self.head_size += _byte_len(piece)
+                self.head_open = False
+                text = text[len(piece):]
+                size = _byte_len(text)
+        if text:
+            self._add_tail(text, size)
+        if self.expect is not None and not self.expect.feed(s):
+            raise OutputDiverged("output no longer matches the expected output")
+        if self.stop and self.written > self.limit:
+            self.stopped = True
+            raise OutputLimitExceeded(f"output exceeded {self.limit} bytes")
+        return len(s)
+
+    def _add_tail(self, text: str, size: int) -> None:
+        # 環狀緩衝區最多累積到 tail 的兩倍才一次丟掉較舊的部分，每次寫入的平均成本是常數
+        self.tail_parts.append(text)
+        self.tail_size += size
+        if self.tail_size > 2 * self.tail_limit:
+            self._compact()
+
+    def _compact(self) -> None:
+        """把 tail 縮減到最後 tail_limit 個位元組"""
+        if self.tail_size <= self.tail_limit:
+            return
+        kept = _last_bytes("".join(self.tail_parts), self.tail_limit)
+        kept_size = _byte_len(kept)
+        self.dropped += self.tail_size - kept_size
+        self.tail_parts = [kept]
+        self.tail_size = kept_size
+
+    def getvalue(self) -> str:
+        """保留的輸出；中間有內容被丟棄時以一行說明標示位置與位元組數"""
+        self._compact()
+        head = "".join(self.head_parts)
+        tail = "".join(self.tail_parts)
+        if not self.dropped:
+            return head + tail
+        return f"{head}\n…（輸出過長，已省略 {self.dropped} 位元組）…\n{tail}"
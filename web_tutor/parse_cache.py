@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共用的語法樹解析快取
+同一段程式碼只解析一次：代碼分析器、實時引導與評分都透過 parse_code() 取得語法樹，
+以程式碼內容的雜湊為鍵，快取解析出的語法樹或 SyntaxError。
+
+注意：快取中的語法樹會被多個呼叫端共用，取得後不可修改。
+"""
+
+import ast
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+class ParseCache:
+    """
+    以原始碼總位元組數為上限的 LRU 解析快取（執行緒安全）
+
+    語法樹佔用的記憶體約為原始碼的 80 倍，項目數量無法反映快取的大小，因此以原始碼的 UTF-8 位元組數計算上限。
+    超過 max_entry_bytes 的程式碼直接解析、不放入快取，避免一份大型提交擠掉所有其他項目。
+    """
+
+    def __init__(self, maxbytes: int = 512 * 1024, max_entry_bytes: int = 32 * 1024):
+        """
+        Args:
+            maxbytes: 快取中原始碼的總位元組數上限（0 表示停用）
+            max_entry_bytes: 單份程式碼的位元組數上限，超過時不快取
+        """
+        self.maxbytes = maxbytes
+        self.max_entry_bytes = min(max_entry_bytes, maxbytes)
+        self.hits = 0
+        self.misses = 0
+        # 太大而不快取的解析次數
+        self.skipped = 0
+        self.bytes = 0
+        # 鍵 -> (語法樹或 SyntaxError, 原始碼位元組數)
+        self._entries: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode(code: str) -> bytes:
+        """程式碼的 UTF-8 編碼（surrogatepass 讓含有孤立代理字元的字串也能編碼）"""
+        return code.encode("utf-8", "surrogatepass")
+
+    @staticmethod
+    def key(data: bytes) -> bytes:
+        """程式碼內容的雜湊"""
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def parse(self, code: str) -> ast.AST:
+        """
+        解析程式碼，結果與 ast.parse(code) 相同
+
+        Raises:
+            SyntaxError: 程式碼有語法錯誤（每次都拋出新的例外物件）
+        """
+        data = self.encode(code)
+        size = len(data)
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self.skipped += 1
+            return ast.parse(code)
+        key = self.key(data)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            entry = cached[0]
+        else:
+            try:
+                entry = ast.parse(code)
+            except SyntaxError as e:
+                entry = e
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.bytes -= previous[1]
+                self._entries[key] = (entry, size)
+                self.bytes += size
+                while self.bytes > self.maxbytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.bytes -= evicted_size
+        if isinstance(entry, SyntaxError):
+            # 重複拋出同一個例外物件會不斷累積 traceback，因此複製一份
+            raise type(entry)(*entry.args)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "skipped": self.skipped,
+                "size": len(self._entries),
+                "bytes": self.bytes,
+                "maxbytes": self.maxbytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.skipped = 0
+            self.hits = 0
+            self.misses = 0
+
+
+# 整個行程共用一個快取（PARSE_CACHE_BYTES 可調整原始碼總位元組數上限，0 表示停用）
+PARSE_CACHE = ParseCache(int(os.environ.get("PARSE_CACHE_BYTES", str(512 * 1024)) or 0))
+
+
+def parse_code(code: str) -> ast.AST:
+    """透過共用快取解析程式碼（見 ParseCache.parse）"""
+    return PARSE_CACHE.parse(code)
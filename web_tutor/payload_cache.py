@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+課程回應快取
+在啟動時（或課程內容變更時）把課程回應預先序列化成 JSON bytes，
+並同時建立 gzip / Brotli 壓縮版本，讓 API 端點只需要複製記憶體即可回應。
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Dict, List, Mapping, Optional, Tuple, Any
+
+try:
+    import brotli
+except ImportError:
+    # Brotli 列在 requirements.txt 中；未安裝時只提供 gzip
+    brotli = None
+
+
+# 側邊欄目錄只需要這些欄位（與 static/script.js 的 CATALOG_FIELDS 相同，這個視圖在建立快取時就已序列化）
+CATALOG_FIELDS = ("id", "title")
+
+# 太小的回應壓縮後反而更大，不值得壓縮
+MIN_COMPRESS_SIZE = 512
+
+# 壓縮版本的內容與原始內容不同，各自使用加上編碼後綴的強 ETag
+ENCODING_SUFFIXES = ("gzip", "br")
+
+# 按需建立的目錄視圖（不同 fields/offset/limit 組合）最多保留的數量
+MAX_VIEWS = 64
+
+
+def serialize(obj: Any) -> bytes:
+    """以與 JSONResponse 相同的格式序列化（UTF-8、無多餘空白）"""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class Payload:
+    """一個預先序列化的回應，包含原始與壓縮版本"""
+
+    __slots__ = ("body", "gzip", "br", "etag")
+
+    def __init__(self, body: bytes, etag: str, brotli_quality: int = 11):
+        """
+        Args:
+            body: 已序列化的 JSON bytes
+            etag: 此回應的強 ETag（含雙引號）
+            brotli_quality: Brotli 壓縮等級
+        """
+        self.body = body
+        self.etag = etag
+        self.gzip = None
+        self.br = None
+        if len(body) >= MIN_COMPRESS_SIZE:
+            # mtime=0 讓相同內容產生相同的壓縮結果
+            self.gzip = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.br = brotli.compress(body, quality=brotli_quality)
+
+    def encoded(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        """
+        返回指定編碼的內容
+
+        Returns:
+            (內容, 實際使用的 Content-Encoding 或 None, 這個版本的 ETag)
+        """
+        if encoding == "br" and self.br is not None:
+            return self.br, "br", encoded_etag(self.etag, "br")
+        if encoding in ("br", "gzip") and self.gzip is not None:
+            return self.gzip, "gzip", encoded_etag(self.etag, "gzip")
+        return self.body, None, self.etag
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """壓縮版本的 ETag：在引號內加上 -gzip / -br 後綴（未壓縮時原樣返回）"""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    解析以逗號分隔的 ?fields= 參數（保留順序、去除重複）
+
+    Returns:
+        欄位名稱的 tuple；沒有要求投影時返回 None
+    """
+    if fields is None:
+        return None
+    names = []
+    for name in fields.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return tuple(names)
+
+
+def make_lessons_etag(content_hash: str, fields: Optional[Tuple[str, ...]], offset: int, limit: Optional[int]) -> str:
+    """
+    /api/lessons 回應的強 ETag
+    結合課程內容雜湊與投影、分頁參數，每個目錄視圖各自驗證。
+    """
+    variant = f"{','.join(fields) if fields is not None else '*'}|{offset}|{limit}"
+    variant_hash = hashlib.sha256(variant.encode("utf-8")).hexdigest()[:16]
+    return f'"{content_hash[:32]}-{variant_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match 標頭是否符合指定的強 ETag
+    同一份內容任何編碼版本的 ETag 都算符合（內容未變，客戶端快取的版本仍然有效）。
+    """
+    if not if_none_match:
+        return False
+    variants = {etag}
+    variants.update(encoded_etag(etag, encoding) for encoding in ENCODING_SUFFIXES)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate in variants:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    根據 Accept-Encoding 選擇回應編碼，優先 br，其次 gzip
+
+    Returns:
+        "br"、"gzip" 或 None（不壓縮）
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(name)
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def project(lessons: List[Dict[str, Any]], fields: Optional[Tuple[str, ...]], offset: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+    """套用分頁與欄位投影"""
+    page = lessons[offset:offset + limit] if limit is not None else lessons[offset:]
+    if fields is None:
+        return page
+    return [{name: lesson[name] for name in fields if name in lesson} for lesson in page]
+
+
+class LessonPayloadCache:
+    """
+    課程回應快取
+
+    建立時預先序列化完整列表、預設目錄投影與每個課程本體；
+    其他 fields/offset/limit 組合在第一次請求時建立並保留（最多 MAX_VIEWS 個）。
+    課程內容變更時以 previous 建立新的快取物件並整個替換，只有變更的課程需要重新序列化與壓縮。
+    """
+
+    def __init__(self, lessons: List[Dict[str, Any]], index: Mapping[str, Dict[str, Any]], content_hash: str,
+                 previous: Optional["LessonPayloadCache"] = None):
+        """
+        Args:
+            lessons: 依順序排列的課程列表
+            index: 課程 id -> 課程的索引（決定單一課程端點提供哪一份內容）
+            content_hash: 課程內容的雜湊，用於列表視圖的 ETag
+            previous: 上一份快取；內容未變的課程（同一個物件）直接沿用其序列化與壓縮結果
+        """
+        self.lessons = lessons
+        self.content_hash = content_hash
+        self.total = len(lessons)
+        self._views: Dict[Tuple[Optional[Tuple[str, ...]], int, Optional[int]], Payload] = {}
+        self._lesson_payloads: Dict[str, Payload] = {}
+        self._lesson_sources: Dict[str, Dict[str, Any]] = dict(index)
+
+        # previous 持有它的課程物件，因此以 id() 對應在此期間不會重複
+        previous_bodies = previous._bodies if previous is not None else {}
+        self._bodies = {id(lesson): previous_bodies.get(id(lesson)) or serialize(lesson) for lesson in lessons}
+        for lesson_id, lesson in index.items():
+            if previous is not None and previous._lesson_sources.get(lesson_id) is lesson:
+                self._lesson_payloads[lesson_id] = previous._lesson_payloads[lesson_id]
+                continue
+            body = self._bodies.get(id(lesson)) or serialize(lesson)
+            self._lesson_payloads[lesson_id] = self._build_lesson(body)
+        # 完整列表直接由各課程的 bytes 拼接，不必再序列化一次
+        full_body = b"[" + b",".join(self._bodies[id(lesson)] for lesson in lessons) + b"]"
+        self._views[(None, 0, None)] = Payload(full_body, make_lessons_etag(content_hash, None, 0, None))
+        self.view(CATALOG_FIELDS, 0, None)
+
+    def _build_lesson(self, body: bytes) -> Payload:
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        return Payload(body, etag)
+
+    def view(self, fields: Optional[Tuple[str, ...]], offset: int, limit: Optional[int]) -> Payload:
+        """取得（必要時建立）列表視圖的預序列化回應"""
+        key = (fields, offset, limit)
+        payload = self._views.get(key)
+        if payload is None:
+            if len(self._views) >= MAX_VIEWS:
+                # 保留啟動時建立的完整列表與預設目錄，淘汰最早建立的其他視圖
+                for old_key in list(self._views)[2:3]:
+                    del self._views[old_key]
+            body = serialize(project(self.lessons, fields, offset, limit))
+            payload = Payload(body, make_lessons_etag(self.content_hash, fields, offset, limit), brotli_quality=5)
+            self._views[key] = payload
+        return payload
+
+    def lesson(self, lesson_id: str) -> Optional[Payload]:
+        """取得單一課程的預序列化回應"""
+        return self._lesson_payloads.get(lesson_id)
@@ -7,8 +7,110 @@
 
 import ast
 import re
+import time
 from typing import Dict, List, Tuple, Optional, Any
 
+# Shared parse cache (one per process, see parse_cache.py)
+try:
+    from .parse_cache import parse_code
+except ImportError:
+    from parse_cache import parse_code
+
+# Per-rule timing (one registry per process, see rule_timing.py)
+try:
+    from .rule_timing import RULE_TIMINGS, timed
+except ImportError:
+    from rule_timing import RULE_TIMINGS, timed
+
+# Resource limits for a single analysis (see analysis_budget.py)
+try:
+    from .analysis_budget import DEFAULT_BUDGET, MAX_BYTES, TIME_LIMIT, AnalysisBudget
+except ImportError:
+    from analysis_budget import DEFAULT_BUDGET, MAX_BYTES, TIME_LIMIT, AnalysisBudget
+
+# Structural repetition detector used for forbids_hardcode (see repeated_code.py)
+try:
+    from .repeated_code import RepeatedBlock, StructuralHasher, find_repeats
+except ImportError:
+    from repeated_code import RepeatedBlock, StructuralHasher, find_repeats
+
+
+# 從第 0 欄開始、但仍屬於前一個頂層語句的行
+_CONTINUATION_RE = re.compile(r"(?:else|elif|except|finally)\b")
+
+
+def split_top_level_blocks(lines: List[str]) -> List[str]:
+    """
+    把程式碼切成頂層語句區塊（每個區塊從一個第 0 欄的語句開始）
+    
+    空白行、註解、else/elif/except/finally、右括號開頭的行與裝飾器後的行都併入前一個區塊。
+    切分是啟發式的（例如多行字串中的第 0 欄文字也會被切開），切錯的區塊無法單獨解析，
+    呼叫端會改用完整解析，因此不影響結果的正確性。
+    
+    Returns:
+        區塊文字列表（以換行連接後即為原本的程式碼）
+    """
+    blocks = []
+    current: List[str] = []
+    after_decorator = False
+    for line in lines:
+        first = line[:1]
+        is_code = first not in ("", " ", "\t", "#")
+        starts_block = (
+            is_code
+            and first not in (")", "]", "}")
+            and not after_decorator
+            and not _CONTINUATION_RE.match(line)
+        )
+        if starts_block and current:
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+        if is_code:
+            after_decorator = first == "@"
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+class _BlockFacts:
+    """一個頂層語句區塊的解析結果（語句的行號從區塊第一行算起）"""
+    
+    __slots__ = ("ok", "has_loop", "statements", "nested")
+    
+    def __init__(self, text: str, hasher: StructuralHasher):
+        try:
+            tree = ast.parse(text)
+        except Exception:
+            self.ok = False
+            self.has_loop = False
+            self.statements = self.nested = ()
+            return
+        self.ok = True
+        self.has_loop = any(isinstance(node, (ast.For, ast.While)) for node in ast.walk(tree))
+        self.statements, self.nested = hasher.statement_lists(tree)
+
+
+class GuideSession:
+    """
+    一個編輯器的增量分析狀態
+    
+    以頂層語句區塊的文字為鍵，保存上一次分析時每個區塊的解析結果；
+    學生打字時通常只有游標所在的區塊改變，其他區塊（即使行號位移）都直接沿用。
+    所有區塊共用一個結構雜湊表，因此跨區塊的重複程式碼也能比對。
+    """
+    
+    # 結構雜湊表超過這個大小就重新開始（舊區塊會重新解析），避免長時間編輯時無限成長
+    MAX_HASHED_SUBTREES = 50000
+    
+    def __init__(self):
+        self.blocks: Dict[str, _BlockFacts] = {}
+        self.hasher = StructuralHasher()
+        # 最近一次分析的區塊（依程式順序）與各自的行號位移
+        self.order: List[Tuple[_BlockFacts, int]] = []
+        # 最近一次分析重新解析的區塊數
+        self.reparsed = 0
+
 
 class RealtimeGuide:
     """實時引導系統，提供輸入過程中的智能提示"""
@@ -25,6 +127,7 @@ class RealtimeGuide:
         if lesson and 'validator' in lesson:
             self.code_requirements = lesson['validator'].get('code_requirements', {})
     
+    @timed("guide.syntax")
     def check_syntax(self, code: str) -> Tuple[bool, Optional[str], Optional[int]]:
         """
         檢查語法錯誤
@@ -33,14 +136,56 @@ class RealtimeGuide:
             (是否有語法錯誤, 錯誤訊息, 錯誤行號)
         """
         try:
-            ast.parse(code)
+            parse_code(code)
             return False, None, None
         except SyntaxError as e:
             return True, e.msg, e.lineno
+        except (RecursionError, MemoryError):
+            return True, "程式碼的巢狀層數太深，無法分析", None
         except Exception as e:
             return True, str(e), None
     
-    def analyze_partial_code(self, code: str, cursor_line: int, cursor_col: int) -> Dict[str, Any]:
+    @timed("guide.incremental_parse")
+    def _incremental_facts(self, code: str, lines: List[str], session: GuideSession):
+        """
+        只重新解析內容改變的頂層區塊
+        
+        Returns:
+            (是否有語法錯誤, 錯誤訊息, 錯誤行號, 是否有循環)
+        """
+        if len(session.hasher) > session.MAX_HASHED_SUBTREES:
+            session.hasher = StructuralHasher()
+            session.blocks = {}
+        blocks = {}
+        order = []
+        reparsed = 0
+        all_ok = True
+        has_loop = False
+        offset = 0
+        for text in split_top_level_blocks(lines):
+            block = blocks.get(text) or session.blocks.get(text)
+            if block is None:
+                block = _BlockFacts(text, session.hasher)
+                reparsed += 1
+            blocks[text] = block
+            order.append((block, offset))
+            offset += text.count("\n") + 1
+            all_ok = all_ok and block.ok
+            has_loop = has_loop or block.has_loop
+        session.blocks = blocks
+        session.order = order
+        session.reparsed = reparsed
+        
+        if all_ok:
+            return False, None, None, has_loop
+        # 有區塊無法單獨解析：改用完整解析取得正確的錯誤位置（也涵蓋區塊切錯的情況）
+        has_syntax_error, error_msg, error_line = self.check_syntax(code)
+        return has_syntax_error, error_msg, error_line, self._has_loop_in_code(code)
+    
+    @timed("guide.analyze")
+    def analyze_partial_code(self, code: str, cursor_line: int, cursor_col: int,
+                             session: Optional[GuideSession] = None,
+                             budget: Optional[AnalysisBudget] = None) -> Dict[str, Any]:
         """
         分析部分代碼，提供實時引導
         
@@ -48,6 +193,9 @@ class RealtimeGuide:
             code: 當前代碼
             cursor_line: 游標所在行（從1開始）
             cursor_col: 游標所在列（從1開始）
+            session: 可選，同一個編輯器的 GuideSession；提供時只重新解析改變的頂層區塊
+            budget: 資源上限（預設為 DEFAULT_BUDGET）；原始碼太大時不分析，
+                語法檢查後已超過時間上限時略過課程要求的檢查，結果的 partial 為 True
         
         Returns:
             包含引導信息的字典
@@ -56,11 +204,28 @@ class RealtimeGuide:
         warnings = []
         hints = []
         
+        budget = budget or DEFAULT_BUDGET
+        if budget.source_exceeded(code):
+            return {
+                "suggestions": suggestions,
+                "warnings": [self._budget_warning(budget, MAX_BYTES)],
+                "hints": hints,
+                "has_syntax_error": False,
+                "partial": True,
+                "budget_exceeded": MAX_BYTES,
+            }
+        deadline = budget.deadline()
+        budget_exceeded = None
+        
         lines = code.split('\n')
         current_line = lines[cursor_line - 1] if cursor_line <= len(lines) else ""
         
         # 1. 檢查語法錯誤
-        has_syntax_error, error_msg, error_line = self.check_syntax(code)
+        has_loop = None
+        if session is not None:
+            has_syntax_error, error_msg, error_line, has_loop = self._incremental_facts(code, lines, session)
+        else:
+            has_syntax_error, error_msg, error_line = self.check_syntax(code)
         if has_syntax_error and error_line:
             if error_line == cursor_line:
                 suggestions.append({
@@ -71,10 +236,12 @@ class RealtimeGuide:
                 })
         
         # 2. 根據課程要求提供引導
-        if self.code_requirements:
+        if self.code_requirements and time.perf_counter() > deadline:
+            budget_exceeded = TIME_LIMIT
+        if self.code_requirements and budget_exceeded is None:
             # 檢查是否需要循環
             if self.code_requirements.get("requires_loop", False):
-                if not self._has_loop_in_code(code):
+                if not (has_loop if has_loop is not None else self._has_loop_in_code(code)):
                     loop_type = self.code_requirements.get("loop_type", "")
                     if loop_type == "for":
                         if "for" not in code.lower():
@@ -103,11 +270,18 @@ class RealtimeGuide:
             
             # 檢查是否禁止硬編碼
             if self.code_requirements.get("forbids_hardcode", False):
-                if self._detect_hardcode(code):
+                try:
+                    repeated = self._detect_hardcode(code, lines, session, deadline)
+                except TimeoutError:
+                    budget_exceeded = TIME_LIMIT
+                    repeated = []
+                if repeated:
+                    first = repeated[0]
                     warnings.append({
                         "type": "hardcode_detected",
-                        "message": "⚠️ 檢測到可能的硬編碼寫法",
+                        "message": f"⚠️ 檢測到可能的硬編碼寫法（第 {first.start_line}～{first.end_line} 行有重複的程式碼）",
                         "suggestion": "考慮使用循環來簡化代碼",
+                        "line": first.start_line,
                         "severity": "warning"
                     })
             
@@ -141,20 +315,33 @@ class RealtimeGuide:
                     })
         
         # 3. 檢查常見錯誤模式
-        common_errors = self._check_common_errors(code, current_line, cursor_line)
+        common_errors = self._check_common_errors(code, current_line, cursor_line, lines)
         suggestions.extend(common_errors)
         
+        if budget_exceeded:
+            warnings.append(self._budget_warning(budget, budget_exceeded))
         return {
             "suggestions": suggestions,
             "warnings": warnings,
             "hints": hints,
-            "has_syntax_error": has_syntax_error
+            "has_syntax_error": has_syntax_error,
+            "partial": budget_exceeded is not None,
+            "budget_exceeded": budget_exceeded,
         }
     
+    @staticmethod
+    def _budget_warning(budget: AnalysisBudget, reason: str) -> Dict[str, Any]:
+        return {
+            "type": "analysis_limited",
+            "message": f"⚠️ {budget.describe(reason)}",
+            "severity": "warning",
+        }
+    
+    @timed("guide.loop_scan")
     def _has_loop_in_code(self, code: str) -> bool:
         """檢查代碼中是否有循環"""
         try:
-            tree = ast.parse(code)
+            tree = parse_code(code)
             for node in ast.walk(tree):
                 if isinstance(node, (ast.For, ast.While)):
                     return True
@@ -162,25 +349,55 @@ class RealtimeGuide:
         except:
             return False
     
-    def _detect_hardcode(self, code: str) -> bool:
-        """檢測硬編碼模式"""
-        lines = code.split('\n')
-        print_count = sum(1 for line in lines if 'print(' in line)
+    @timed("guide.hardcode_scan")
+    def _detect_hardcode(self, code: str, lines: Optional[List[str]] = None,
+                         session: Optional[GuideSession] = None, deadline: Optional[float] = None) -> List[RepeatedBlock]:
+        """
+        檢測硬編碼模式：結構相同、重複出現的語句序列（見 repeated_code.py）
         
-        # 如果有多個 print 且沒有循環，可能是硬編碼
-        if print_count > 3 and not self._has_loop_in_code(code):
-            return True
+        提供 session 時直接使用 _incremental_facts() 已解析好的區塊；
+        程式碼暫時有語法錯誤時，只檢查能單獨解析的頂層區塊。
         
-        return False
+        Returns:
+            重複的語句序列（空列表表示沒有偵測到）
+        
+        Raises:
+            TimeoutError: 完整解析的結構雜湊超過 deadline
+        """
+        if session is None:
+            try:
+                tree = parse_code(code)
+            except Exception:
+                tree = None
+            if tree is not None:
+                top_level, nested = StructuralHasher().statement_lists(tree, deadline=deadline)
+                return find_repeats([top_level] + nested)
+            session = GuideSession()
+            self._incremental_facts(code, lines if lines is not None else code.split('\n'), session)
+        
+        top_level = []
+        nested = []
+        for block, offset in session.order:
+            if not block.ok:
+                continue
+            top_level.extend((node_id, size, start + offset, end + offset, node)
+                             for node_id, size, start, end, node in block.statements)
+            nested.extend([(node_id, size, start + offset, end + offset, node)
+                           for node_id, size, start, end, node in statements]
+                          for statements in block.nested)
+        return find_repeats([top_level] + nested)
     
-    def _check_common_errors(self, code: str, current_line: str, cursor_line: int) -> List[Dict[str, Any]]:
-        """檢查常見錯誤"""
+    @timed("guide.typo_scan")
+    def _check_common_errors(self, code: str, current_line: str, cursor_line: int,
+                             lines: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """檢查常見錯誤（lines 為呼叫端已切分好的行）"""
         suggestions = []
         
         # 檢查縮排問題
         if current_line.strip() and not current_line.startswith(' ') and not current_line.startswith('\t'):
             # 檢查上一行是否以冒號結尾（需要縮排）
-            lines = code.split('\n')
+            if lines is None:
+                lines = code.split('\n')
             if cursor_line > 1:
                 prev_line = lines[cursor_line - 2].strip()
                 if prev_line.endswith(':'):
@@ -281,5 +498,75 @@ def create_guide_for_lesson(lesson: Dict[str, Any]) -> RealtimeGuide:
     return RealtimeGuide(lesson)
 
 
+def sample_program(lines: int = 500) -> str:
+    """產生約 lines 行的測試程式（由許多小函數與頂層呼叫組成）"""
+    parts = []
+    index = 0
+    while sum(part.count("\n") for part in parts) < lines:
+        parts.append(
+            f"def helper_{index}(values):\n"
+            f"    total = 0\n"
+            f"    for value in values:\n"
+            f"        if value % 2 == {index % 2}:\n"
+            f"            total += value\n"
+            f"    return total\n"
+            f"\n"
+            f"print(helper_{index}(range({index + 3})))\n"
+        )
+        index += 1
+    return "".join(parts)
+
+
+def benchmark(lines: int = 500, keystrokes: int = 200) -> Dict[str, float]:
+    """
+    模擬在大型程式中間打字，比較每次按鍵的分析耗時（毫秒，平均值）
+    
+    Returns:
+        {"lines": ..., "full_ms": ..., "incremental_ms": ...}
+    """
+    guide = RealtimeGuide({"validator": {"code_requirements": {"requires_loop": True, "forbids_hardcode": True}}})
+    base_lines = sample_program(lines).split("\n")
+    target = len(base_lines) // 2
+    while not base_lines[target].startswith("    total = 0"):
+        target += 1
+    
+    def keystroke_versions():
+        # 在同一行逐字輸入，每次按鍵都產生一份新的程式碼
+        for count in range(1, keystrokes + 1):
+            edited = list(base_lines)
+            edited[target] = f"    total = {'1' * count}"
+            yield "\n".join(edited)
+    
+    def measure(session_factory):
+        session = session_factory()
+        guide.analyze_partial_code("\n".join(base_lines), target + 1, 1, session)
+        elapsed = 0.0
+        for code in keystroke_versions():
+            start = time.perf_counter()
+            guide.analyze_partial_code(code, target + 1, 1, session)
+            elapsed += time.perf_counter() - start
+        return elapsed / keystrokes * 1000
+    
+    return {
+        "lines": len(base_lines),
+        "full_ms": measure(lambda: None),
+        "incremental_ms": measure(GuideSession),
+    }
 
 
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="實時引導效能測試：比較完整解析與增量解析的每次按鍵耗時")
+    parser.add_argument("--lines", type=int, default=500, help="測試程式的行數")
+    parser.add_argument("--keystrokes", type=int, default=200, help="模擬的按鍵次數")
+    parser.add_argument("--timings", action="store_true", help="結束時輸出每個規則的耗時統計")
+    args = parser.parse_args()
+    if args.timings:
+        RULE_TIMINGS.enable()
+    result = benchmark(args.lines, args.keystrokes)
+    print(f"程式行數：{result['lines']}")
+    print(f"完整解析：{result['full_ms']:.3f} ms / 按鍵")
+    print(f"增量解析：{result['incremental_ms']:.3f} ms / 按鍵")
+    if args.timings:
+        print()
+        print(RULE_TIMINGS.format_table())
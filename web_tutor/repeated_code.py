@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複程式碼偵測（硬編碼檢查）
+找出「應該用迴圈或函數卻複製貼上」的語句序列。
+
+做法：
+    1. 結構雜湊：由下而上替每個子樹編號，結構相同的子樹得到相同的編號（hash-consing，沒有碰撞）。
+       常數只保留種類，名稱保留原樣，因此 print(1) 與 print(2) 相同，a = 1 與 b = 2 不同
+    2. 在每個語句列表中尋找連續重複（例如 print(0) ... print(4) 五行相同結構）；
+       只有各份之間不同的常數能由迴圈產生（相同、等差數列、只差在遞增的數字）時才算，
+       因此逐行輸出不同文字的 print("...") 不會被當成硬編碼
+    3. 在所有語句列表中尋找不相鄰、但夠大的重複語句序列（複製貼上的程式區塊）
+
+整體成本與節點數成線性（語句序列的長度上限為 MAX_PERIOD）。
+"""
+
+import ast
+import math
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 語句序列最長幾個語句（同時是連續重複的最長週期）
+MAX_PERIOD = 4
+# 連續重複至少要出現幾次、合計至少多少節點（print("x") 為 5 個節點，連續 4 行才算）
+MIN_REPEATS = 3
+MIN_NODES = 16
+# 不相鄰的重複序列，每一份至少多少節點
+DUPLICATE_MIN_NODES = 20
+
+_CONTEXTS = frozenset((ast.Load, ast.Store, ast.Del))
+
+# 語句列表中的一個語句：(結構編號, 節點數, 起始行, 結束行, 語句節點)
+Statement = Tuple[int, int, int, int, ast.stmt]
+
+_DIGITS_RE = re.compile(r"(\d+)")
+
+
+class RepeatedBlock:
+    """一組重複的語句序列"""
+
+    __slots__ = ("start_line", "end_line", "statements", "copies", "nodes", "consecutive")
+
+    def __init__(self, start_line: int, end_line: int, statements: int, copies: int, nodes: int, consecutive: bool):
+        self.start_line = start_line
+        self.end_line = end_line
+        # 每一份包含幾個語句
+        self.statements = statements
+        self.copies = copies
+        # 所有副本的節點總數
+        self.nodes = nodes
+        # True：副本彼此相鄰（start_line～end_line 涵蓋全部副本）；False：只涵蓋第一份
+        self.consecutive = consecutive
+
+    def to_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (f"RepeatedBlock(lines {self.start_line}-{self.end_line}, {self.statements} statement(s) "
+                f"x {self.copies}, {self.nodes} nodes, consecutive={self.consecutive})")
+
+
+def _literal_kind(value) -> str:
+    if isinstance(value, bool) or value is None or value is Ellipsis:
+        return repr(value)
+    return type(value).__name__
+
+
+def _is_progression(numbers) -> bool:
+    step = numbers[1] - numbers[0]
+    return all(math.isclose(b - a, step, abs_tol=1e-9) for a, b in zip(numbers, numbers[1:]))
+
+
+def _follows_sequence(values: List[object]) -> bool:
+    """
+    同一個位置的常數在各份之間的變化是否能由迴圈產生
+
+    相同的值、等差數列（1, 2, 3 或 10, 20, 30）、連續的單一字元（"a", "b", "c"），
+    或除了數字之外都相同、數字部分為等差數列的字串（"第 1 題", "第 2 題"）
+    """
+    first = values[0]
+    if all(value == first and type(value) is type(first) for value in values):
+        return True
+    if all(type(value) in (int, float) for value in values):
+        return _is_progression(values)
+    if all(isinstance(value, str) for value in values):
+        if all(len(value) == 1 for value in values):
+            return _is_progression([ord(value) for value in values])
+        parts = [_DIGITS_RE.split(value) for value in values]
+        template = parts[0][0::2]
+        if any(part[0::2] != template for part in parts):
+            return False
+        return all(_is_progression([int(part[slot]) for part in parts]) for slot in range(1, len(parts[0]), 2))
+    return False
+
+
+def _varies_like_a_loop(statements: List[Statement], period: int) -> bool:
+    """連續重複的各份（每份 period 個語句）之間不同的常數是否都能由迴圈產生（見 _follows_sequence）"""
+    copies = [statements[i:i + period] for i in range(0, len(statements), period)]
+    for position in range(period):
+        # 結構相同的語句，常數在 ast.walk 中的順序也相同
+        literals = [[node.value for node in ast.walk(copy[position][4]) if type(node) is ast.Constant]
+                    for copy in copies]
+        for values in zip(*literals):
+            if not _follows_sequence(list(values)):
+                return False
+    return True
+
+
+class StructuralHasher:
+    """
+    結構雜湊表
+
+    同一個 StructuralHasher 處理的所有語法樹共用編號，因此可以分別解析的程式片段
+    （例如實時引導的每個頂層區塊）仍能互相比較。不會修改語法樹（快取中的語法樹可以直接傳入）。
+    """
+
+    def __init__(self):
+        self.table: Dict[tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def statement_lists(self, tree: ast.AST, line_offset: int = 0,
+                        deadline: Optional[float] = None) -> Tuple[List[Statement], List[List[Statement]]]:
+        """
+        由下而上走訪一次，替每個子樹編號，並收集所有語句列表
+
+        Args:
+            tree: 語法樹
+            line_offset: 加到行號上的位移（片段在完整程式中的起始行 - 1）
+            deadline: 可選，time.perf_counter() 的截止時間（每 4096 個節點檢查一次）
+
+        Returns:
+            (最外層的語句列表, 其他巢狀的語句列表)
+
+        Raises:
+            TimeoutError: 超過 deadline
+        """
+        table = self.table
+        ids: Dict[ast.AST, int] = {}
+        sizes: Dict[ast.AST, int] = {}
+        top_level: List[Statement] = []
+        nested: List[List[Statement]] = []
+        # ast.walk 是廣度優先，反過來走訪時子節點一定在父節點之前
+        for index, node in enumerate(reversed(list(ast.walk(tree)))):
+            if deadline is not None and not index & 4095 and time.perf_counter() > deadline:
+                raise TimeoutError("structural hashing exceeded the analysis deadline")
+            node_type = type(node)
+            if node_type in _CONTEXTS:
+                continue
+            size = 1
+            key = [node_type]
+            for name in node_type._fields:
+                value = getattr(node, name, None)
+                if isinstance(value, ast.AST):
+                    if type(value) in _CONTEXTS:
+                        # Load / Store / Del 只以類型區分，不另外編號
+                        key.append(type(value))
+                    else:
+                        key.append(ids[value])
+                        size += sizes[value]
+                elif isinstance(value, list):
+                    items = []
+                    for item in value:
+                        if isinstance(item, ast.AST):
+                            items.append(ids[item])
+                            size += sizes[item]
+                        else:
+                            items.append(item)
+                    key.append(tuple(items))
+                    if value and isinstance(value[0], ast.stmt):
+                        statements = [
+                            (ids[item], sizes[item], item.lineno + line_offset, item.end_lineno + line_offset, item)
+                            for item in value
+                        ]
+                        if node is tree:
+                            top_level = statements
+                        else:
+                            nested.append(statements)
+                elif node_type is ast.Constant and name == "value":
+                    key.append(_literal_kind(value))
+                else:
+                    key.append(value)
+            key = tuple(key)
+            node_id = table.get(key)
+            if node_id is None:
+                node_id = table[key] = len(table)
+            ids[node] = node_id
+            sizes[node] = size
+        return top_level, nested
+
+
+def find_repeats(statement_lists: List[List[Statement]], min_repeats: int = MIN_REPEATS,
+                 min_nodes: int = MIN_NODES, duplicate_min_nodes: int = DUPLICATE_MIN_NODES,
+                 max_period: int = MAX_PERIOD) -> List[RepeatedBlock]:
+    """
+    在語句列表中尋找重複的語句序列
+
+    先找連續重複（週期由短到長，例如六行相同的語句是 1 個語句 x 6，而不是 2 個語句 x 3；
+    各份之間不同的常數必須能由迴圈產生），再找不相鄰的重複序列（由長到短）；
+    已經被回報的語句不會再出現在其他結果中。
+
+    Args:
+        statement_lists: StructuralHasher.statement_lists() 收集的語句列表
+        min_repeats: 連續重複至少要出現的次數
+        min_nodes: 連續重複的所有副本合計至少要有的節點數
+        duplicate_min_nodes: 不相鄰的重複序列每一份至少要有的節點數
+        max_period: 序列最長的語句數
+
+    Returns:
+        RepeatedBlock 列表，依起始行排序
+    """
+    found = []
+    claimed = set()
+
+    # 1. 連續重複：ids[i] == ids[i + period] 成立的一段位置，代表以 period 為週期重複的區段
+    for list_index, statements in enumerate(statement_lists):
+        count = len(statements)
+        if count < min_repeats:
+            continue
+        ids = [statement[0] for statement in statements]
+        for period in range(1, min(max_period, count // min_repeats) + 1):
+            i = 0
+            while i + period < count:
+                if ids[i] != ids[i + period]:
+                    i += 1
+                    continue
+                j = i + 1
+                while j + period < count and ids[j] == ids[j + period]:
+                    j += 1
+                copies = (j - i + period) // period
+                end = i + copies * period
+                if copies >= min_repeats and not any((list_index, k) in claimed for k in range(i, end)):
+                    nodes = sum(statement[1] for statement in statements[i:end])
+                    if nodes >= min_nodes and _varies_like_a_loop(statements[i:end], period):
+                        found.append(RepeatedBlock(statements[i][2], statements[end - 1][3],
+                                                   period, copies, nodes, True))
+                        claimed.update((list_index, k) for k in range(i, end))
+                i = j
+
+    # 2. 不相鄰的重複序列：從重複出現的單一語句開始，每次延長一個語句，只保留仍重複的序列
+    #    （結構相同的序列節點數也相同，因此每組只需計算一次）
+    groups: Dict[tuple, List[Tuple[int, int]]] = {}
+    for list_index, statements in enumerate(statement_lists):
+        for i, statement in enumerate(statements):
+            groups.setdefault((statement[0],), []).append((list_index, i))
+    levels = [{key: places for key, places in groups.items() if len(places) > 1}]
+    for period in range(2, max_period + 1):
+        groups = {}
+        for key, places in levels[-1].items():
+            for list_index, i in places:
+                statements = statement_lists[list_index]
+                if i + period <= len(statements):
+                    groups.setdefault(key + (statements[i + period - 1][0],), []).append((list_index, i))
+        groups = {key: places for key, places in groups.items() if len(places) > 1}
+        if not groups:
+            break
+        levels.append(groups)
+
+    for period in range(len(levels), 0, -1):
+        for key, places in levels[period - 1].items():
+            list_index, i = places[0]
+            size = sum(statement[1] for statement in statement_lists[list_index][i:i + period])
+            if size < duplicate_min_nodes:
+                continue
+            # 同一個列表中重疊的位置只算一次，已被回報的語句不再使用
+            kept = []
+            last_end = {}
+            for list_index, i in places:
+                if i < last_end.get(list_index, 0):
+                    continue
+                if any((list_index, k) in claimed for k in range(i, i + period)):
+                    continue
+                kept.append((list_index, i))
+                last_end[list_index] = i + period
+            if len(kept) < 2:
+                continue
+            list_index, i = kept[0]
+            statements = statement_lists[list_index]
+            found.append(RepeatedBlock(statements[i][2], statements[i + period - 1][3],
+                                       period, len(kept), size * len(kept), False))
+            for list_index, i in kept:
+                claimed.update((list_index, k) for k in range(i, i + period))
+
+    found.sort(key=lambda block: (block.start_line, block.end_line))
+    return found
+
+
+def find_repeated_blocks(tree: ast.AST, hasher: Optional[StructuralHasher] = None,
+                         deadline: Optional[float] = None, **options) -> List[RepeatedBlock]:
+    """
+    找出一棵語法樹中的重複語句序列
+
+    Args:
+        tree: 語法樹（不會被修改）
+        hasher: 可選，共用的 StructuralHasher
+        deadline: 可選，截止時間（見 StructuralHasher.statement_lists）
+        **options: 傳給 find_repeats() 的門檻
+
+    Returns:
+        RepeatedBlock 列表
+    """
+    top_level, nested = (hasher or StructuralHasher()).statement_lists(tree, deadline=deadline)
+    return find_repeats([top_level] + nested, **options)
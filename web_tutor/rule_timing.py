@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析規則計時
+記錄代碼分析器與實時引導中每個規則（解析、循環檢查、硬編碼檢查、拼寫檢查...）的
+呼叫次數與耗時分布，用來找出哪個檢查讓評分變慢。
+
+預設關閉；以環境變數 ANALYZER_TIMING=1 或 RULE_TIMINGS.enable() 開啟。
+關閉時 @timed 的方法就是原本的函數（開啟時才換成計時版本），measure() 只多一次旗標判斷。結果可由 /api/debug/stats 讀取，或在命令列工具加上 --timings 輸出。
+"""
+
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Dict, List, Tuple
+
+# 直方圖的桶：第 0 個桶收集不到 1 微秒的呼叫，第 i 個桶收集 [2^(i-1), 2^i) 微秒，最後一個桶收集其餘
+BUCKETS = 24
+
+
+class _NullTimer:
+    """關閉計時時使用的空 context manager"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("timings", "rule", "start")
+
+    def __init__(self, timings: "RuleTimings", rule: str):
+        self.timings = timings
+        self.rule = rule
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.record(self.rule, time.perf_counter_ns() - self.start)
+        return False
+
+
+class RuleTimings:
+    """每個規則的呼叫次數、總耗時、最長耗時與對數刻度的耗時直方圖（執行緒安全）"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # 規則名稱 -> [呼叫次數, 總耗時 ns, 最長耗時 ns, 直方圖]
+        self._rules: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        # @timed 的方法：(類別, 屬性名稱, 原本的函數, 計時版本)
+        self._methods: List[Tuple[type, str, Any, Any]] = []
+
+    def enable(self) -> None:
+        self.enabled = True
+        for owner, name, _, wrapper in self._methods:
+            setattr(owner, name, wrapper)
+
+    def disable(self) -> None:
+        self.enabled = False
+        for owner, name, func, _ in self._methods:
+            setattr(owner, name, func)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._rules.clear()
+
+    def record(self, rule: str, elapsed_ns: int) -> None:
+        """記錄一次規則執行的耗時（奈秒）"""
+        bucket = min((elapsed_ns // 1000).bit_length(), BUCKETS - 1)
+        with self._lock:
+            stats = self._rules.get(rule)
+            if stats is None:
+                stats = self._rules[rule] = [0, 0, 0, [0] * BUCKETS]
+            stats[0] += 1
+            stats[1] += elapsed_ns
+            if elapsed_ns > stats[2]:
+                stats[2] = elapsed_ns
+            stats[3][bucket] += 1
+
+    def measure(self, rule: str):
+        """
+        計時一段程式碼：with RULE_TIMINGS.measure("analyzer.parse"): ...
+
+        關閉時返回共用的空 context manager
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, rule)
+
+    def timed(self, rule: str):
+        """
+        計時整個方法的裝飾器
+
+        類別建立時（__set_name__）會登記這個方法並放回原本的函數，enable() / disable() 再切換成
+        計時版本或原本的函數，因此關閉時完全沒有額外成本。用在類別以外的函數時，每次呼叫會先判斷旗標。
+        """
+        def decorator(func):
+            return _TimedMethod(self, rule, func)
+        return decorator
+
+    def export(self) -> Dict[str, Tuple[int, int, int, List[int]]]:
+        """原始統計資料（可在行程之間傳遞，見 merge）"""
+        with self._lock:
+            return {rule: (count, total, longest, list(buckets))
+                    for rule, (count, total, longest, buckets) in self._rules.items()}
+
+    def merge(self, exported: Dict[str, Tuple[int, int, int, List[int]]]) -> None:
+        """合併其他行程 export() 的統計資料"""
+        with self._lock:
+            for rule, (count, total, longest, buckets) in exported.items():
+                stats = self._rules.get(rule)
+                if stats is None:
+                    stats = self._rules[rule] = [0, 0, 0, [0] * BUCKETS]
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+                for index, value in enumerate(buckets):
+                    stats[3][index] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        可轉成 JSON 的統計摘要
+
+        百分位數是直方圖桶的上限（微秒），因此是估計值；histogram 只列出有資料的桶，
+        鍵為桶的上限（微秒）。
+        """
+        rules = {}
+        for rule, (count, total, longest, buckets) in sorted(self.export().items()):
+            rules[rule] = {
+                "count": count,
+                "total_ms": round(total / 1e6, 3),
+                "mean_us": round(total / count / 1e3, 1) if count else 0.0,
+                "max_us": round(longest / 1e3, 1),
+                "p50_us": _percentile(buckets, count, 0.50, longest),
+                "p90_us": _percentile(buckets, count, 0.90, longest),
+                "p99_us": _percentile(buckets, count, 0.99, longest),
+                "histogram": {str(_bucket_upper_us(index)): value for index, value in enumerate(buckets) if value},
+            }
+        return {"enabled": self.enabled, "rules": rules}
+
+    def format_table(self) -> str:
+        """以文字表格呈現統計摘要（依總耗時由高到低排序）"""
+        rules = self.snapshot()["rules"]
+        if not rules:
+            return "（沒有計時資料）"
+        width = max(len("rule"), *(len(rule) for rule in rules))
+        lines = [f"{'rule':<{width}}  {'count':>8}  {'total_ms':>10}  {'mean_us':>9}  {'p90_us':>9}  {'max_us':>9}"]
+        for rule, stats in sorted(rules.items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{rule:<{width}}  {stats['count']:>8}  {stats['total_ms']:>10.3f}  "
+                         f"{stats['mean_us']:>9.1f}  {stats['p90_us']:>9.1f}  {stats['max_us']:>9.1f}")
+        return "\n".join(lines)
+
+
+class _TimedMethod:
+    """@timed 返回的描述器，只存在到類別建立完成為止"""
+
+    def __init__(self, timings: RuleTimings, rule: str, func):
+        self.timings = timings
+        self.func = func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.record(rule, time.perf_counter_ns() - start)
+        self.wrapper = wrapper
+
+    def __set_name__(self, owner, name):
+        timings = self.timings
+        timings._methods.append((owner, name, self.func, self.wrapper))
+        setattr(owner, name, self.wrapper if timings.enabled else self.func)
+
+    def __call__(self, *args, **kwargs):
+        if self.timings.enabled:
+            return self.wrapper(*args, **kwargs)
+        return self.func(*args, **kwargs)
+
+
+def _bucket_upper_us(index: int) -> int:
+    return 1 << index
+
+
+def _percentile(buckets: List[int], count: int, fraction: float, longest: int) -> float:
+    if not count:
+        return 0.0
+    target = count * fraction
+    seen = 0
+    for index, value in enumerate(buckets):
+        seen += value
+        if seen >= target:
+            return float(min(_bucket_upper_us(index), round(longest / 1e3, 1)))
+    return round(longest / 1e3, 1)
+
+
+# 整個行程共用一份統計
+RULE_TIMINGS = RuleTimings(os.environ.get("ANALYZER_TIMING", "") == "1")
+
+
+def timed(rule: str):
+    """RULE_TIMINGS.timed 的簡寫"""
+    return RULE_TIMINGS.timed(rule)
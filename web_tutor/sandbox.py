@@ -0,0 +1,1040 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沙盒執行引擎
+以預先啟動的工作行程池在伺服器端執行學生程式碼。
+
+每個工作行程都是獨立的 Python 直譯器，啟動時套用 rlimit（CPU、位址空間、開啟檔案數、
+檔案大小、禁止建立子行程），之後透過管道逐一接收工作。有兩種模式：
+
+    fork（預設）：工作行程是 fork server，啟動時預先載入課程常用的標準函式庫並建立好
+        自訂 builtins，每個工作 fork 一個 copy-on-write 子行程執行，每次執行都是乾淨的狀態，
+        額外成本接近一次 fork()。牆鐘逾時由工作行程終止子行程。
+    prefork：工作行程直接在自己的直譯器中執行工作（不需要 fork），
+        父行程負責牆鐘逾時，超時的工作行程會被直接終止並在背景補上新的行程。
+
+管道上的訊息為「4 bytes 長度 + UTF-8 JSON」的訊框：
+    伺服器 -> 工作行程：{"op": "run", "job": ..., "code": ..., "inputs": [...], "stream": bool, "interactive": bool,
+                         "expect": {"expected": str, "prefix": bool} | null}
+                        {"op": "input", "job": ..., "value": str | null}
+    工作行程 -> 伺服器：{"event": "ready"} / {"event": "result", "job": ..., "stdout": ..., ...}
+                        {"event": "output", "job": ..., "stream": "stdout" | "stderr", "data": ...}
+                        {"event": "input_request", "job": ...}
+
+串流模式（"stream": true）下，輸出會分批以 output 事件即時送出。訊框經由阻塞的管道傳遞，
+伺服器讀得慢時管道會被填滿，學生程式的 print() 就會暫停，因此不需要在任何一端無限制地緩衝。
+互動模式（"interactive": true）下，input() 會送出 input_request 並阻塞，
+直到伺服器回覆 input 訊息（value 為 null 時 input() 拋出 EOFError）。
+評分時可以附上 expect：stdout 一確定與預期輸出不符就停止程式（status 為 output_diverged），
+錯誤的答案不必執行到結束或逾時。
+
+工作行程不繼承伺服器的環境變數，在空的暫存目錄中執行；以 root 啟動時可透過 SandboxLimits.user
+切換到無特權的使用者（此時 RLIMIT_NPROC 才真正生效）。
+
+注意：rlimit 只能限制資源用量，並不能阻止程式讀取檔案或連線網路；
+正式環境仍應搭配容器或 nsjail 等作業系統層級的隔離。
+"""
+
+import builtins
+import gc
+import io
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # 非 POSIX 平台（例如 Windows）沒有 resource 模組，無法提供沙盒
+    resource = None
+
+SANDBOX_AVAILABLE = resource is not None and os.name == "posix"
+
+# Bounded stdout / stderr capture shared with tutor.run_code and main.run_code_sync
+try:
+    from .output_capture import BoundedOutput, ExpectedOutput, OutputDiverged, OutputLimitExceeded
+except ImportError:
+    from output_capture import BoundedOutput, ExpectedOutput, OutputDiverged, OutputLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+_FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+# --- Framing ---
+
+def write_frame(fd: int, message: Dict[str, Any]) -> None:
+    """寫入一個訊框（阻塞直到全部寫完）"""
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    view = memoryview(_FRAME_HEADER.pack(len(data)) + data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class FrameReader:
+    """從檔案描述符讀取訊框，支援逾時"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.buffer = bytearray()
+
+    def has_frame(self) -> bool:
+        """緩衝區中是否已有完整的訊框（可以不等待 fd 直接讀取）"""
+        if len(self.buffer) < _FRAME_HEADER.size:
+            return False
+        (length,) = _FRAME_HEADER.unpack_from(self.buffer)
+        return len(self.buffer) >= _FRAME_HEADER.size + length
+
+    def read(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        讀取下一個訊框
+
+        Returns:
+            訊息 dict；對方關閉管道時返回 None
+
+        Raises:
+            TimeoutError: 在 timeout 秒內沒有收到完整訊框
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if len(self.buffer) >= _FRAME_HEADER.size:
+                (length,) = _FRAME_HEADER.unpack_from(self.buffer)
+                if length > MAX_FRAME_SIZE:
+                    raise ValueError(f"frame too large: {length} bytes")
+                end = _FRAME_HEADER.size + length
+                if len(self.buffer) >= end:
+                    data = bytes(self.buffer[_FRAME_HEADER.size:end])
+                    del self.buffer[:end]
+                    return json.loads(data.decode("utf-8"))
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError
+                ready, _, _ = select.select([self.fd], [], [], remaining)
+                if not ready:
+                    raise TimeoutError
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                return None
+            self.buffer += chunk
+
+
+# --- Limits ---
+
+class SandboxLimits:
+    """沙盒資源限制"""
+
+    def __init__(
+        self,
+        cpu_seconds: int = 5,
+        wall_seconds: float = 10.0,
+        memory_bytes: int = 256 * 1024 * 1024,
+        max_output: int = 64 * 1024,
+        max_open_files: int = 64,
+        max_file_size: int = 1024 * 1024,
+        max_jobs_per_worker: int = 200,
+        max_stream_output: int = 4 * 1024 * 1024,
+        stop_on_output_limit: bool = True,
+        user: Optional[str] = None,
+    ):
+        """
+        Args:
+            cpu_seconds: 每個工作可使用的 CPU 秒數
+            wall_seconds: 每個工作的牆鐘時間上限，超過即終止工作行程
+            memory_bytes: 工作行程的位址空間上限
+            max_output: stdout / stderr 各自最多保留的位元組數（保留開頭與結尾，見 output_capture.BoundedOutput）
+            max_open_files: 可同時開啟的檔案描述符數量
+            max_file_size: 可寫入檔案的最大大小
+            max_jobs_per_worker: prefork 模式下工作行程處理多少個工作後重新啟動（避免狀態累積）
+            max_stream_output: 串流模式下 stdout + stderr 最多送出的字元數
+            stop_on_output_limit: 非串流模式下 stdout 超過 max_output 時立即停止程式（status 為 output_limit），
+                而不是讓失控的 print() 執行到逾時
+            user: 以 root 啟動時，工作行程切換到這個使用者（名稱或 uid）執行；
+                非 root 使用者的 RLIMIT_NPROC 才會生效，程式也只能存取該使用者有權限的檔案
+        """
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_bytes
+        self.max_output = max_output
+        self.max_open_files = max_open_files
+        self.max_file_size = max_file_size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_stream_output = max_stream_output
+        self.stop_on_output_limit = stop_on_output_limit
+        self.user = user
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+# --- Worker side ---
+
+class OutputStreamer:
+    """
+    串流模式下把 stdout / stderr 的寫入分批送出
+
+    累積到 FLUSH_SIZE 個字元，或第一筆未送出的資料等待超過 FLUSH_INTERVAL 秒
+    （以 SIGALRM 計時，程式在 sleep 或計算時也會送出）就送出一個 output 事件。
+    stdout 與 stderr 交錯寫入時會先送出前一個串流的資料，保持輸出順序。
+    """
+
+    FLUSH_SIZE = 4096
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(self, emit, job_id: Any, limit: int):
+        """
+        Args:
+            emit: 送出一個訊息的函數（寫入訊框管道，管道滿時會阻塞）
+            job_id: 工作 ID
+            limit: 最多送出的字元數，超過的部分丟棄並標記 truncated
+        """
+        self.emit = emit
+        self.job_id = job_id
+        self.limit = limit
+        self.sent = 0
+        self.truncated = False
+        self._stream: Optional[str] = None
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._busy = False
+        self._old_handler = None
+
+    def start(self) -> None:
+        self._old_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+
+    def _on_alarm(self, signum, frame) -> None:
+        # 訊號可能在 add() / flush() 執行到一半時到達，這時交給它們自己送出
+        if not self._busy:
+            self.flush()
+
+    def add(self, stream: str, text: str) -> None:
+        self._busy = True
+        try:
+            if stream != self._stream:
+                self._flush()
+                self._stream = stream
+            room = self.limit - self.sent - self._pending_size
+            if len(text) > room:
+                self.truncated = True
+                text = text[:max(room, 0)]
+            if not text:
+                return
+            if not self._pending:
+                signal.setitimer(signal.ITIMER_REAL, self.FLUSH_INTERVAL)
+            self._pending.append(text)
+            self._pending_size += len(text)
+            if self._pending_size >= self.FLUSH_SIZE:
+                self._flush()
+        finally:
+            self._busy = False
+
+    def flush(self) -> None:
+        self._busy = True
+        try:
+            self._flush()
+        finally:
+            self._busy = False
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        data = "".join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        self.sent += len(data)
+        self.emit({"event": "output", "job": self.job_id, "stream": self._stream, "data": data})
+
+    def finish(self) -> None:
+        """送出剩餘的資料並還原 SIGALRM 處理函數"""
+        self.flush()
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        if self._old_handler is not None:
+            signal.signal(signal.SIGALRM, self._old_handler)
+
+
+class StreamingOutput(BoundedOutput):
+    """寫入時同時交給 OutputStreamer 送出，並照常保留有上限的內容供評分使用"""
+
+    def __init__(self, limit: int, name: str, streamer: OutputStreamer):
+        super().__init__(limit)
+        self.name = name
+        self.streamer = streamer
+
+    def write(self, s: str) -> int:
+        written = super().write(s)
+        self.streamer.add(self.name, s)
+        return written
+
+    def flush(self) -> None:
+        self.streamer.flush()
+
+
+def _set_limit(name: str, soft: int, hard: Optional[int] = None) -> None:
+    try:
+        resource.setrlimit(getattr(resource, name), (soft, soft if hard is None else hard))
+    except (AttributeError, ValueError, OSError):
+        # 平台不支援或權限不足時略過該項限制
+        pass
+
+
+def _apply_worker_limits(limits: Dict[str, Any], allow_fork: bool = False) -> None:
+    """套用整個工作行程生命週期內不變的 rlimit"""
+    _set_limit("RLIMIT_AS", limits["memory_bytes"])
+    _set_limit("RLIMIT_NOFILE", limits["max_open_files"])
+    _set_limit("RLIMIT_FSIZE", limits["max_file_size"])
+    _set_limit("RLIMIT_CORE", 0)
+    if not allow_fork:
+        _set_limit("RLIMIT_NPROC", 0)
+
+
+def _arm_cpu_limit(cpu_seconds: int) -> None:
+    """以目前累計的 CPU 時間為基準，再給這個工作 cpu_seconds 秒"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _blocked(*args, **kwargs):
+    raise PermissionError("沙盒中不允許建立子行程")
+
+
+def _drop_privileges(user: str) -> None:
+    """
+    以 root 執行時切換到指定的使用者（名稱或 uid）
+
+    Raises:
+        KeyError / OSError: 找不到使用者或無法切換，工作行程因此無法啟動
+    """
+    if os.getuid() != 0:
+        return
+    import pwd
+    entry = pwd.getpwuid(int(user)) if str(user).isdigit() else pwd.getpwnam(user)
+    os.setgroups([])
+    os.setgid(entry.pw_gid)
+    os.setuid(entry.pw_uid)
+
+
+def _disable_process_spawning() -> None:
+    """
+    移除建立子行程的函數（RLIMIT_NPROC 對 root 無效，這裡再多一層保護）
+    os 的這些函數來自 posix 模組，兩個模組都要移除，否則 import posix 就能繞過
+    """
+    import posix
+    for name in ("fork", "forkpty", "system", "popen", "posix_spawn", "posix_spawnp",
+                 "execv", "execve", "execl", "execle", "execlp", "execlpe", "execvp", "execvpe",
+                 "spawnv", "spawnve", "spawnl", "spawnle", "spawnlp", "spawnlpe", "spawnvp", "spawnvpe"):
+        for module in (os, posix):
+            if hasattr(module, name):
+                setattr(module, name, _blocked)
+    import subprocess as _subprocess
+    _subprocess.Popen._execute_child = _blocked
+    try:
+        import _posixsubprocess
+        _posixsubprocess.fork_exec = _blocked
+    except ImportError:
+        pass
+
+
+# 工作行程啟動時建立一次，每個工作只複製一份
+_BASE_BUILTINS = dict(vars(builtins))
+
+# fork 模式下需要保留真正的 fork（_disable_process_spawning 只在子行程中套用）
+_fork = os.fork if hasattr(os, "fork") else None
+
+# fork server 預先載入的模組（課程中會用到的標準函式庫），子行程 import 時只是查表
+PRELOAD_MODULES = (
+    "random", "copy", "math", "string", "collections", "itertools", "functools",
+    "datetime", "time", "re", "json", "statistics", "decimal", "fractions",
+)
+
+
+# fork server 在 fork 之前先編譯不超過這個長度的程式碼，子行程直接沿用編譯好的 code object；
+# 更長的程式碼仍在有 CPU 限制的子行程中編譯
+PRECOMPILE_MAX_CHARS = 100_000
+
+# 最近一次編譯的 (原始碼, code object 或編譯時的例外)；同一份程式碼執行多個測試案例時只編譯一次
+_compiled = (None, None)
+
+
+def _compile_student_code(source: str):
+    """
+    編譯學生程式碼（快取最近一份）
+
+    Raises:
+        編譯時的例外（SyntaxError、ValueError...），之後每次呼叫都再次拋出
+    """
+    global _compiled
+    cached_source, compiled = _compiled
+    if cached_source != source:
+        try:
+            compiled = compile(source, "<student>", "exec")
+        except Exception as e:
+            compiled = e
+        _compiled = (source, compiled)
+    if isinstance(compiled, Exception):
+        raise compiled
+    return compiled
+
+
+def _format_exception(exc: BaseException) -> str:
+    """格式化例外，只保留學生程式碼的堆疊"""
+    tb = exc.__traceback__
+    # 略過 execute_job 自己的堆疊框
+    while tb is not None and tb.tb_frame.f_code.co_filename != "<student>":
+        tb = tb.tb_next
+    # 也截掉學生程式碼呼叫進沙盒內部（例如互動模式的 input()）的堆疊框
+    node = tb
+    while node is not None and node.tb_next is not None:
+        if node.tb_next.tb_frame.f_code.co_filename == __file__:
+            node.tb_next = None
+        node = node.tb_next
+    if isinstance(exc, SyntaxError):
+        tb = None
+    return "".join(traceback.format_exception(type(exc), exc, tb))
+
+
+def execute_job(job: Dict[str, Any], limits: Dict[str, Any], emit=None, receive=None) -> Dict[str, Any]:
+    """
+    在目前行程中執行一個工作並返回結果訊息
+
+    Args:
+        job: {"job": ..., "code": ..., "inputs": [...], "stream": bool, "interactive": bool, "expect": dict | None}
+        limits: SandboxLimits.as_dict()
+        emit: 送出訊息的函數；job 要求串流時，輸出會經由它以 output 事件送出
+        receive: 讀取下一個伺服器訊息的函數（互動模式的 input() 用它等待回覆）
+    """
+    job_id = job.get("job")
+    inputs = list(job.get("inputs") or [])
+    input_index = [0]
+    interactive = bool(job.get("interactive")) and emit is not None and receive is not None
+    streamer = None
+    if (job.get("stream") or interactive) and emit is not None:
+        streamer = OutputStreamer(emit, job_id, limits["max_stream_output"])
+        stdout = StreamingOutput(limits["max_output"], "stdout", streamer)
+        stderr = StreamingOutput(limits["max_output"], "stderr", streamer)
+        streamer.start()
+    else:
+        expect = job.get("expect")
+        if expect is not None:
+            expect = ExpectedOutput(expect.get("expected") or "", bool(expect.get("prefix")))
+        stdout = BoundedOutput(limits["max_output"], stop=limits.get("stop_on_output_limit", False), expect=expect)
+        stderr = BoundedOutput(limits["max_output"])
+
+    def custom_input(prompt=""):
+        """Custom input() function that reads from the provided inputs list."""
+        # Print the prompt if provided (standard input() behavior)
+        if prompt:
+            stdout.write(str(prompt))
+        if input_index[0] < len(inputs):
+            value = inputs[input_index[0]]
+            input_index[0] += 1
+            return value
+        # If no more inputs available, return empty string
+        return ""
+
+    def interactive_input(prompt=""):
+        """input() that asks the server for the next line and blocks until it arrives."""
+        if prompt:
+            stdout.write(str(prompt))
+        streamer.flush()
+        emit({"event": "input_request", "job": job_id})
+        while True:
+            reply = receive()
+            if reply is None:
+                raise EOFError("EOF when reading a line")
+            if reply.get("op") == "input" and reply.get("job") == job_id:
+                break
+        if reply.get("value") is None:
+            raise EOFError("EOF when reading a line")
+        return str(reply["value"])
+
+    custom_builtins = dict(_BASE_BUILTINS)
+    custom_builtins["input"] = interactive_input if interactive else custom_input
+    custom_globals = {"__builtins__": custom_builtins, "__name__": "__main__"}
+
+    status = "ok"
+    old_stdout, old_stderr, old_stdin = sys.stdout, sys.stderr, sys.stdin
+    sys.stdout, sys.stderr, sys.stdin = stdout, stderr, io.StringIO()
+    start = time.perf_counter()
+    try:
+        exec(_compile_student_code(job["code"]), custom_globals)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "error"
+            stderr.write(f"SystemExit: {e.code}\n")
+    except OutputDiverged:
+        # 保留到不符為止的輸出，評分時照常比對（一定不通過）
+        status = "output_diverged"
+    except OutputLimitExceeded:
+        status = "output_limit"
+        stderr.write(_FAILURE_MESSAGES["output_limit"].format(**limits) + "\n")
+    except BaseException as e:
+        status = "error"
+        stderr.write(_format_exception(e))
+    finally:
+        duration = time.perf_counter() - start
+        sys.stdout, sys.stderr, sys.stdin = old_stdout, old_stderr, old_stdin
+        if streamer is not None:
+            streamer.finish()
+
+    return {
+        "event": "result",
+        "job": job_id,
+        "status": status,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "truncated": stdout.truncated or stderr.truncated or (streamer is not None and streamer.truncated),
+        "duration": duration,
+    }
+
+
+def _exit_reason(returncode: int) -> str:
+    """行程意外結束時，依結束訊號說明可能的原因"""
+    if returncode == -signal.SIGXCPU:
+        return "cpu_limit"
+    if returncode == -signal.SIGXFSZ:
+        return "file_size_limit"
+    return "crashed"
+
+
+_FAILURE_MESSAGES = {
+    "timeout": "執行逾時：程式執行超過 {wall_seconds} 秒，請檢查是否有無窮迴圈。",
+    "cpu_limit": "執行逾時：程式使用的 CPU 時間超過 {cpu_seconds} 秒，請檢查是否有無窮迴圈。",
+    "file_size_limit": "寫入的檔案超過大小限制。",
+    "crashed": "執行環境異常結束（可能是記憶體不足）。",
+    "busy": "伺服器忙碌中，目前沒有可用的執行環境，請稍後再試。",
+    "unavailable": "伺服器的執行環境暫時無法啟動，請稍後再試或改用瀏覽器執行。",
+    "cancelled": "執行已取消。",
+    "skipped": "先前的測試案例未通過，這個案例沒有執行。",
+    "output_limit": "輸出超過 {max_output} 位元組，程式已停止。請檢查是否有無窮迴圈一直在 print()。",
+}
+
+
+def failure_result(status: str, limits: Dict[str, Any], duration: float, job_id: Any = None) -> Dict[str, Any]:
+    """建立執行失敗（逾時、超過限制、異常結束）的結果訊息"""
+    return {
+        "event": "result",
+        "job": job_id,
+        "status": status,
+        "stdout": "",
+        "stderr": _FAILURE_MESSAGES[status].format(**limits),
+        "truncated": False,
+        "duration": duration,
+    }
+
+
+def _run_forked(job: Dict[str, Any], limits: Dict[str, Any], server: FrameReader, out_fd: int) -> Dict[str, Any]:
+    """
+    fork 一個子行程執行工作，並在牆鐘逾時後終止它
+    子行程送出的 output / input_request 事件直接轉送給伺服器，伺服器回覆的 input 訊息再轉送給子行程。
+
+    Args:
+        server: 讀取伺服器訊息的 FrameReader
+        out_fd: 送往伺服器的管道
+        （子行程會先關閉這兩個管道）
+    """
+    global _fork
+    result_r, result_w = os.pipe()
+    input_r, input_w = os.pipe()
+    job_id = job.get("job")
+    timeout = job.get("timeout") or limits["wall_seconds"]
+    start = time.monotonic()
+    if len(job["code"]) <= PRECOMPILE_MAX_CHARS:
+        try:
+            _compile_student_code(job["code"])
+        except Exception:
+            # 子行程會再次拋出同一個例外並回報
+            pass
+    pid = _fork()
+    if pid == 0:
+        # 子行程：只保留與工作行程之間的管道，套用每個工作的限制後執行
+        try:
+            os.close(result_r)
+            os.close(input_w)
+            for fd in (server.fd, out_fd):
+                os.close(fd)
+            _set_limit("RLIMIT_CPU", limits["cpu_seconds"], limits["cpu_seconds"] + 1)
+            _set_limit("RLIMIT_NPROC", 0)
+            # os.fork 等函數在工作行程中已被移除，這裡再丟掉僅存的參照
+            _fork = None
+            emit = lambda message: write_frame(result_w, message)
+            write_frame(result_w, execute_job(job, limits, emit, FrameReader(input_r).read))
+        finally:
+            os._exit(0)
+
+    os.close(result_w)
+    os.close(input_r)
+    reader = FrameReader(result_r)
+    # 只有互動模式需要同時等待伺服器的 input 訊息
+    watched = [result_r, server.fd] if job.get("interactive") else [result_r]
+    message = None
+    killed = False
+    try:
+        while True:
+            server_ready = len(watched) > 1 and server.has_frame()
+            if not server_ready and not reader.has_frame():
+                remaining = timeout - (time.monotonic() - start)
+                ready, _, _ = select.select(watched, [], [], max(remaining, 0))
+                if not ready:
+                    raise TimeoutError
+                server_ready = server.fd in ready and result_r not in ready
+            if server_ready:
+                reply = server.read()
+                if reply is None:
+                    # 伺服器已關閉管道，沒有必要再等這個工作
+                    raise TimeoutError
+                if reply.get("op") == "input" and reply.get("job") == job_id:
+                    write_frame(input_w, reply)
+                continue
+            message = reader.read(timeout=max(timeout - (time.monotonic() - start), 0))
+            if message is None or message.get("event") == "result":
+                break
+            write_frame(out_fd, message)
+            message = None
+    except (TimeoutError, ValueError):
+        message = None
+        killed = True
+        os.kill(pid, signal.SIGKILL)
+    finally:
+        os.close(result_r)
+        os.close(input_w)
+    _, wait_status = os.waitpid(pid, 0)
+    if message is not None:
+        return message
+    duration = time.monotonic() - start
+    if killed:
+        return failure_result("timeout", limits, duration, job_id)
+    return failure_result(_exit_reason(os.waitstatus_to_exitcode(wait_status)), limits, duration, job_id)
+
+
+def worker_main(in_fd: int, out_fd: int, limits: Dict[str, Any], mode: str = "fork") -> None:
+    """工作行程主迴圈：逐一接收並執行工作"""
+    # 學生程式直接寫入 fd 0/1/2 的內容一律丟棄，不會干擾訊框管道
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    fork_mode = mode == "fork"
+    _apply_worker_limits(limits, allow_fork=fork_mode)
+    if fork_mode:
+        for name in PRELOAD_MODULES:
+            try:
+                __import__(name)
+            except ImportError:
+                pass
+        # 預先載入的物件移出 GC 追蹤，子行程執行 GC 時不會碰到這些頁面而破壞 copy-on-write
+        gc.freeze()
+    if limits.get("user"):
+        _drop_privileges(limits["user"])
+    # fork 模式使用模組載入時保存的 _fork，因此兩種模式都可以在這裡一次移除
+    _disable_process_spawning()
+
+    reader = FrameReader(in_fd)
+    write_frame(out_fd, {"event": "ready", "pid": os.getpid(), "mode": mode})
+    while True:
+        message = reader.read()
+        if message is None:
+            break
+        if message.get("op") != "run":
+            continue
+        if fork_mode:
+            write_frame(out_fd, _run_forked(message, limits, reader, out_fd))
+        else:
+            _arm_cpu_limit(limits["cpu_seconds"])
+            write_frame(out_fd, execute_job(message, limits, lambda event: write_frame(out_fd, event), reader.read))
+
+
+# --- Server side ---
+
+# 工作行程只保留這些環境變數
+WORKER_ENV_KEEP = ("PATH", "LANG")
+
+
+def worker_environment() -> Dict[str, str]:
+    """工作行程的最小環境變數"""
+    env = {name: os.environ[name] for name in WORKER_ENV_KEEP if name in os.environ}
+    env.setdefault("PATH", os.defpath)
+    env.setdefault("LANG", "C.UTF-8")
+    return env
+
+
+class SandboxWorker:
+    """伺服器端對一個工作行程的控制代碼"""
+
+    def __init__(self, limits: SandboxLimits, mode: str = "fork", startup_timeout: float = 10.0):
+        self.mode = mode
+        # 工作行程不繼承伺服器的環境變數（可能含有金鑰），並在一個空的暫存目錄中執行
+        self.workdir = tempfile.mkdtemp(prefix="sandbox-")
+        if limits.user and os.getuid() == 0:
+            user = limits.user
+            shutil.chown(self.workdir, int(user) if str(user).isdigit() else user)
+        to_worker_r, to_worker_w = os.pipe()
+        from_worker_r, from_worker_w = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-E", "-s", WORKER_SCRIPT, "--worker",
+                 str(to_worker_r), str(from_worker_w), json.dumps(limits.as_dict()), mode],
+                pass_fds=(to_worker_r, from_worker_w),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                start_new_session=True,
+                env=worker_environment(),
+                cwd=self.workdir,
+            )
+        except OSError:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            raise
+        finally:
+            os.close(to_worker_r)
+            os.close(from_worker_w)
+        self.to_fd = to_worker_w
+        self.reader = FrameReader(from_worker_r)
+        self.jobs = 0
+
+        try:
+            ready = self.reader.read(timeout=startup_timeout)
+        except TimeoutError:
+            ready = None
+        if not ready or ready.get("event") != "ready":
+            self.kill()
+            raise RuntimeError("sandbox worker failed to start")
+
+    def send(self, message: Dict[str, Any]) -> None:
+        write_frame(self.to_fd, message)
+
+    def kill(self) -> None:
+        """終止工作行程（連同它可能建立的任何子行程）並釋放管道"""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+        for fd in (self.to_fd, self.reader.fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def exit_reason(self) -> str:
+        """工作行程意外結束時，說明可能的原因"""
+        return _exit_reason(self.process.wait())
+
+
+class ExecutionPool:
+    """
+    預先啟動的沙盒工作行程池
+
+    run() 是阻塞且執行緒安全的，可以同時從多個執行緒呼叫；
+    同時執行的工作數量等於工作行程數量，其餘呼叫會排隊等待。
+
+    結束的工作行程會在背景補上；啟動失敗時依指數退避延後重試（下一次 run() 時才再嘗試），
+    沒有任何存活或啟動中的工作行程時，run() 立即返回 unavailable，而不是等到 acquire_timeout。
+    """
+
+    # fork 模式下由工作行程負責牆鐘逾時，父行程只在多等這段時間仍無回應時才介入
+    FORK_GRACE_SECONDS = 2.0
+    # 工作行程啟動失敗後的重試間隔（秒）：每次連續失敗加倍，最多 SPAWN_BACKOFF_MAX
+    SPAWN_BACKOFF_BASE = 0.5
+    SPAWN_BACKOFF_MAX = 30.0
+    # 等待閒置工作行程時，每隔這段時間檢查一次工作行程池是否已經沒有任何工作行程
+    ACQUIRE_POLL_SECONDS = 0.25
+
+    def __init__(self, size: int = 2, limits: Optional[SandboxLimits] = None, acquire_timeout: float = 30.0,
+                 mode: Optional[str] = None):
+        """
+        Args:
+            size: 工作行程數量
+            limits: 資源限制
+            acquire_timeout: 等待閒置工作行程的最長秒數
+            mode: "fork" 或 "prefork"；預設在支援 fork 的平台使用 fork
+        """
+        if mode is None:
+            mode = "fork" if _fork is not None else "prefork"
+        if mode not in ("fork", "prefork"):
+            raise ValueError(f"unknown sandbox mode: {mode}")
+        self.mode = mode
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.limits = limits or SandboxLimits()
+        self._idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self._job_ids = itertools.count(1)
+        self._closed = False
+        # 存活（閒置或執行中）與啟動中的工作行程數量，以及連續啟動失敗的次數
+        self._lock = threading.Lock()
+        self._live = 0
+        self._spawning = 0
+        self._spawn_failures = 0
+        self._retry_at = 0.0
+
+    def start(self) -> "ExecutionPool":
+        """
+        啟動所有工作行程
+
+        Raises:
+            RuntimeError: 沒有任何工作行程成功啟動（部分失敗時只記錄警告，之後在背景補上）
+        """
+        with self._lock:
+            self._spawning += self.size
+        threads = [threading.Thread(target=self._spawn) for _ in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._live == 0:
+            self.close()
+            raise RuntimeError(f"none of the {self.size} sandbox workers could be started")
+        if self._live < self.size:
+            logger.warning("only %d of %d sandbox workers started", self._live, self.size)
+        return self
+
+    def _spawn(self) -> None:
+        """啟動一個工作行程（呼叫前已計入 _spawning）"""
+        worker = None
+        error = None
+        if not self._closed:
+            try:
+                worker = SandboxWorker(self.limits, self.mode)
+            except (OSError, RuntimeError) as e:
+                error = e
+        with self._lock:
+            self._spawning -= 1
+            if worker is None:
+                if error is not None:
+                    self._spawn_failures += 1
+                    delay = min(self.SPAWN_BACKOFF_BASE * 2 ** (self._spawn_failures - 1), self.SPAWN_BACKOFF_MAX)
+                    self._retry_at = time.monotonic() + delay
+                    logger.warning("could not start a sandbox worker (%s); retrying in %.1f s", error, delay)
+                return
+            self._spawn_failures = 0
+            closed = self._closed
+            if not closed:
+                self._live += 1
+        if closed:
+            worker.kill()
+        else:
+            self._idle.put(worker)
+
+    def _replenish(self) -> None:
+        """在背景補上缺少的工作行程（上次啟動失敗後，退避時間過了才重試）"""
+        with self._lock:
+            missing = self.size - self._live - self._spawning
+            if self._closed or missing <= 0 or time.monotonic() < self._retry_at:
+                return
+            self._spawning += missing
+        for _ in range(missing):
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _retire(self, worker: SandboxWorker) -> None:
+        """終止工作行程並在背景補上一個新的"""
+        worker.kill()
+        with self._lock:
+            self._live -= 1
+        self._replenish()
+
+    def _acquire(self) -> Optional[SandboxWorker]:
+        """
+        取得一個閒置的工作行程
+
+        Returns:
+            工作行程；沒有任何存活或啟動中的工作行程時立即返回 None
+
+        Raises:
+            queue.Empty: 等待超過 acquire_timeout
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            self._replenish()
+            try:
+                return self._idle.get(timeout=min(self.ACQUIRE_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._live == 0 and self._spawning == 0:
+                    return None
+            if time.monotonic() >= deadline:
+                raise queue.Empty
+
+    def stats(self) -> Dict[str, Any]:
+        """工作行程池的狀態（供 /api/debug/stats 監控）"""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "size": self.size,
+                "live": self._live,
+                "idle": self._idle.qsize(),
+                "spawning": self._spawning,
+                "spawn_failures": self._spawn_failures,
+                "retry_in": max(self._retry_at - time.monotonic(), 0.0) if self._spawn_failures else 0.0,
+            }
+
+    def _failure(self, status: str, duration: float) -> Dict[str, Any]:
+        result = failure_result(status, self.limits.as_dict(), duration)
+        result.pop("event")
+        result.pop("job")
+        return result
+
+    def run(self, code: str, inputs: Optional[List[str]] = None, timeout: Optional[float] = None,
+            on_output=None, on_input=None, expect: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        在沙盒中執行程式碼
+
+        Args:
+            code: Python 程式碼
+            inputs: input() 依序取得的輸入值
+            timeout: 牆鐘逾時秒數（預設使用 limits.wall_seconds）
+            on_output: 提供時以串流模式執行，每批輸出呼叫一次 on_output(stream, data)；
+                它阻塞時學生程式也會暫停輸出（背壓），返回 False 則取消執行
+            on_input: 提供時以互動模式執行，程式呼叫 input() 時呼叫 on_input() 取得輸入：
+                返回字串作為輸入、None 表示 EOF、False 則取消執行（inputs 會被忽略）
+            expect: 可選，{"expected": 預期輸出, "prefix": 是否只比對開頭}；stdout 確定不符時立即停止程式
+                （只用於非串流、非互動的執行）
+
+        Returns:
+            {"status", "stdout", "stderr", "truncated", "duration"}
+            status 為 ok / error / output_diverged / output_limit / timeout / cpu_limit / file_size_limit / crashed / busy /
+                unavailable / cancelled
+        """
+        if self._closed:
+            raise RuntimeError("execution pool is closed")
+        timeout = self.limits.wall_seconds if timeout is None else timeout
+        job_id = next(self._job_ids)
+        start = time.monotonic()
+        try:
+            worker = self._acquire()
+        except queue.Empty:
+            return self._failure("busy", time.monotonic() - start)
+        if worker is None:
+            return self._failure("unavailable", time.monotonic() - start)
+        healthy = False
+        deadline = timeout + (self.FORK_GRACE_SECONDS if self.mode == "fork" else 0)
+        try:
+            worker.send({"op": "run", "job": job_id, "code": code, "inputs": list(inputs or []), "timeout": timeout,
+                         "stream": on_output is not None, "interactive": on_input is not None, "expect": expect})
+            while True:
+                remaining = deadline - (time.monotonic() - start)
+                message = worker.reader.read(timeout=max(remaining, 0))
+                if message is None:
+                    return self._failure(worker.exit_reason(), time.monotonic() - start)
+                if message.get("job") != job_id:
+                    continue
+                if message.get("event") == "output":
+                    if on_output is not None and on_output(message["stream"], message["data"]) is False:
+                        # 工作仍在執行，工作行程會在 finally 中被終止並補上新的
+                        return self._failure("cancelled", time.monotonic() - start)
+                    continue
+                if message.get("event") == "input_request":
+                    value = on_input() if on_input is not None else None
+                    if value is False:
+                        return self._failure("cancelled", time.monotonic() - start)
+                    worker.send({"op": "input", "job": job_id, "value": value})
+                    continue
+                if message.get("event") == "result":
+                    healthy = True
+                    message.pop("event", None)
+                    message.pop("job", None)
+                    return message
+        except TimeoutError:
+            return self._failure("timeout", time.monotonic() - start)
+        except (OSError, ValueError):
+            return self._failure("crashed", time.monotonic() - start)
+        finally:
+            worker.jobs += 1
+            # fork 模式下學生程式不會在工作行程本身執行，不需要定期重啟
+            recycle = self.mode == "prefork" and worker.jobs >= self.limits.max_jobs_per_worker
+            if healthy and not recycle and not self._closed:
+                self._idle.put(worker)
+            else:
+                self._retire(worker)
+
+    def run_cases(self, code: str, cases: List[List[str]], timeout: Optional[float] = None,
+                  check=None, stop_on_failure: bool = False, max_parallel: Optional[int] = None,
+                  expects: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        """
+        以多組輸入執行同一份程式碼，各測試案例分散到工作行程中並行執行
+
+        編譯只在工作行程端進行一次（fork 模式下子行程直接沿用 fork server 編譯好的 code object），
+        伺服器行程不編譯學生程式碼。
+
+        Args:
+            code: Python 程式碼
+            cases: 每個測試案例的 input() 輸入值
+            timeout: 每個案例的牆鐘逾時秒數（預設使用 limits.wall_seconds）
+            check: 可選，check(index, result) 判斷一個案例是否通過
+            stop_on_failure: 有案例未通過（check 返回 False）後不再開始新的案例，
+                尚未執行的案例 status 為 skipped；已在執行中的案例會執行完畢
+            max_parallel: 同時執行的案例數量上限（預設為工作行程數量）
+            expects: 可選，每個案例的 expect（見 run()）
+
+        Returns:
+            依 cases 順序排列的結果（格式同 run()）
+        """
+        if not cases:
+            return []
+        results: List[Optional[Dict[str, Any]]] = [None] * len(cases)
+        pending = iter(range(len(cases)))
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def run_pending():
+            while True:
+                with lock:
+                    index = next(pending, None)
+                if index is None:
+                    return
+                if failed.is_set():
+                    results[index] = self._failure("skipped", 0.0)
+                    continue
+                result = self.run(code, cases[index], timeout=timeout, expect=expects[index] if expects else None)
+                results[index] = result
+                if stop_on_failure and check is not None and not check(index, result):
+                    failed.set()
+
+        threads = [threading.Thread(target=run_pending, daemon=True)
+                   for _ in range(min(max_parallel or self.size, self.size, len(cases)) - 1)]
+        for thread in threads:
+            thread.start()
+        # 呼叫端的執行緒也負責一部分案例
+        run_pending()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self) -> None:
+        """終止所有閒置的工作行程；執行中的工作結束後也會被終止"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.kill()
+            with self._lock:
+                self._live -= 1
+
+
+if __name__ == "__main__" and len(sys.argv) == 6 and sys.argv[1] == "--worker":
+    worker_main(int(sys.argv[2]), int(sys.argv[3]), json.loads(sys.argv[4]), sys.argv[5])
@@ -103,6 +103,9 @@ document.addEventListener('DOMContentLoaded', () => {
     let executionMode = 'pyodide'; // pyodide | server
     let realtimeGuide = null; // Realtime guide system
     let smartGuide = null; // Smart guide system for stuck students
+    const CATALOG_FIELDS = 'id,title'; // Fields the sidebar reads; matches the catalog view prebuilt by payload_cache.py
+    let lessonEtags = new Map(); // lesson id -> ETag of the full lesson held in lessons[]
+    let lessonLoadToken = 0; // Only the most recent loadLesson() call updates the page
 
     // --- Loading Overlay Management ---
     const loadingStatus = document.getElementById('loading-status');
@@ -1418,7 +1421,8 @@ builtins.input = _fallback_input
     async function initializeApp() {
         try {
             showLoading('正在載入課程內容...');
-            const lessonsResponse = await fetch('/api/lessons');
+            // The sidebar only needs the catalog; each lesson body is fetched when it is opened
+            const lessonsResponse = await fetch(`/api/lessons?fields=${CATALOG_FIELDS}`);
 
             if (!lessonsResponse.ok) {
                 const errorData = await lessonsResponse.json().catch(() => ({}));
@@ -1532,9 +1536,43 @@ builtins.input = _fallback_input
     }
 
     // --- Lesson Loading ---
-    function loadLesson(index) {
+    async function fetchLessonBody(index) {
+        // Revalidate with the stored ETag: an unchanged lesson costs a 304 without a body
+        const entry = lessons[index];
+        const headers = {};
+        const etag = lessonEtags.get(entry.id);
+        if (etag) headers['If-None-Match'] = etag;
+
+        const response = await fetch(`/api/lessons/${encodeURIComponent(entry.id)}`, { headers });
+        if (response.status === 304 && etag) {
+            return entry;
+        }
+        if (!response.ok) {
+            throw new Error(`載入課程失敗（狀態碼：${response.status}）`);
+        }
+        const lesson = await response.json();
+        // Replace the catalog entry so every lessons[index] reader sees the full lesson
+        lessons[index] = lesson;
+        lessonEtags.set(lesson.id, response.headers.get('ETag'));
+        return lesson;
+    }
+
+    async function loadLesson(index) {
         if (index < 0 || index >= lessons.length) return;
 
+        const token = ++lessonLoadToken;
+        try {
+            await fetchLessonBody(index);
+        } catch (error) {
+            if (!lessonEtags.has(lessons[index].id)) {
+                if (token === lessonLoadToken) showError(error.message);
+                return;
+            }
+            // Offline: keep using the copy that was loaded earlier
+            console.warn('[LESSON] Revalidation failed, using the loaded copy:', error);
+        }
+        if (token !== lessonLoadToken) return; // A later click already replaced this one
+
         const previousLesson = lessons[currentLessonIndex];
         if (previousLesson && previousLesson.id && index !== currentLessonIndex && codeEditor) {
             saveDraftForLesson(previousLesson.id, codeEditor.value);
@@ -2230,6 +2268,28 @@ sys.stderr = _original_stderr
         }
     }
 
+    async function gradeOnServer(code, lesson, executionResult) {
+        try {
+            const response = await fetch('/api/grade', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    code,
+                    lesson_id: lesson?.id || '',
+                    stdout: executionResult.stdout,
+                    stderr: executionResult.stderr
+                })
+            });
+            if (!response.ok) {
+                return null;
+            }
+            const data = await response.json();
+            return { is_correct: Boolean(data.is_correct), message: data.message || '執行完成。' };
+        } catch (error) {
+            return null;
+        }
+    }
+
     // --- Code Execution ---
     let executionStartTime = 0;
 
@@ -2313,81 +2373,17 @@ sys.stderr = _original_stderr
                     // Execute code with Pyodide
                     const executionResult = await executeCodeWithPyodide(code);
 
-                    // Validate against lesson with improved validator support
-                    let is_correct = false;
-                    let message = "執行完成。";
-
-                    if (executionResult.stderr) {
-                        is_correct = false;
-                        message = "❌ 程式執行時發生錯誤。";
-                    } else {
-                        if (lesson && 'validator' in lesson) {
-                            const validator = lesson['validator'];
-                            const validatorType = validator?.type || 'none';
-                            const expected_output = (validator?.expected_output || "").trim();
-                            const actual_output = executionResult.stdout.trim();
-
-                            switch (validatorType) {
-                                case "stdout_equals":
-                                    if (actual_output === expected_output) {
-                                        is_correct = true;
-                                        message = "✅ 恭喜！輸出結果完全符合題目要求！";
-                                    } else {
-                                        is_correct = false;
-                                        message = `🤔 程式可以執行，但輸出結果不符.\n\n預期輸出：\n---\n${expected_output}\n---\n\n你的輸出：\n---\n${actual_output}\n---`;
-                                    }
-                                    break;
-                                case "stdout_contains":
-                                    if (actual_output.includes(expected_output)) {
-                                        is_correct = true;
-                                        message = "✅ 恭喜！輸出包含預期的內容！";
-                                    } else {
-                                        is_correct = false;
-                                        message = `🤔 程式可以執行，但輸出未包含預期內容.\n\n預期包含：\n---\n${expected_output}\n---\n\n你的輸出：\n---\n${actual_output}\n---`;
-                                    }
-                                    break;
-                                case "stdout_ends_with":
-                                    if (actual_output.endsWith(expected_output)) {
-                                        is_correct = true;
-                                        message = "✅ 恭喜！輸出結尾符合題目要求！";
-                                    } else {
-                                        is_correct = false;
-                                        message = `🤔 程式可以執行，但輸出結尾不符.\n\n預期結尾：\n---\n${expected_output}\n---\n\n你的輸出結尾：\n---\n${actual_output.slice(-expected_output.length - 20)}\n---`;
-                                    }
-                                    break;
-                                case "stdout_starts_with":
-                                    if (actual_output.startsWith(expected_output)) {
-                                        is_correct = true;
-                                        message = "✅ 恭喜！輸出開頭符合題目要求！";
-                                    } else {
-                                        is_correct = false;
-                                        message = `🤔 程式可以執行，但輸出開頭不符.\n\n預期開頭：\n---\n${expected_output}\n---\n\n你的輸出開頭：\n---\n${actual_output.slice(0, expected_output.length + 20)}\n---`;
-                                    }
-                                    break;
-                                case "no_error":
-                                    // Just check that there's no error
-                                    is_correct = true;
-                                    message = "✅ 程式執行成功，沒有錯誤。";
-                                    break;
-                                default:
-                                    // No specific validator type, so just running without error is enough
-                                    is_correct = true;
-                                    message = "✅ 程式執行成功，沒有錯誤。";
-                            }
-                        } else {
-                            // No lesson or validator found, so any error-free run is "correct"
-                            is_correct = true;
-                            message = "✅ 程式執行成功，沒有錯誤。";
-                        }
-                    }
+                    // Grade on the server with the lesson's precompiled validator
+                    const grade = await gradeOnServer(code, lesson, executionResult);
 
                     const executionTime = executionStartTime > 0 ? Date.now() - executionStartTime : 0;
 
                     result = {
-                        is_correct: is_correct,
+                        is_correct: grade ? grade.is_correct : false,
+                        graded: Boolean(grade),
                         stdout: executionResult.stdout,
                         stderr: executionResult.stderr,
-                        message: message,
+                        message: grade ? grade.message : '⚠️ 暫時無法評分：程式已執行，但無法連線到評分伺服器，請稍後再試一次。',
                         execution_time: executionTime
                     };
                 }
@@ -2397,8 +2393,10 @@ sys.stderr = _original_stderr
                 result.execution_time = Date.now() - executionStartTime;
             }
 
-            // Update learning statistics
-            updateLearningStats(lesson.id, result.is_correct, result.execution_time || 0, result.stderr ? true : false);
+            // Update learning statistics (an ungraded run is neither right nor wrong)
+            if (result.graded !== false) {
+                updateLearningStats(lesson.id, result.is_correct, result.execution_time || 0, result.stderr ? true : false);
+            }
 
             // Mark lesson as completed if correct
             if (result.is_correct && lesson) {
@@ -2516,7 +2514,11 @@ sys.stderr = _original_stderr
         outputConsole.textContent = output || '(沒有任何輸出)';
 
         outputConsole.className = '';
-        if (result.is_correct) {
+        if (result.graded === false) {
+            outputConsole.classList.add('ungraded');
+            if (compareOutput) compareOutput.style.display = 'none';
+            if (outputComparison) outputComparison.style.display = 'none';
+        } else if (result.is_correct) {
             outputConsole.classList.add('correct');
             if (compareOutput) compareOutput.style.display = 'none';
             if (outputComparison) outputComparison.style.display = 'none';